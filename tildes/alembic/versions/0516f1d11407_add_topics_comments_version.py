@@ -0,0 +1,108 @@
+"""Add topics.comments_version
+
+Revision ID: 0516f1d11407
+Revises: 55f4c1f951d5
+Create Date: 2021-08-02 21:14:07.461208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0516f1d11407"
+down_revision = "55f4c1f951d5"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "topics",
+        sa.Column("comments_version", sa.Integer(), server_default="0", nullable=False),
+    )
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION increment_topics_comments_version() RETURNS TRIGGER AS $$
+        BEGIN
+            IF (TG_OP = 'DELETE') THEN
+                UPDATE topics
+                    SET comments_version = comments_version + 1
+                    WHERE topic_id = OLD.topic_id;
+            ELSE
+                UPDATE topics
+                    SET comments_version = comments_version + 1
+                    WHERE topic_id = NEW.topic_id;
+            END IF;
+
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER increment_topics_comments_version_insert_delete
+            AFTER INSERT OR DELETE ON comments
+            FOR EACH ROW
+            EXECUTE PROCEDURE increment_topics_comments_version();
+    """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER increment_topics_comments_version_update
+            AFTER UPDATE ON comments
+            FOR EACH ROW
+            WHEN ((OLD.is_deleted IS DISTINCT FROM NEW.is_deleted)
+                OR (OLD.is_removed IS DISTINCT FROM NEW.is_removed))
+            EXECUTE PROCEDURE increment_topics_comments_version();
+    """
+    )
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION increment_topics_comments_version_from_label() RETURNS TRIGGER AS $$
+        DECLARE
+            affected_comment_id BIGINT;
+        BEGIN
+            IF (TG_OP = 'DELETE') THEN
+                affected_comment_id := OLD.comment_id;
+            ELSE
+                affected_comment_id := NEW.comment_id;
+            END IF;
+
+            UPDATE topics
+                SET comments_version = comments_version + 1
+                WHERE topic_id = (
+                    SELECT topic_id FROM comments WHERE comment_id = affected_comment_id
+                );
+
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER increment_topics_comments_version_insert_delete
+            AFTER INSERT OR DELETE ON comment_labels
+            FOR EACH ROW
+            EXECUTE PROCEDURE increment_topics_comments_version_from_label();
+    """
+    )
+
+
+def downgrade():
+    op.execute(
+        "DROP TRIGGER increment_topics_comments_version_insert_delete ON comment_labels"
+    )
+    op.execute("DROP FUNCTION increment_topics_comments_version_from_label")
+
+    op.execute("DROP TRIGGER increment_topics_comments_version_update ON comments")
+    op.execute(
+        "DROP TRIGGER increment_topics_comments_version_insert_delete ON comments"
+    )
+    op.execute("DROP FUNCTION increment_topics_comments_version")
+
+    op.drop_column("topics", "comments_version")
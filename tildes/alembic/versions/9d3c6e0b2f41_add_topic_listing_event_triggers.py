@@ -0,0 +1,51 @@
+"""Add topic event triggers for the listing index
+
+Revision ID: 9d3c6e0b2f41
+Revises: 0516f1d11407
+Create Date: 2021-08-16 18:42:10.512306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "9d3c6e0b2f41"
+down_revision = "0516f1d11407"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+        create trigger topics_events_update_group_id
+            after update of group_id on topics
+            for each row
+            execute function topics_events_trigger('group_id');
+
+        create trigger topics_events_update_is_deleted
+            after update of is_deleted on topics
+            for each row
+            execute function topics_events_trigger('is_deleted');
+
+        create trigger topics_events_update_is_removed
+            after update of is_removed on topics
+            for each row
+            execute function topics_events_trigger('is_removed');
+
+        create trigger topics_events_update_last_interesting_activity_time
+            after update of last_interesting_activity_time on topics
+            for each row
+            execute function topics_events_trigger('last_interesting_activity_time');
+    """
+    )
+
+
+def downgrade():
+    op.execute("drop trigger topics_events_update_group_id on topics")
+    op.execute("drop trigger topics_events_update_is_deleted on topics")
+    op.execute("drop trigger topics_events_update_is_removed on topics")
+    op.execute(
+        "drop trigger topics_events_update_last_interesting_activity_time on topics"
+    )
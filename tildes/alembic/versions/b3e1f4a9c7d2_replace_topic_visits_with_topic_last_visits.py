@@ -0,0 +1,273 @@
+"""Replace topic_visits with topic_last_visits
+
+Revision ID: b3e1f4a9c7d2
+Revises: 9d3c6e0b2f41
+Create Date: 2021-08-20 17:05:31.284193
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b3e1f4a9c7d2"
+down_revision = "9d3c6e0b2f41"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "topic_last_visits",
+        sa.Column("user_id", sa.BigInteger(), nullable=False),
+        sa.Column("topic_id", sa.BigInteger(), nullable=False),
+        sa.Column(
+            "visit_time",
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text("NOW()"),
+            nullable=False,
+        ),
+        sa.Column("num_comments", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["topic_id"],
+            ["topics.topic_id"],
+            name=op.f("fk_topic_last_visits_topic_id_topics"),
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["users.user_id"],
+            name=op.f("fk_topic_last_visits_user_id_users"),
+        ),
+        sa.PrimaryKeyConstraint(
+            "user_id", "topic_id", name=op.f("pk_topic_last_visits")
+        ),
+    )
+    op.create_index(
+        op.f("ix_topic_last_visits_visit_time"),
+        "topic_last_visits",
+        ["visit_time"],
+        unique=False,
+    )
+
+    # keep only the latest visit to each topic
+    op.execute(
+        """
+        INSERT INTO topic_last_visits (user_id, topic_id, visit_time, num_comments)
+        SELECT DISTINCT ON (user_id, topic_id)
+            user_id, topic_id, visit_time, num_comments
+        FROM topic_visits
+        ORDER BY user_id, topic_id, visit_time DESC
+    """
+    )
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION increment_user_topic_visit_num_comments() RETURNS TRIGGER AS $$
+        BEGIN
+            UPDATE topic_last_visits
+                SET num_comments = num_comments + 1
+                WHERE user_id = NEW.user_id
+                    AND topic_id = NEW.topic_id;
+
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """
+    )
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION update_all_topic_visit_num_comments() RETURNS TRIGGER AS $$
+        DECLARE
+            old_visible BOOLEAN := NOT (OLD.is_deleted OR OLD.is_removed);
+            new_visible BOOLEAN := NOT (NEW.is_deleted OR NEW.is_removed);
+        BEGIN
+            IF (old_visible AND NOT new_visible) THEN
+                UPDATE topic_last_visits
+                    SET num_comments = num_comments - 1
+                    WHERE topic_id = OLD.topic_id AND
+                        visit_time > OLD.created_time;
+            ELSIF (NOT old_visible AND new_visible) THEN
+                UPDATE topic_last_visits
+                    SET num_comments = num_comments + 1
+                    WHERE topic_id = OLD.topic_id AND
+                        visit_time > OLD.created_time;
+            END IF;
+
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """
+    )
+
+    op.execute(
+        """
+        create or replace function update_last_topic_visit_num_comments() returns trigger as $$
+        declare
+            comment comments%rowtype;
+        begin
+            select * INTO comment from comments where comment_id = NEW.comment_id;
+
+            -- if marking a notification as read, increment the comment count on the user's
+            -- last visit to the topic as long as it was before the comment was posted
+            if (OLD.is_unread = true and NEW.is_unread = false) then
+                update topic_last_visits
+                    set num_comments = num_comments + 1
+                    where topic_id = comment.topic_id
+                        and user_id = NEW.user_id
+                        and visit_time < comment.created_time;
+            end if;
+
+            return null;
+        end
+        $$ language plpgsql;
+    """
+    )
+
+    # repeat visits are now ignored by the upsert itself
+    op.execute("drop trigger prevent_recent_repeat_visits_insert on topic_visits")
+    op.execute("drop function prevent_recent_repeat_visits")
+
+    op.drop_table("topic_visits")
+
+
+def downgrade():
+    op.create_table(
+        "topic_visits",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("topic_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "visit_time",
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text("NOW()"),
+            nullable=False,
+        ),
+        sa.Column("num_comments", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["topic_id"],
+            ["topics.topic_id"],
+            name=op.f("fk_topic_visits_topic_id_topics"),
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_id"], ["users.user_id"], name=op.f("fk_topic_visits_user_id_users")
+        ),
+        sa.PrimaryKeyConstraint(
+            "user_id", "topic_id", "visit_time", name=op.f("pk_topic_visits")
+        ),
+    )
+
+    op.execute(
+        """
+        INSERT INTO topic_visits (user_id, topic_id, visit_time, num_comments)
+        SELECT user_id, topic_id, visit_time, num_comments
+        FROM topic_last_visits
+    """
+    )
+
+    op.execute(
+        """
+        create or replace function prevent_recent_repeat_visits() returns trigger as $$
+        begin
+            perform * from topic_visits
+                where user_id = NEW.user_id
+                    and topic_id = NEW.topic_id
+                    and visit_time >= now() - interval '30 seconds';
+
+            if (FOUND) then
+                return null;
+            else
+                return NEW;
+            end if;
+        end;
+        $$ language plpgsql;
+    """
+    )
+    op.execute(
+        """
+        create trigger prevent_recent_repeat_visits_insert
+            before insert on topic_visits
+            for each row
+            execute procedure prevent_recent_repeat_visits();
+    """
+    )
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION increment_user_topic_visit_num_comments() RETURNS TRIGGER AS $$
+        BEGIN
+            UPDATE topic_visits
+                SET num_comments = num_comments + 1
+                WHERE user_id = NEW.user_id
+                    AND topic_id = NEW.topic_id
+                    AND visit_time = (
+                        SELECT MAX(visit_time)
+                        FROM topic_visits
+                        WHERE topic_id = NEW.topic_id
+                            AND user_id = NEW.user_id
+                    );
+
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """
+    )
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION update_all_topic_visit_num_comments() RETURNS TRIGGER AS $$
+        DECLARE
+            old_visible BOOLEAN := NOT (OLD.is_deleted OR OLD.is_removed);
+            new_visible BOOLEAN := NOT (NEW.is_deleted OR NEW.is_removed);
+        BEGIN
+            IF (old_visible AND NOT new_visible) THEN
+                UPDATE topic_visits
+                    SET num_comments = num_comments - 1
+                    WHERE topic_id = OLD.topic_id AND
+                        visit_time > OLD.created_time;
+            ELSIF (NOT old_visible AND new_visible) THEN
+                UPDATE topic_visits
+                    SET num_comments = num_comments + 1
+                    WHERE topic_id = OLD.topic_id AND
+                        visit_time > OLD.created_time;
+            END IF;
+
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """
+    )
+
+    op.execute(
+        """
+        create or replace function update_last_topic_visit_num_comments() returns trigger as $$
+        declare
+            comment comments%rowtype;
+        begin
+            select * INTO comment from comments where comment_id = NEW.comment_id;
+
+            -- if marking a notification as read, increment the comment count on the user's
+            -- last visit to the topic as long as it was before the comment was posted
+            if (OLD.is_unread = true and NEW.is_unread = false) then
+                update topic_visits
+                    set num_comments = num_comments + 1
+                    where topic_id = comment.topic_id
+                        and user_id = NEW.user_id
+                        and visit_time < comment.created_time
+                        and visit_time = (
+                            select max(visit_time)
+                            from topic_visits
+                            where topic_id = comment.topic_id
+                                and user_id = NEW.user_id
+                        );
+            end if;
+
+            return null;
+        end
+        $$ language plpgsql;
+    """
+    )
+
+    op.drop_index(
+        op.f("ix_topic_last_visits_visit_time"), table_name="topic_last_visits"
+    )
+    op.drop_table("topic_last_visits")
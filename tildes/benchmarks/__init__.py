@@ -0,0 +1 @@
+"""Contains standalone benchmarks for performance-sensitive code."""
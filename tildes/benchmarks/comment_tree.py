@@ -0,0 +1,255 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+"""Benchmark suite for building, sorting and collapsing comment trees.
+
+Generates synthetic threads in a number of different shapes (see synthetic_threads.py)
+and times each of the CommentTree operations that happen when a topic page is viewed,
+as well as the full recalculation done by the topic_interesting_activity_updater
+consumer. No database is needed.
+
+Run with: python -m benchmarks.comment_tree
+
+Results can be saved as JSON with --output, and a previous set of results can be
+passed with --compare to show the change for each operation, for example:
+
+    git checkout master
+    python -m benchmarks.comment_tree --output /tmp/before.json
+    git checkout my-branch
+    python -m benchmarks.comment_tree --compare /tmp/before.json
+"""
+
+import json
+import platform
+import subprocess
+import sys
+from argparse import ArgumentParser
+from collections.abc import Callable
+from statistics import median
+from time import perf_counter
+from typing import Any, Optional
+
+from benchmarks.synthetic_threads import generate_thread, THREAD_GENERATORS
+from consumers.topic_interesting_activity_updater import (
+    TopicInterestingActivityUpdater,
+)
+from tildes.enums import CommentTreeSortOption
+from tildes.models.comment import Comment, CommentTree
+
+
+RESULTS_FORMAT_VERSION = 1
+
+
+def _time_operation(
+    setup: Callable[[], Any], operation: Callable[[Any], Any], num_runs: int
+) -> list[float]:
+    """Time an operation, returning the number of milliseconds for each run.
+
+    The setup function is called (untimed) before every run, and its return value is
+    passed to the operation. This allows timing operations that modify their input.
+    """
+    timings = []
+
+    for _ in range(num_runs):
+        data = setup()
+
+        start_time = perf_counter()
+        operation(data)
+        timings.append((perf_counter() - start_time) * 1000)
+
+    return timings
+
+
+def _update_interesting_activity(comments: list[Comment]) -> None:
+    """Do the same work as TopicInterestingActivityUpdater._update_topic()."""
+    # the method used doesn't need any of the consumer's state (like the database
+    # session or redis connection), so __init__ can be skipped entirely
+    updater = TopicInterestingActivityUpdater.__new__(TopicInterestingActivityUpdater)
+
+    tree = CommentTree(comments, CommentTreeSortOption.NEWEST)
+    for comment in tree:
+        updater._find_last_interesting_time(comment)
+
+
+def benchmark_thread(comments: list[Comment], num_runs: int) -> dict[str, list[float]]:
+    """Run all the benchmarks on a single thread, returning the timings by operation."""
+    timings = {}
+
+    def no_setup() -> None:
+        """Don't do any setup (for operations that don't modify anything)."""
+        return None
+
+    def build_tree() -> CommentTree:
+        """Build a new tree with the default sort."""
+        return CommentTree(comments, CommentTreeSortOption.RELEVANCE)
+
+    for sort in CommentTreeSortOption:
+        timings[f"build.{sort.name.lower()}"] = _time_operation(
+            no_setup, lambda _, sort=sort: CommentTree(comments, sort), num_runs
+        )
+
+    snapshot = build_tree().get_snapshot()
+
+    timings["snapshot.get"] = _time_operation(
+        build_tree, lambda tree: tree.get_snapshot(), num_runs
+    )
+    timings["snapshot.load"] = _time_operation(
+        no_setup,
+        lambda _: CommentTree(
+            comments, CommentTreeSortOption.RELEVANCE, snapshot=snapshot
+        ),
+        num_runs,
+    )
+
+    # treat comments as new if they were posted after half the thread was
+    threshold = comments[len(comments) // 2].created_time
+
+    def build_tree_with_labels_collapsed() -> CommentTree:
+        """Build a new tree and do the first step of collapsing."""
+        tree = build_tree()
+        tree.collapse_from_labels()
+        return tree
+
+    def build_tree_with_new_uncollapsed() -> CommentTree:
+        """Build a new tree and do the first two steps of collapsing."""
+        tree = build_tree_with_labels_collapsed()
+        tree.uncollapse_new_comments(threshold)
+        return tree
+
+    timings["collapse_from_labels"] = _time_operation(
+        build_tree, lambda tree: tree.collapse_from_labels(), num_runs
+    )
+    timings["uncollapse_new_comments"] = _time_operation(
+        build_tree_with_labels_collapsed,
+        lambda tree: tree.uncollapse_new_comments(threshold),
+        num_runs,
+    )
+    timings["finalize_collapsing_maximized"] = _time_operation(
+        build_tree_with_new_uncollapsed,
+        lambda tree: tree.finalize_collapsing_maximized(),
+        num_runs,
+    )
+
+    timings["interesting_activity.full_update"] = _time_operation(
+        no_setup, lambda _: _update_interesting_activity(comments), num_runs
+    )
+
+    return timings
+
+
+def _get_git_commit() -> Optional[str]:
+    """Return the (short) hash of the current git commit, if possible."""
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return result.stdout.strip()
+
+
+def run_benchmarks(shapes: list[str], num_comments: int, num_runs: int) -> dict:
+    """Run the benchmarks for all the thread shapes and return the results."""
+    results = []
+
+    for shape in shapes:
+        comments = generate_thread(shape, num_comments)
+
+        for operation, timings in benchmark_thread(comments, num_runs).items():
+            results.append(
+                {
+                    "thread": shape,
+                    "operation": operation,
+                    "min_ms": round(min(timings), 3),
+                    "median_ms": round(median(timings), 3),
+                    "max_ms": round(max(timings), 3),
+                }
+            )
+
+    return {
+        "version": RESULTS_FORMAT_VERSION,
+        "git_commit": _get_git_commit(),
+        "python_version": platform.python_version(),
+        "num_comments": num_comments,
+        "num_runs": num_runs,
+        "results": results,
+    }
+
+
+def print_results(results: dict, previous: Optional[dict] = None) -> None:
+    """Print the results as a table, compared to previous results if provided."""
+    # compare using the fastest run, since it's the least affected by other activity on
+    # the machine (the median and slowest are still included in the saved results)
+    previous_times = {}
+    if previous:
+        previous_times = {
+            (result["thread"], result["operation"]): result["min_ms"]
+            for result in previous["results"]
+        }
+
+    print(
+        f"{results['num_comments']} comments per thread, "
+        f"best of {results['num_runs']} runs (commit {results['git_commit']})"
+    )
+
+    current_thread = None
+    for result in results["results"]:
+        if result["thread"] != current_thread:
+            current_thread = result["thread"]
+            print(f"{current_thread}:")
+
+        line = f"  {result['operation']:<34} {result['min_ms']:>10.2f} ms"
+
+        previous_time = previous_times.get((result["thread"], result["operation"]))
+        if previous_time:
+            change = (result["min_ms"] - previous_time) / previous_time
+            line += f"  ({change:+.0%} from {previous_time:.2f} ms)"
+
+        print(line)
+
+
+def main() -> None:
+    """Parse the command-line arguments and run the benchmarks."""
+    parser = ArgumentParser(description="Run the comment tree benchmarks.")
+    parser.add_argument(
+        "--threads",
+        nargs="+",
+        choices=THREAD_GENERATORS.keys(),
+        default=list(THREAD_GENERATORS.keys()),
+        help="thread shapes to run the benchmarks on (default: all)",
+    )
+    parser.add_argument("--num-comments", type=int, default=10_000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="file to save the results to (as JSON)")
+    parser.add_argument("--compare", help="previous results file to compare to")
+    parser.add_argument(
+        "--json", action="store_true", help="print the results as JSON instead"
+    )
+    args = parser.parse_args()
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as previous_file:
+            previous = json.load(previous_file)
+
+        if previous.get("version") != RESULTS_FORMAT_VERSION:
+            sys.exit("Can't compare to results in a different format version")
+
+    results = run_benchmarks(args.threads, args.num_comments, args.runs)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results, previous)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+"""Micro-benchmark for the cmark parsing step of markdown processing.
+
+Compares creating a new parser (and looking up and attaching all the extensions) for
+every document, which is what used to happen on every call, against re-using the
+thread's parser. Uses a corpus of typical short comments, where this fixed overhead is
+the largest part of the parsing time. The full processing (without caching) is also
+timed, to show how much of the overall time the parsing step is.
+
+Run with: python -m benchmarks.markdown_parsing
+"""
+
+from collections.abc import Callable
+from timeit import timeit
+
+from tildes.lib.cmark import (
+    CMARK_EXTENSIONS,
+    cmark_find_syntax_extension,
+    cmark_node_free,
+    CMARK_OPTS,
+    cmark_parser_attach_syntax_extension,
+    cmark_parser_feed,
+    cmark_parser_finish,
+    cmark_parser_free,
+    cmark_parser_get_syntax_extensions,
+    cmark_parser_new,
+    cmark_render_html,
+    render_markdown_to_html,
+)
+from tildes.lib.markdown import render_markdown_uncached
+
+
+CORPUS = (
+    "Thanks, that's really helpful!",
+    "I agree with this.",
+    "Does anyone know if there's a transcript available?",
+    "This is *exactly* what I was thinking when I read the headline.",
+    "> the results were inconclusive\n\nThat's not what the paper says at all.",
+    "I've been using it for about a year now, and it's been great. The only issue "
+    "I've had is with the battery life, which isn't quite what they advertised.",
+    "There's a good write-up about this here: https://example.com/some/article",
+    "Some options:\n\n* Option one\n* Option two\n* Option three",
+    "@someone might know more about this, they posted about it in ~tech last week.",
+    "Use `git rebase -i` for that.",
+    "**Edit:** fixed a typo.",
+    "1. First do this\n2. Then this\n3. Done",
+    "Wow.",
+    "I'm not sure ~~that's right~~ that's quite right, but it's close.",
+)
+
+NUM_RUNS = 200
+
+
+def _render_with_new_parser(markdown_bytes: bytes) -> bytes:
+    """Parse and render markdown the old way, setting up a new parser every time."""
+    parser = cmark_parser_new(CMARK_OPTS)
+    for name in CMARK_EXTENSIONS:
+        extension = cmark_find_syntax_extension(name)
+        cmark_parser_attach_syntax_extension(parser, extension)
+    extensions = cmark_parser_get_syntax_extensions(parser)
+
+    cmark_parser_feed(parser, markdown_bytes, len(markdown_bytes))
+    doc = cmark_parser_finish(parser)
+
+    html_bytes = cmark_render_html(doc, CMARK_OPTS, extensions)
+
+    cmark_parser_free(parser)
+    cmark_node_free(doc)
+
+    return html_bytes
+
+
+def run_benchmark() -> None:
+    """Run the benchmark and print the results."""
+    corpus_bytes = [markdown.encode("utf8") for markdown in CORPUS]
+
+    # make sure the two methods actually give the same results before timing them
+    for markdown_bytes in corpus_bytes:
+        if _render_with_new_parser(markdown_bytes) != render_markdown_to_html(
+            markdown_bytes
+        ):
+            raise AssertionError(f"Different results for {markdown_bytes!r}")
+
+    def render_corpus(render_function: Callable[[bytes], bytes]) -> None:
+        """Render every document in the corpus with a function."""
+        for markdown_bytes in corpus_bytes:
+            render_function(markdown_bytes)
+
+    new_parser_seconds = timeit(
+        lambda: render_corpus(_render_with_new_parser), number=NUM_RUNS
+    )
+    reused_parser_seconds = timeit(
+        lambda: render_corpus(render_markdown_to_html), number=NUM_RUNS
+    )
+    full_seconds = timeit(
+        lambda: [render_markdown_uncached(markdown).html for markdown in CORPUS],
+        number=NUM_RUNS,
+    )
+
+    microseconds_per_doc = 1e6 / (NUM_RUNS * len(CORPUS))
+
+    print(f"Average per document ({NUM_RUNS * len(CORPUS)} short comments):")
+    print(f"  cmark, new parser:    {new_parser_seconds * microseconds_per_doc:.2f} µs")
+    print(
+        f"  cmark, reused parser: {reused_parser_seconds * microseconds_per_doc:.2f} µs"
+    )
+    print(f"  full processing:      {full_seconds * microseconds_per_doc:.2f} µs")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,85 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+"""Benchmark for loading and using the Public Suffix List.
+
+Compares the "cold start" of building the list from the raw PSL file (what had to
+happen on every consumer startup, after downloading it) against loading the parsed
+version from the on-disk cache, as well as the speed of repeated lookups.
+
+Run with: python -m benchmarks.public_suffix_list
+
+Uses the copy of the list included in the publicsuffix library, so it doesn't need any
+network access.
+"""
+
+from tempfile import TemporaryDirectory
+from timeit import timeit
+
+import publicsuffix
+
+from tildes.lib.datetime import utc_now
+from tildes.lib.public_suffix import (
+    build_suffix_trie,
+    PublicSuffixList,
+    PublicSuffixListLoader,
+)
+
+
+LOOKUP_DOMAINS = (
+    "example.com",
+    "www.example.com",
+    "news.bbc.co.uk",
+    "someone.github.io",
+    "a.deeply.nested.subdomain.example.org",
+    "www.city.kawasaki.jp",
+)
+
+NUM_LOADS = 10
+NUM_LOOKUPS = 10_000
+
+
+def run_benchmark() -> None:
+    """Run the benchmark and print the results."""
+    with open(publicsuffix.PSL_FILE, encoding="utf-8") as psl_file:
+        psl_lines = psl_file.readlines()
+
+    library_seconds = timeit(
+        lambda: publicsuffix.PublicSuffixList(psl_lines), number=NUM_LOADS
+    )
+    trie_seconds = timeit(lambda: build_suffix_trie(psl_lines), number=NUM_LOADS)
+
+    with TemporaryDirectory() as temp_dir:
+        cache_path = f"{temp_dir}/psl.json"
+        PublicSuffixListLoader(cache_path)._write_cache(
+            build_suffix_trie(psl_lines), utc_now()
+        )
+
+        cached_seconds = timeit(
+            lambda: PublicSuffixListLoader(cache_path).get_list(), number=NUM_LOADS
+        )
+
+    print(f"Cold start (average of {NUM_LOADS} loads, excluding download):")
+    print(f"  publicsuffix library parse: {library_seconds / NUM_LOADS * 1000:.2f} ms")
+    print(f"  suffix trie build:          {trie_seconds / NUM_LOADS * 1000:.2f} ms")
+    print(f"  load from on-disk cache:    {cached_seconds / NUM_LOADS * 1000:.2f} ms")
+
+    library_psl = publicsuffix.PublicSuffixList(psl_lines)
+    trie_psl = PublicSuffixList(build_suffix_trie(psl_lines))
+
+    def lookup_all(psl: PublicSuffixList) -> None:
+        for domain in LOOKUP_DOMAINS:
+            psl.get_public_suffix(domain)
+
+    num_calls = NUM_LOOKUPS // len(LOOKUP_DOMAINS)
+    library_seconds = timeit(lambda: lookup_all(library_psl), number=num_calls)
+    trie_seconds = timeit(lambda: lookup_all(trie_psl), number=num_calls)
+    num_lookups = num_calls * len(LOOKUP_DOMAINS)
+
+    print(f"Lookups (average of {num_lookups}):")
+    print(f"  publicsuffix library: {library_seconds / num_lookups * 1e6:.2f} µs")
+    print(f"  suffix trie:          {trie_seconds / num_lookups * 1e6:.2f} µs")
+
+
+if __name__ == "__main__":
+    run_benchmark()
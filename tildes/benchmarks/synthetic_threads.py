@@ -0,0 +1,178 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+"""Generators for synthetic comment threads with different "shapes".
+
+The comments are real (transient) Comment objects that are never added to a database
+session, so they can be used with CommentTree and related code without needing a
+database connection. They're created without going through Comment.__init__, so no
+markdown is rendered and no metrics are updated.
+
+All of the generators are deterministic for a given seed, so the same threads will be
+generated every time (which is necessary for comparing results between runs).
+"""
+
+from collections.abc import Callable
+from datetime import datetime, timedelta, timezone
+from random import Random
+from typing import Optional
+
+from sqlalchemy.orm import configure_mappers
+from sqlalchemy.orm.instrumentation import manager_of_class
+
+from tildes.enums import CommentLabelOption
+from tildes.models.comment import Comment, CommentLabel
+from tildes.models.user import User
+
+
+NUM_USERS = 500
+
+# the deep threads are made up of chains of replies this long
+DEEP_CHAIN_LENGTH = 2000
+
+START_TIME = datetime(2021, 1, 1, tzinfo=timezone.utc)
+
+
+def _make_user(user_id: int) -> User:
+    """Create a transient User without going through __init__ (no password hash)."""
+    user = manager_of_class(User).new_instance()
+    user.user_id = user_id
+    user.username = f"user{user_id}"
+
+    return user
+
+
+def _make_comment(
+    comment_id: int, parent: Optional[Comment], user: User, num_votes: int
+) -> Comment:
+    """Create a transient Comment without going through __init__ (no markdown)."""
+    comment = manager_of_class(Comment).new_instance()
+    comment.comment_id = comment_id
+    comment.parent_comment_id = parent.comment_id if parent else None
+    comment.created_time = START_TIME + timedelta(seconds=comment_id)
+    comment.is_deleted = False
+    comment.is_removed = False
+    comment.num_votes = num_votes
+    comment.user = user
+    comment.labels = []
+
+    return comment
+
+
+def _add_label(
+    comment: Comment, user: User, label: CommentLabelOption, weight: float
+) -> None:
+    """Add a transient CommentLabel to a comment."""
+    comment_label = manager_of_class(CommentLabel).new_instance()
+    comment_label.user_id = user.user_id
+    comment_label.label = label
+    comment_label.weight = weight
+
+    comment.labels.append(comment_label)
+
+
+def _random_votes(rng: Random) -> int:
+    """Return a random vote count, with the long tail that real comments have."""
+    return int(rng.paretovariate(1.5)) - 1
+
+
+def generate_wide_thread(num_comments: int, rng: Random) -> list[Comment]:
+    """Generate a thread with many top-level comments and shallow reply chains."""
+    users = [_make_user(user_id) for user_id in range(1, NUM_USERS + 1)]
+    comments: list[Comment] = []
+
+    for comment_id in range(1, num_comments + 1):
+        # about a third of comments are top-level, the rest reply to a recent comment
+        if not comments or rng.random() < 0.33:
+            parent = None
+        else:
+            parent = rng.choice(comments[-50:])
+
+        comments.append(
+            _make_comment(comment_id, parent, rng.choice(users), _random_votes(rng))
+        )
+
+    return comments
+
+
+def generate_deep_thread(num_comments: int, rng: Random) -> list[Comment]:
+    """Generate a thread made of long back-and-forth chains of replies."""
+    users = [_make_user(user_id) for user_id in range(1, NUM_USERS + 1)]
+    comments: list[Comment] = []
+
+    parent = None
+    for comment_id in range(1, num_comments + 1):
+        # start a new top-level chain periodically
+        if comment_id % DEEP_CHAIN_LENGTH == 1:
+            parent = None
+
+        comment = _make_comment(
+            comment_id, parent, rng.choice(users[:2]), _random_votes(rng)
+        )
+        comments.append(comment)
+        parent = comment
+
+    return comments
+
+
+def generate_mostly_deleted_thread(num_comments: int, rng: Random) -> list[Comment]:
+    """Generate a wide thread where most of the comments have been deleted."""
+    comments = generate_wide_thread(num_comments, rng)
+
+    for comment in comments:
+        if rng.random() < 0.8:
+            comment.is_deleted = True
+
+    return comments
+
+
+def generate_labeled_thread(num_comments: int, rng: Random) -> list[Comment]:
+    """Generate a wide thread where many of the comments have labels applied."""
+    comments = generate_wide_thread(num_comments, rng)
+    users = [_make_user(user_id) for user_id in range(1, NUM_USERS + 1)]
+    labels = list(CommentLabelOption)
+
+    for comment in comments:
+        if rng.random() < 0.4:
+            for _ in range(rng.randint(1, 4)):
+                _add_label(
+                    comment, rng.choice(users), rng.choice(labels), rng.random() * 1.5
+                )
+
+    return comments
+
+
+def generate_removed_chains_thread(num_comments: int, rng: Random) -> list[Comment]:
+    """Generate a wide thread where some entire branches have been removed."""
+    comments = generate_wide_thread(num_comments, rng)
+    comments_by_id = {comment.comment_id: comment for comment in comments}
+
+    # remove about 10% of top-level branches entirely, and scattered other comments
+    for comment in comments:
+        if comment.parent_comment_id:
+            parent = comments_by_id[comment.parent_comment_id]
+            if parent.is_removed and rng.random() < 0.9:
+                comment.is_removed = True
+        elif rng.random() < 0.1:
+            comment.is_removed = True
+
+        if rng.random() < 0.02:
+            comment.is_removed = True
+
+    return comments
+
+
+THREAD_GENERATORS: dict[str, Callable[[int, Random], list[Comment]]] = {
+    "wide": generate_wide_thread,
+    "deep": generate_deep_thread,
+    "mostly_deleted": generate_mostly_deleted_thread,
+    "labeled": generate_labeled_thread,
+    "removed_chains": generate_removed_chains_thread,
+}
+
+
+def generate_thread(shape: str, num_comments: int, seed: int = 0) -> list[Comment]:
+    """Generate a synthetic thread of the specified shape (see THREAD_GENERATORS)."""
+    configure_mappers()
+
+    return THREAD_GENERATORS[shape](num_comments, Random(seed))
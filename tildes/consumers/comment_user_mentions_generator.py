@@ -12,6 +12,10 @@ class CommentUserMentionGenerator(EventStreamConsumer):
 
     METRICS_PORT = 25010
 
+    # comments tend to arrive in bursts, so process them in batches
+    BATCH_SIZE = 20
+    BATCH_MAX_WAIT_MS = 250
+
     def process_message(self, message: Message) -> None:
         """Process a message from the stream."""
         comment = (
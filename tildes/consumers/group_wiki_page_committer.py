@@ -0,0 +1,82 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+"""Consumer that commits group wiki page edits to the wiki repo."""
+
+from collections.abc import Sequence
+from time import time
+
+from prometheus_client import Histogram
+from pygit2 import Repository
+
+from tildes.lib.event_stream import EventStreamConsumer, Message
+from tildes.lib.git import commit_file_edits, GitFileEdit
+from tildes.models.group import GroupWikiPage
+
+
+class GroupWikiPageCommitter(EventStreamConsumer):
+    """Consumer that commits group wiki page edits to the wiki repo.
+
+    This is the only process that commits to the repo, so edits can never race with
+    each other. It must only be run with a single worker.
+    """
+
+    METRICS_PORT = 25017
+
+    # edits that arrive close together are committed together, with a single update of
+    # the repo's branch
+    BATCH_SIZE = 50
+    BATCH_MAX_WAIT_MS = 1000
+
+    def __init__(self, consumer_group: str, source_streams: Sequence[str]):
+        """Initialize the consumer, and open the wiki repo."""
+        super().__init__(consumer_group, source_streams, uses_db=False)
+
+        if self.worker_number > 1:
+            raise ValueError("Only a single worker can commit to the wiki repo")
+
+        self.repo = Repository(GroupWikiPage.BASE_PATH)
+
+    def _init_metrics(self) -> None:
+        """Initialize this consumer's metrics, including the commit latency."""
+        super()._init_metrics()
+
+        if not self.metrics:
+            return
+
+        self.metrics["commit_latency"] = Histogram(
+            f"{self._metrics_prefix}_commit_latency_seconds",
+            "Time from a wiki page being edited until the edit is committed",
+            buckets=[0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0],
+            registry=self.metrics_registry,
+        )
+
+    def process_messages(self, messages: list[Message]) -> None:
+        """Commit the edits from a batch of messages (in order)."""
+        edits = [
+            GitFileEdit(
+                file_path=message.fields["file_path"],
+                blob_id=message.fields["blob_id"],
+                author_name=message.fields["author_name"],
+                message=message.fields["message"],
+                edit_time=int(message.fields["edit_time"]),
+            )
+            for message in messages
+        ]
+
+        commit_file_edits(self.repo, edits)
+
+        if self.metrics:
+            now = time()
+            for edit in edits:
+                self.metrics["commit_latency"].observe(now - edit.edit_time)
+
+    def process_message(self, message: Message) -> None:
+        """Commit the edit from a single message."""
+        self.process_messages([message])
+
+
+if __name__ == "__main__":
+    GroupWikiPageCommitter(
+        "group_wiki_page_committer", source_streams=["group_wiki_pages.edit"]
+    ).consume_streams()
@@ -0,0 +1,86 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+"""Consumer that invalidates cached pages when topics or comments change."""
+
+from collections.abc import Sequence
+
+from tildes.lib.event_stream import EventStreamConsumer, Message
+from tildes.lib.page_cache import PageCache
+from tildes.models.comment import Comment
+
+
+class PageCacheInvalidator(EventStreamConsumer):
+    """Consumer that invalidates cached pages when topics or comments change.
+
+    Any change invalidates all cached listings, so this only needs to be done once for
+    each batch of events.
+
+    Comment events only include the comment's ID, so the topic has to be looked up from
+    the comment. That isn't possible for comments that have been deleted from the
+    database, so hard deletes of comments aren't handled at all, and pages showing them
+    will only be updated when they expire. The site itself never hard-deletes comments
+    (they're only marked as deleted or removed, which is handled), so this only affects
+    ones deleted manually.
+    """
+
+    METRICS_PORT = 25019
+
+    BATCH_SIZE = 100
+    BATCH_MAX_WAIT_MS = 1000
+
+    def __init__(self, consumer_group: str, source_streams: Sequence[str]):
+        """Initialize the consumer, and the page cache to invalidate."""
+        super().__init__(consumer_group, source_streams)
+
+        self.page_cache = PageCache(self.redis)
+
+    def process_messages(self, messages: list[Message]) -> None:
+        """Invalidate the pages for all the topics in a batch of messages."""
+        topic_ids = {
+            int(message.fields["topic_id"])
+            for message in messages
+            if "topic_id" in message.fields
+        }
+
+        comment_ids = {
+            int(message.fields["comment_id"])
+            for message in messages
+            if "comment_id" in message.fields
+        }
+
+        if comment_ids:
+            topic_ids.update(
+                topic_id
+                for (topic_id,) in (
+                    self.db_session.query(Comment.topic_id)
+                    .filter(Comment.comment_id.in_(comment_ids))  # type: ignore
+                    .distinct()
+                )
+            )
+
+        self.page_cache.invalidate_topics(topic_ids)
+
+    def process_message(self, message: Message) -> None:
+        """Invalidate the pages for the topic in a single message."""
+        self.process_messages([message])
+
+
+if __name__ == "__main__":
+    PageCacheInvalidator(
+        "page_cache_invalidator",
+        source_streams=[
+            "comments.insert",
+            "comments.update.is_deleted",
+            "comments.update.is_removed",
+            "comments.update.markdown",
+            "topics.insert",
+            "topics.delete",
+            "topics.update.group_id",
+            "topics.update.is_deleted",
+            "topics.update.is_removed",
+            "topics.update.last_interesting_activity_time",
+            "topics.update.link",
+            "topics.update.markdown",
+        ],
+    ).consume_streams()
@@ -3,22 +3,23 @@
 
 """Consumer that downloads site icons using Embedly scraper data."""
 
+import asyncio
 from collections.abc import Sequence
 from io import BytesIO
 from os import path
 from typing import Optional
 
-import publicsuffix
 import requests
 from PIL import Image
 
 from tildes.enums import ScraperType
-from tildes.lib.event_stream import EventStreamConsumer, Message
+from tildes.lib.event_stream import AsyncEventStreamConsumer, Message
+from tildes.lib.public_suffix import get_public_suffix_list
 from tildes.lib.url import get_domain_from_url
 from tildes.models.scraper import ScraperResult
 
 
-class SiteIconDownloader(EventStreamConsumer):
+class SiteIconDownloader(AsyncEventStreamConsumer):
     """Consumer that generates content_metadata for topics."""
 
     METRICS_PORT = 25011
@@ -29,11 +30,10 @@ class SiteIconDownloader(EventStreamConsumer):
         """Initialize the consumer, including the public suffix list."""
         super().__init__(consumer_group, source_streams)
 
-        # download the public suffix list (would be good to add caching here)
-        psl_file = publicsuffix.fetch()
-        self.public_suffix_list = publicsuffix.PublicSuffixList(psl_file)
+        # load the public suffix list (from the on-disk cache if possible)
+        self.public_suffix_list = get_public_suffix_list()
 
-    def process_message(self, message: Message) -> None:
+    async def process_message_async(self, message: Message) -> None:
         """Process a message from the stream."""
         result = (
             self.db_session.query(ScraperResult)
@@ -60,7 +60,7 @@ class SiteIconDownloader(EventStreamConsumer):
             return
 
         try:
-            response = requests.get(favicon_url, timeout=5)
+            response = await asyncio.to_thread(requests.get, favicon_url, timeout=5)
         except requests.exceptions.RequestException:
             return
 
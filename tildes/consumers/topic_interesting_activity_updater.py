@@ -3,12 +3,26 @@
 
 """Consumer that updates topics' last_interesting_activity_time."""
 
+from collections import defaultdict
 from datetime import datetime
 from typing import Optional
 
+from prometheus_client import Counter
+from sqlalchemy import literal
+from sqlalchemy.orm import aliased
+
 from tildes.enums import CommentTreeSortOption
 from tildes.lib.event_stream import EventStreamConsumer, Message
-from tildes.models.comment import Comment, CommentInTree, CommentTree
+from tildes.models.comment import Comment, CommentTree
+from tildes.models.topic import Topic
+
+
+# comments at this depth in a thread (or deeper) are never considered interesting
+MAX_INTERESTING_DEPTH = 5
+
+# if a comment has any of these labels active, neither it nor any of its replies are
+# considered interesting
+UNINTERESTING_LABELS = ("noise", "offtopic", "malice")
 
 
 class TopicInterestingActivityUpdater(EventStreamConsumer):
@@ -16,6 +30,25 @@ class TopicInterestingActivityUpdater(EventStreamConsumer):
 
     METRICS_PORT = 25013
 
+    # Busy topics can generate many events in a short period, and each one would cause
+    # the same full recalculation for the topic. Batching events up over a window lets
+    # process_messages() coalesce them and only update each topic once.
+    BATCH_SIZE = 100
+    BATCH_MAX_WAIT_MS = 5000
+
+    def _init_metrics(self) -> None:
+        """Initialize this consumer's metrics, including the coalescing counter."""
+        super()._init_metrics()
+
+        if not self.metrics:
+            return
+
+        self.metrics["coalesced_counter"] = Counter(
+            f"{self._metrics_prefix}_events_coalesced",
+            "Consumer Events Coalesced",
+            registry=self.metrics_registry,
+        )
+
     def process_message(self, message: Message) -> None:
         """Process a message from the stream."""
         trigger_comment = (
@@ -24,8 +57,61 @@ class TopicInterestingActivityUpdater(EventStreamConsumer):
             .one()
         )
 
-        topic = trigger_comment.topic
+        if message.stream == "comments.insert":
+            self._update_topic_for_new_comment(trigger_comment)
+        else:
+            self._update_topic(trigger_comment.topic)
+
+    def process_messages(self, messages: list[Message]) -> None:
+        """Process a batch of messages, updating each affected topic only once.
+
+        Topics that only had new comments posted in the batch are updated
+        incrementally from those comments, while any other type of event causes a
+        single full recalculation for the topic.
+        """
+        comment_ids = {int(message.fields["comment_id"]) for message in messages}
+
+        comments_by_id = {
+            comment.comment_id: comment
+            for comment in (
+                self.db_session.query(Comment)
+                .filter(Comment.comment_id.in_(comment_ids))  # type: ignore
+                .all()
+            )
+        }
+
+        full_update_topics: set[Topic] = set()
+        new_comments_by_topic: defaultdict[Topic, list[Comment]] = defaultdict(list)
+
+        for message in messages:
+            comment = comments_by_id[int(message.fields["comment_id"])]
 
+            if message.stream == "comments.insert":
+                new_comments_by_topic[comment.topic].append(comment)
+            else:
+                full_update_topics.add(comment.topic)
+
+        for topic in full_update_topics:
+            self._update_topic(topic)
+
+        num_updates = len(full_update_topics)
+
+        for topic, new_comments in new_comments_by_topic.items():
+            # a full update already covers any new comments
+            if topic in full_update_topics:
+                continue
+
+            for comment in new_comments:
+                self._update_topic_for_new_comment(comment)
+
+            num_updates += len(new_comments)
+
+        if self.metrics:
+            counter = self.metrics["coalesced_counter"]
+            counter.inc(len(messages) - num_updates)
+
+    def _update_topic(self, topic: Topic) -> None:
+        """Recalculate and update a topic's last_interesting_activity_time."""
         all_comments = self.db_session.query(Comment).filter_by(topic=topic).all()
 
         tree = CommentTree(all_comments, CommentTreeSortOption.NEWEST)
@@ -40,15 +126,77 @@ class TopicInterestingActivityUpdater(EventStreamConsumer):
 
         topic.last_interesting_activity_time = last_interesting_time
 
-    def _find_last_interesting_time(self, comment: CommentInTree) -> Optional[datetime]:
+    def _update_topic_for_new_comment(self, comment: Comment) -> None:
+        """Update a topic's last_interesting_activity_time for a newly-posted comment.
+
+        Posting a comment can't change whether any other comments are interesting, so
+        instead of rebuilding the whole tree, this only needs to check the new comment
+        and its chain of ancestors, and then possibly advance the topic's time.
+        """
+        topic = comment.topic
+
+        if comment.created_time <= topic.last_interesting_activity_time:
+            return
+
+        if comment.is_deleted or comment.is_removed:
+            return
+
+        comment_path = self._get_comment_with_ancestors(comment)
+
+        # the path will only be this long if the comment is too deep to be interesting
+        if len(comment_path) > MAX_INTERESTING_DEPTH:
+            return
+
+        for path_comment in comment_path:
+            if any(
+                path_comment.is_label_active(label) for label in UNINTERESTING_LABELS
+            ):
+                return
+
+        topic.last_interesting_activity_time = comment.created_time
+
+    def _get_comment_with_ancestors(self, comment: Comment) -> list[Comment]:
+        """Return a comment along with its ancestors, using a recursive CTE.
+
+        The ancestors are only followed up to one level past MAX_INTERESTING_DEPTH,
+        since anything further up doesn't matter once the comment is too deep.
+        """
+        ancestors = (
+            self.db_session.query(
+                Comment.comment_id,
+                Comment.parent_comment_id,
+                literal(0).label("distance"),
+            )
+            .filter(Comment.comment_id == comment.comment_id)
+            .cte(name="ancestors", recursive=True)
+        )
+
+        parent = aliased(Comment)
+        ancestors = ancestors.union_all(
+            self.db_session.query(
+                parent.comment_id,
+                parent.parent_comment_id,
+                ancestors.c.distance + 1,
+            ).filter(
+                parent.comment_id == ancestors.c.parent_comment_id,
+                ancestors.c.distance < MAX_INTERESTING_DEPTH,
+            )
+        )
+
+        return (
+            self.db_session.query(Comment)
+            .join(ancestors, Comment.comment_id == ancestors.c.comment_id)
+            .all()
+        )
+
+    def _find_last_interesting_time(self, comment: Comment) -> Optional[datetime]:
         """Recursively find the last "interesting" time from a comment and replies."""
         # stop considering comments interesting once they get too deep down a branch
-        if comment.depth >= 5:
+        if comment.depth >= MAX_INTERESTING_DEPTH:
             return None
 
         # if the comment has one of these labels, don't look any deeper down this branch
-        uninteresting_labels = ("noise", "offtopic", "malice")
-        if any(comment.is_label_active(label) for label in uninteresting_labels):
+        if any(comment.is_label_active(label) for label in UNINTERESTING_LABELS):
             return None
 
         # the comment itself isn't interesting if it's deleted or removed, but one of
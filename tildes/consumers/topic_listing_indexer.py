@@ -0,0 +1,57 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+"""Consumer that keeps the topic listing index up to date."""
+
+from collections.abc import Sequence
+
+from tildes.lib.event_stream import EventStreamConsumer, Message
+from tildes.models.topic import TopicListingIndex
+
+
+class TopicListingIndexer(EventStreamConsumer):
+    """Consumer that keeps the topic listing index up to date.
+
+    Every event re-reads the topic's current data from the database, so it doesn't
+    matter which type of event it was, or whether events are processed out of order.
+    """
+
+    METRICS_PORT = 25018
+
+    # the same topic often has multiple events close together (such as a new comment
+    # updating its activity time), so coalesce them in batches
+    BATCH_SIZE = 100
+    BATCH_MAX_WAIT_MS = 500
+
+    def __init__(self, consumer_group: str, source_streams: Sequence[str]):
+        """Initialize the consumer, and build the index if it hasn't been yet."""
+        super().__init__(consumer_group, source_streams)
+
+        self.index = TopicListingIndex(self.redis)
+
+        if not self.index.is_ready():
+            self.index.rebuild(self.db_session)
+
+    def process_messages(self, messages: list[Message]) -> None:
+        """Update the index for all the topics in a batch of messages."""
+        topic_ids = {int(message.fields["topic_id"]) for message in messages}
+
+        self.index.update_topics(self.db_session, topic_ids)
+
+    def process_message(self, message: Message) -> None:
+        """Update the index for the topic in a single message."""
+        self.process_messages([message])
+
+
+if __name__ == "__main__":
+    TopicListingIndexer(
+        "topic_listing_indexer",
+        source_streams=[
+            "topics.insert",
+            "topics.delete",
+            "topics.update.group_id",
+            "topics.update.is_deleted",
+            "topics.update.is_removed",
+            "topics.update.last_interesting_activity_time",
+        ],
+    ).consume_streams()
@@ -7,11 +7,11 @@ from collections.abc import Sequence
 from typing import Any
 from ipaddress import ip_address
 
-import publicsuffix
 from sqlalchemy import cast, func
 from sqlalchemy.dialects.postgresql import JSONB
 
 from tildes.lib.event_stream import EventStreamConsumer, Message
+from tildes.lib.public_suffix import get_public_suffix_list
 from tildes.lib.string import extract_text_from_html, truncate_string, word_count
 from tildes.lib.url import get_domain_from_url
 from tildes.models.topic import Topic
@@ -26,9 +26,8 @@ class TopicMetadataGenerator(EventStreamConsumer):
         """Initialize the consumer, including the public suffix list."""
         super().__init__(consumer_group, source_streams)
 
-        # download the public suffix list (would be good to add caching here)
-        psl_file = publicsuffix.fetch()
-        self.public_suffix_list = publicsuffix.PublicSuffixList(psl_file)
+        # load the public suffix list (from the on-disk cache if possible)
+        self.public_suffix_list = get_public_suffix_list()
 
     def process_message(self, message: Message) -> None:
         """Process a message from the stream."""
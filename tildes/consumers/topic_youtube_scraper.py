@@ -3,6 +3,7 @@
 
 """Consumer that fetches data from YouTube's data API for relevant link topics."""
 
+import asyncio
 import os
 from collections.abc import Sequence
 from datetime import timedelta
@@ -14,7 +15,7 @@ from sqlalchemy.dialects.postgresql import JSONB
 
 from tildes.enums import ScraperType
 from tildes.lib.datetime import utc_now
-from tildes.lib.event_stream import EventStreamConsumer, Message
+from tildes.lib.event_stream import AsyncEventStreamConsumer, Message
 from tildes.models.scraper import ScraperResult
 from tildes.models.topic import Topic
 from tildes.scrapers import ScraperError, YoutubeScraper
@@ -24,7 +25,7 @@ from tildes.scrapers import ScraperError, YoutubeScraper
 RESCRAPE_DELAY = timedelta(hours=24)
 
 
-class TopicYoutubeScraper(EventStreamConsumer):
+class TopicYoutubeScraper(AsyncEventStreamConsumer):
     """Consumer that fetches data from YouTube's data API for relevant link topics."""
 
     METRICS_PORT = 25015
@@ -37,7 +38,7 @@ class TopicYoutubeScraper(EventStreamConsumer):
 
         self.scraper = YoutubeScraper(api_key)
 
-    def process_message(self, message: Message) -> None:
+    async def process_message_async(self, message: Message) -> None:
         """Process a message from the stream."""
         topic = (
             self.db_session.query(Topic)
@@ -66,7 +67,7 @@ class TopicYoutubeScraper(EventStreamConsumer):
         # if not, scrape the url and store the result
         if not result:
             try:
-                result = self.scraper.scrape_url(topic.link)
+                result = await asyncio.to_thread(self.scraper.scrape_url, topic.link)
             except (HTTPError, ScraperError, Timeout):
                 return
 
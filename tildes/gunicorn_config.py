@@ -11,3 +11,16 @@ def child_exit(server, worker):  # type: ignore
     """
     # pylint: disable=unused-argument
     multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):  # type: ignore
+    """Start the markdown render pool when a worker starts, before any requests.
+
+    This uses post_worker_init instead of post_fork so that it's called after the app
+    has been loaded in the worker (which is what sets up the pool).
+    """
+    # pylint: disable=unused-argument
+    # pylint: disable=import-outside-toplevel
+    from tildes.lib.markdown import RENDER_EXECUTOR
+
+    RENDER_EXECUTOR.start()
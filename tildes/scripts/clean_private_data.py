@@ -24,7 +24,7 @@ from tildes.models.comment import (
 )
 from tildes.models.group import GroupSubscription
 from tildes.models.log import Log
-from tildes.models.topic import Topic, TopicBookmark, TopicVisit, TopicVote
+from tildes.models.topic import Topic, TopicBookmark, TopicLastVisit, TopicVote
 from tildes.models.user import User, UserGroupSettings, UserPermissions
 
 
@@ -89,8 +89,8 @@ class DataCleaner:
     def delete_old_topic_visits(self) -> None:
         """Delete all topic visits older than the retention cutoff."""
         deleted = (
-            self.db_session.query(TopicVisit)
-            .filter(TopicVisit.visit_time <= self.retention_cutoff)
+            self.db_session.query(TopicLastVisit)
+            .filter(TopicLastVisit.visit_time <= self.retention_cutoff)
             .delete(synchronize_session=False)
         )
         self.db_session.commit()
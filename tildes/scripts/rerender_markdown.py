@@ -0,0 +1,446 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+"""Script for re-rendering the stored HTML for all markdown.
+
+The HTML rendered from markdown is stored when the markdown is saved, so after a change
+to markdown processing that affects its output (such as allowing a new tag or adding a
+new linkification rule), the HTML for existing topics, comments, messages, group
+sidebars, user bios and wiki pages will be out of date until this is run.
+
+Rows are read in batches in primary key order and rendered across a pool of worker
+processes, and only the HTML (and excerpt) values that actually changed are written
+back. The markdown columns are never updated, so none of the triggers for markdown
+updates fire: no edit events are added to the event streams, search indexes aren't
+rebuilt, and so on.
+
+Progress is saved to a checkpoint file after every batch. If the script is interrupted,
+running it again with the same checkpoint file will resume where it stopped. The file
+is deleted once everything has been re-rendered.
+
+Example: python -m scripts.rerender_markdown --config production.ini
+"""
+
+import json
+import logging
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import get_context
+from time import perf_counter
+from typing import Any, NamedTuple, Optional
+
+import click
+from psycopg2.extras import execute_values
+from sqlalchemy import select, Table
+from sqlalchemy.orm.session import Session
+
+from tildes.enums import HTMLSanitizationContext
+from tildes.lib.database import get_session_from_config
+from tildes.lib.html import add_anchors_to_headings
+from tildes.lib.markdown import (
+    extract_references,
+    REFERENCE_RESOLVER,
+    render_markdown_uncached,
+    RenderedMarkdown,
+)
+from tildes.lib.markdown_references import MarkdownReferences
+from tildes.lib.string import truncate_string
+from tildes.models.comment import Comment
+from tildes.models.group import Group, GroupWikiPage
+from tildes.models.message import MessageConversation, MessageReply
+from tildes.models.topic import Topic
+from tildes.models.user import User
+
+
+DEFAULT_CHECKPOINT_PATH = "rerender_markdown_checkpoint.json"
+
+
+class RenderTarget(NamedTuple):
+    """A table with markdown and the HTML (and optionally excerpt) rendered from it."""
+
+    name: str
+    table: Table
+    key_column: str
+    markdown_column: str
+    html_column: str
+    excerpt_column: Optional[str] = None
+    context: Optional[HTMLSanitizationContext] = None
+
+
+RENDER_TARGETS = (
+    RenderTarget(
+        "comments",
+        Comment.__table__,
+        "comment_id",
+        "markdown",
+        "rendered_html",
+        excerpt_column="excerpt",
+    ),
+    RenderTarget("topics", Topic.__table__, "topic_id", "markdown", "rendered_html"),
+    RenderTarget(
+        "message_conversations",
+        MessageConversation.__table__,
+        "conversation_id",
+        "markdown",
+        "rendered_html",
+    ),
+    RenderTarget(
+        "message_replies",
+        MessageReply.__table__,
+        "reply_id",
+        "markdown",
+        "rendered_html",
+    ),
+    RenderTarget(
+        "groups",
+        Group.__table__,
+        "group_id",
+        "sidebar_markdown",
+        "sidebar_rendered_html",
+    ),
+    RenderTarget(
+        "users",
+        User.__table__,
+        "user_id",
+        "bio_markdown",
+        "bio_rendered_html",
+        context=HTMLSanitizationContext.USER_BIO,
+    ),
+)
+
+# wiki pages are handled separately, since their markdown is stored in files
+WIKI_PAGES_TARGET_NAME = "group_wiki_pages"
+
+
+class Checkpoint:
+    """Progress through the targets, saved to a file after every change."""
+
+    def __init__(self, path: str):
+        """Load the checkpoint from the file at path, if it exists."""
+        self.path = path
+        self.completed_targets: list[str] = []
+        self.last_keys: dict[str, Any] = {}
+
+        try:
+            with open(path, encoding="utf-8") as checkpoint_file:
+                data = json.load(checkpoint_file)
+        except FileNotFoundError:
+            return
+
+        self.completed_targets = data["completed_targets"]
+        self.last_keys = data["last_keys"]
+
+    def is_completed(self, target_name: str) -> bool:
+        """Return whether a target has already been completely re-rendered."""
+        return target_name in self.completed_targets
+
+    def complete_target(self, target_name: str) -> None:
+        """Mark a target as completely re-rendered."""
+        self.completed_targets.append(target_name)
+        self.last_keys.pop(target_name, None)
+        self.save()
+
+    def set_last_key(self, target_name: str, key: Any) -> None:
+        """Record that all rows up to (and including) a key have been re-rendered."""
+        self.last_keys[target_name] = key
+        self.save()
+
+    def save(self) -> None:
+        """Save the checkpoint, replacing the file so it's never partially written."""
+        temp_path = f"{self.path}.tmp"
+
+        with open(temp_path, "w", encoding="utf-8") as temp_file:
+            json.dump(
+                {
+                    "completed_targets": self.completed_targets,
+                    "last_keys": self.last_keys,
+                },
+                temp_file,
+            )
+
+        os.replace(temp_path, self.path)
+
+    def delete(self) -> None:
+        """Delete the checkpoint file."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def render_batch(
+    rows: list[tuple[Any, str]],
+    context: Optional[HTMLSanitizationContext],
+    existing_references: MarkdownReferences,
+) -> list[RenderedMarkdown]:
+    """Render the markdown for a batch of (key, markdown) rows (in a worker process).
+
+    The render cache isn't used, since cached renders may be from before the change
+    that this is being run for, and adding every row would push out the useful ones.
+    """
+    return [
+        render_markdown_uncached(markdown, context, existing_references)
+        for _, markdown in rows
+    ]
+
+
+def _resolve_batch_references(
+    db_session: Session, markdowns: list[str]
+) -> MarkdownReferences:
+    """Return which groups and users referenced anywhere in a batch exist.
+
+    Resolving the whole batch at once only needs a single query, and the workers don't
+    need database connections. Since only references that are in a row's markdown can
+    be linkified, it doesn't matter that each row is given the whole batch's results.
+    """
+    group_paths: set[str] = set()
+    usernames: set[str] = set()
+
+    for markdown in markdowns:
+        references = extract_references(markdown)
+        group_paths.update(references.group_paths)
+        usernames.update(references.usernames)
+
+    return REFERENCE_RESOLVER.resolve_with_session(
+        db_session, MarkdownReferences(frozenset(group_paths), frozenset(usernames))
+    )
+
+
+def _fetch_batch(
+    db_session: Session, target: RenderTarget, after_key: Any, batch_size: int
+) -> list[tuple]:
+    """Return the next batch of (key, markdown, html[, excerpt]) rows for a target."""
+    columns = target.table.columns
+    key_column = columns[target.key_column]
+    markdown_column = columns[target.markdown_column]
+
+    selected_columns = [key_column, markdown_column, columns[target.html_column]]
+    if target.excerpt_column:
+        selected_columns.append(columns[target.excerpt_column])
+
+    query = (
+        select(selected_columns)
+        .where(markdown_column.isnot(None))
+        .order_by(key_column)
+        .limit(batch_size)
+    )
+
+    if after_key is not None:
+        query = query.where(key_column > after_key)
+
+    return db_session.execute(query).fetchall()
+
+
+def _get_changes(
+    target: RenderTarget, rows: list[tuple], rendered: list[RenderedMarkdown]
+) -> list[tuple]:
+    """Return (key, html[, excerpt]) values for rows whose rendered values changed."""
+    changes = []
+
+    for row, rendered_markdown in zip(rows, rendered):
+        if target.excerpt_column:
+            # truncated the same way as in Comment.markdown
+            excerpt = truncate_string(
+                rendered_markdown.excerpt_text, length=200, truncate_at_chars=" "
+            )
+            if (rendered_markdown.html, excerpt) != (row[2], row[3]):
+                changes.append((row[0], rendered_markdown.html, excerpt))
+        elif rendered_markdown.html != row[2]:
+            changes.append((row[0], rendered_markdown.html))
+
+    return changes
+
+
+def _write_changes(
+    db_session: Session, target: RenderTarget, changes: list[tuple]
+) -> None:
+    """Write changed values to the target's table with a single UPDATE."""
+    columns = [target.key_column, target.html_column]
+    if target.excerpt_column:
+        columns.append(target.excerpt_column)
+
+    table_name = target.table.name
+    set_clause = ", ".join(f"{column} = data.{column}" for column in columns[1:])
+
+    update_query = f"""
+        UPDATE {table_name} SET {set_clause}
+        FROM (VALUES %s) AS data ({", ".join(columns)})
+        WHERE {table_name}.{target.key_column} = data.{target.key_column}
+    """
+
+    cursor = db_session.connection().connection.cursor()
+    execute_values(cursor, update_query, changes, page_size=len(changes))
+
+
+def rerender_target(
+    db_session: Session,
+    pool: ProcessPoolExecutor,
+    target: RenderTarget,
+    checkpoint: Checkpoint,
+    batch_size: int,
+    max_pending_batches: int,
+) -> None:
+    """Re-render all the markdown for a target, resuming from the checkpoint.
+
+    Up to max_pending_batches are sent to the pool at once, so that the workers are
+    kept busy while the results of the oldest batch are being written.
+    """
+    last_fetched_key = checkpoint.last_keys.get(target.name)
+    if last_fetched_key is not None:
+        logging.info(f"{target.name}: resuming after key {last_fetched_key}")
+
+    pending_batches: deque[tuple[list[tuple], Future]] = deque()
+    all_fetched = False
+
+    num_processed = 0
+    num_changed = 0
+    start_time = perf_counter()
+
+    while True:
+        while not all_fetched and len(pending_batches) < max_pending_batches:
+            rows = _fetch_batch(db_session, target, last_fetched_key, batch_size)
+
+            if not rows:
+                db_session.commit()
+                all_fetched = True
+                break
+
+            existing_references = _resolve_batch_references(
+                db_session, [row[1] for row in rows]
+            )
+
+            # end the read transaction so it isn't held open during rendering
+            db_session.commit()
+
+            last_fetched_key = rows[-1][0]
+            markdown_rows = [(row[0], row[1]) for row in rows]
+            pending_batches.append(
+                (
+                    rows,
+                    pool.submit(
+                        render_batch, markdown_rows, target.context, existing_references
+                    ),
+                )
+            )
+
+        if not pending_batches:
+            break
+
+        # batches are always finished in order, so the checkpoint's key is never past a
+        # row that hasn't been written yet
+        rows, future = pending_batches.popleft()
+        changes = _get_changes(target, rows, future.result())
+
+        if changes:
+            _write_changes(db_session, target, changes)
+        db_session.commit()
+
+        checkpoint.set_last_key(target.name, rows[-1][0])
+
+        num_processed += len(rows)
+        num_changed += len(changes)
+        elapsed = perf_counter() - start_time
+        logging.info(
+            f"{target.name}: {num_processed} processed, {num_changed} updated "
+            f"({num_processed / elapsed:.0f} rows/sec)"
+        )
+
+    checkpoint.complete_target(target.name)
+    logging.info(f"{target.name}: done, {num_changed} of {num_processed} updated")
+
+
+def rerender_wiki_pages(db_session: Session, checkpoint: Checkpoint) -> None:
+    """Re-render all wiki pages (there are few enough to do in a single batch)."""
+    num_changed = 0
+    pages = db_session.query(GroupWikiPage).all()
+
+    for page in pages:
+        markdown = page.markdown
+        if markdown is None:
+            continue
+
+        existing_references = _resolve_batch_references(db_session, [markdown])
+        rendered = render_markdown_uncached(
+            markdown, existing_references=existing_references
+        )
+        html = add_anchors_to_headings(rendered.html)
+
+        # set the column directly, since edit() would also commit to the wiki repo
+        if html != page.rendered_html:
+            page.rendered_html = html
+            num_changed += 1
+
+    db_session.commit()
+
+    checkpoint.complete_target(WIKI_PAGES_TARGET_NAME)
+    logging.info(
+        f"{WIKI_PAGES_TARGET_NAME}: done, {num_changed} of {len(pages)} updated"
+    )
+
+
+@click.command()
+@click.option("--config", "config_path", required=True, help="Path to the INI file")
+@click.option(
+    "--checkpoint",
+    "checkpoint_path",
+    default=DEFAULT_CHECKPOINT_PATH,
+    show_default=True,
+    help="File to save progress to (and resume from, if it exists)",
+)
+@click.option("--batch-size", default=500, show_default=True)
+@click.option(
+    "--workers",
+    default=os.cpu_count(),
+    show_default=True,
+    help="Number of worker processes to render with",
+)
+@click.option(
+    "--only",
+    multiple=True,
+    type=click.Choice(
+        [target.name for target in RENDER_TARGETS] + [WIKI_PAGES_TARGET_NAME]
+    ),
+    help="Only re-render this type of markdown (can be used multiple times)",
+)
+def rerender_markdown(
+    config_path: str,
+    checkpoint_path: str,
+    batch_size: int,
+    workers: int,
+    only: tuple[str, ...],
+) -> None:
+    """Re-render the stored HTML for all markdown (main command)."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    db_session = get_session_from_config(config_path)
+    checkpoint = Checkpoint(checkpoint_path)
+
+    # Use "spawn" so the workers don't inherit the database connection. With "fork",
+    # a worker closing its copy of the connection when it exits would also close the
+    # connection for this process.
+    with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as pool:
+        for target in RENDER_TARGETS:
+            if only and target.name not in only:
+                continue
+
+            if checkpoint.is_completed(target.name):
+                logging.info(f"{target.name}: already completed, skipping")
+                continue
+
+            rerender_target(
+                db_session, pool, target, checkpoint, batch_size, workers * 2
+            )
+
+    if not only or WIKI_PAGES_TARGET_NAME in only:
+        if checkpoint.is_completed(WIKI_PAGES_TARGET_NAME):
+            logging.info(f"{WIKI_PAGES_TARGET_NAME}: already completed, skipping")
+        else:
+            rerender_wiki_pages(db_session, checkpoint)
+
+    checkpoint.delete()
+    logging.info("All markdown re-rendered")
+
+
+if __name__ == "__main__":
+    rerender_markdown()
@@ -0,0 +1,30 @@
+-- Copyright (c) 2021 Tildes contributors <code@tildes.net>
+-- SPDX-License-Identifier: AGPL-3.0-or-later
+
+-- labels can affect the order of the comment tree, so adding or removing them needs to
+-- increment the topic's comments_version
+CREATE OR REPLACE FUNCTION increment_topics_comments_version_from_label() RETURNS TRIGGER AS $$
+DECLARE
+    affected_comment_id BIGINT;
+BEGIN
+    IF (TG_OP = 'DELETE') THEN
+        affected_comment_id := OLD.comment_id;
+    ELSE
+        affected_comment_id := NEW.comment_id;
+    END IF;
+
+    UPDATE topics
+        SET comments_version = comments_version + 1
+        WHERE topic_id = (
+            SELECT topic_id FROM comments WHERE comment_id = affected_comment_id
+        );
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE TRIGGER increment_topics_comments_version_insert_delete
+    AFTER INSERT OR DELETE ON comment_labels
+    FOR EACH ROW
+    EXECUTE PROCEDURE increment_topics_comments_version_from_label();
@@ -10,17 +10,11 @@ begin
     -- if marking a notification as read, increment the comment count on the user's
     -- last visit to the topic as long as it was before the comment was posted
     if (OLD.is_unread = true and NEW.is_unread = false) then
-        update topic_visits
+        update topic_last_visits
             set num_comments = num_comments + 1
             where topic_id = comment.topic_id
                 and user_id = NEW.user_id
-                and visit_time < comment.created_time
-                and visit_time = (
-                    select max(visit_time)
-                    from topic_visits
-                    where topic_id = comment.topic_id
-                        and user_id = NEW.user_id
-                );
+                and visit_time < comment.created_time;
     end if;
 
     return null;
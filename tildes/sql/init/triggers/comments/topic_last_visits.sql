@@ -4,16 +4,10 @@
 -- increment a user's topic visit comment count when they post a comment
 CREATE OR REPLACE FUNCTION increment_user_topic_visit_num_comments() RETURNS TRIGGER AS $$
 BEGIN
-    UPDATE topic_visits
+    UPDATE topic_last_visits
         SET num_comments = num_comments + 1
         WHERE user_id = NEW.user_id
-            AND topic_id = NEW.topic_id
-            AND visit_time = (
-                SELECT MAX(visit_time)
-                FROM topic_visits
-                WHERE topic_id = NEW.topic_id
-                    AND user_id = NEW.user_id
-            );
+            AND topic_id = NEW.topic_id;
 
     RETURN NULL;
 END;
@@ -32,12 +26,12 @@ DECLARE
     new_visible BOOLEAN := NOT (NEW.is_deleted OR NEW.is_removed);
 BEGIN
     IF (old_visible AND NOT new_visible) THEN
-        UPDATE topic_visits
+        UPDATE topic_last_visits
             SET num_comments = num_comments - 1
             WHERE topic_id = OLD.topic_id AND
                 visit_time > OLD.created_time;
     ELSIF (NOT old_visible AND new_visible) THEN
-        UPDATE topic_visits
+        UPDATE topic_last_visits
             SET num_comments = num_comments + 1
             WHERE topic_id = OLD.topic_id AND
                 visit_time > OLD.created_time;
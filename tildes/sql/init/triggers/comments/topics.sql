@@ -94,3 +94,36 @@ CREATE TRIGGER update_topics_last_activity_time_update
     WHEN ((OLD.is_deleted IS DISTINCT FROM NEW.is_deleted)
         OR (OLD.is_removed IS DISTINCT FROM NEW.is_removed))
     EXECUTE PROCEDURE update_topics_last_activity_time();
+
+
+-- increment a topic's comments_version whenever a change is made to its comments that
+-- could affect the structure of the comment tree (votes only affect its ordering, which
+-- is updated when a cached tree is loaded, so that voting doesn't need to update the
+-- topic's row for every comment vote)
+CREATE OR REPLACE FUNCTION increment_topics_comments_version() RETURNS TRIGGER AS $$
+BEGIN
+    IF (TG_OP = 'DELETE') THEN
+        UPDATE topics
+            SET comments_version = comments_version + 1
+            WHERE topic_id = OLD.topic_id;
+    ELSE
+        UPDATE topics
+            SET comments_version = comments_version + 1
+            WHERE topic_id = NEW.topic_id;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER increment_topics_comments_version_insert_delete
+    AFTER INSERT OR DELETE ON comments
+    FOR EACH ROW
+    EXECUTE PROCEDURE increment_topics_comments_version();
+
+CREATE TRIGGER increment_topics_comments_version_update
+    AFTER UPDATE ON comments
+    FOR EACH ROW
+    WHEN ((OLD.is_deleted IS DISTINCT FROM NEW.is_deleted)
+        OR (OLD.is_removed IS DISTINCT FROM NEW.is_removed))
+    EXECUTE PROCEDURE increment_topics_comments_version();
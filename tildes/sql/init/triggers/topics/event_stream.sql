@@ -31,3 +31,23 @@ create trigger topics_events_update_link
     after update of link on topics
     for each row
     execute function topics_events_trigger('link');
+
+create trigger topics_events_update_group_id
+    after update of group_id on topics
+    for each row
+    execute function topics_events_trigger('group_id');
+
+create trigger topics_events_update_is_deleted
+    after update of is_deleted on topics
+    for each row
+    execute function topics_events_trigger('is_deleted');
+
+create trigger topics_events_update_is_removed
+    after update of is_removed on topics
+    for each row
+    execute function topics_events_trigger('is_removed');
+
+create trigger topics_events_update_last_interesting_activity_time
+    after update of last_interesting_activity_time on topics
+    for each row
+    execute function topics_events_trigger('last_interesting_activity_time');
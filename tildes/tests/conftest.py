@@ -15,6 +15,7 @@ from testing.redis import RedisServer
 from webtest import TestApp
 
 from scripts.initialize_db import create_tables
+from tildes.lib.markdown import RENDER_CACHE
 from tildes.models.group import Group
 from tildes.models.user import User
 
@@ -196,6 +197,10 @@ def base_app(overall_redis_session, sdb):
 
     testing_app.app.registry["redis_connection_factory"] = redis_factory
 
+    # the markdown render cache's redis connection is set during app startup, so it
+    # also needs to be replaced
+    RENDER_CACHE.redis = overall_redis_session
+
     # replace the session factory function with one that will return the testing db
     # session (inside a nested transaction)
     def session_factory():
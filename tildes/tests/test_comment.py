@@ -4,6 +4,7 @@
 from datetime import timedelta
 
 from freezegun import freeze_time
+from pytest import raises
 from pyramid.security import (
     Allow,
     Authenticated,
@@ -229,3 +230,111 @@ def test_comment_tree(db, topic, session_user):
     db.commit()
     tree = list(CommentTree(all_comments, sort))
     assert not tree
+
+
+def test_comment_tree_snapshot_round_trip(db, topic, session_user):
+    """Ensure a comment tree loaded from a snapshot matches the original."""
+    sort = CommentTreeSortOption.POSTED
+
+    root = Comment(topic, session_user, "root")
+    root2 = Comment(topic, session_user, "root2")
+    db.add_all([root, root2])
+    db.commit()
+
+    child = Comment(topic, session_user, "child", parent_comment=root)
+    db.add(child)
+    db.commit()
+
+    all_comments = [root, root2, child]
+    snapshot = CommentTree(all_comments, sort).get_snapshot()
+
+    tree = CommentTree(all_comments, sort, snapshot=snapshot)
+    assert tree.get_snapshot() == snapshot
+    assert list(tree) == [root, root2]
+    assert root.replies == [child]
+    assert root.num_children == 1
+    assert child.depth == 1
+
+
+def test_comment_tree_snapshot_resorted_by_votes(db, topic, session_user):
+    """Ensure a snapshot for a sort that uses votes is re-sorted when loaded."""
+    votes_sort = CommentTreeSortOption.VOTES
+    posted_sort = CommentTreeSortOption.POSTED
+
+    root = Comment(topic, session_user, "root")
+    root2 = Comment(topic, session_user, "root2")
+    db.add_all([root, root2])
+    db.commit()
+
+    all_comments = [root, root2]
+    votes_snapshot = CommentTree(all_comments, votes_sort).get_snapshot()
+    posted_snapshot = CommentTree(all_comments, posted_sort).get_snapshot()
+
+    # votes don't change the topic's comments_version, so the snapshots are still used
+    root2.num_votes = 3
+    db.commit()
+
+    tree = CommentTree(all_comments, votes_sort, snapshot=votes_snapshot)
+    assert list(tree) == [root2, root]
+
+    tree = CommentTree(all_comments, posted_sort, snapshot=posted_snapshot)
+    assert list(tree) == [root, root2]
+
+
+def test_comment_tree_snapshot_mismatch(db, topic, session_user):
+    """Ensure a snapshot for a different set of comments is rejected."""
+    sort = CommentTreeSortOption.POSTED
+
+    root = Comment(topic, session_user, "root")
+    db.add(root)
+    db.commit()
+
+    snapshot = CommentTree([root], sort).get_snapshot()
+
+    root2 = Comment(topic, session_user, "root2")
+    db.add(root2)
+    db.commit()
+
+    with raises(ValueError):
+        CommentTree([root, root2], sort, snapshot=snapshot)
+
+    with raises(ValueError):
+        CommentTree([root], CommentTreeSortOption.VOTES, snapshot=snapshot)
+
+
+def test_comment_tree_top_level_pages(db, topic, session_user):
+    """Ensure a comment tree's top-level comments can be retrieved in pages."""
+    sort = CommentTreeSortOption.POSTED
+
+    roots = [Comment(topic, session_user, f"root {num}") for num in range(5)]
+    db.add_all(roots)
+    db.commit()
+
+    tree = CommentTree(roots, sort)
+
+    assert tree.get_top_level_page(2) == roots[:2]
+    assert tree.get_top_level_page(2, roots[1].comment_id) == roots[2:4]
+    assert tree.get_top_level_page(2, roots[3].comment_id) == roots[4:]
+
+    with raises(ValueError):
+        tree.get_top_level_page(2, 0)
+
+
+def test_comment_tree_iter_to_depth(db, topic, session_user):
+    """Ensure iterating over comment tree branches stops at the max depth."""
+    root = Comment(topic, session_user, "root")
+    db.add(root)
+    db.commit()
+
+    child = Comment(topic, session_user, "child", parent_comment=root)
+    db.add(child)
+    db.commit()
+
+    grandchild = Comment(topic, session_user, "grandchild", parent_comment=child)
+    db.add(grandchild)
+    db.commit()
+
+    tree = CommentTree([root, child, grandchild], CommentTreeSortOption.POSTED)
+
+    assert list(tree.iter_to_depth(tree.tree, 1)) == [root, child]
+    assert list(tree.iter_to_depth(tree.tree, 5)) == [root, child, grandchild]
@@ -44,6 +44,13 @@ def test_get_mentions_for_comment_escapes_with_backslash(db, user_list, comment)
     assert "baz" not in [mention.user for mention in mentions]
 
 
+def test_get_mentions_for_comment_ignores_code(db, user_list, comment):
+    """Test that mentions inside code (which aren't linked) are ignored."""
+    comment.markdown = "@foo `@bar`"
+    mentions = CommentNotification.get_mentions_for_comment(db, comment)
+    assert [mention.user for mention in mentions] == [user_list[0]]
+
+
 def test_mention_filtering_parent_comment(db, topic, user_list):
     """Test notification filtering for parent comments."""
     parent_comment = Comment(topic, user_list[0], "Comment content.")
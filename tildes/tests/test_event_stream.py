@@ -0,0 +1,358 @@
+# Copyright (c) 2020 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import sleep
+
+import requests
+from pytest import fixture, raises
+
+from tildes.lib.event_stream import (
+    AsyncEventStreamConsumer,
+    EventStreamConsumer,
+    MAX_RETRIES_PER_MESSAGE,
+    Message,
+    METRICS_PORT_WORKER_OFFSET,
+    REDIS_KEY_PREFIX,
+)
+
+
+# how long the stub server takes to respond to each request
+STUB_RESPONSE_DELAY = 0.2
+
+
+class NoMoreMessages(Exception):
+    """Raised by RecordingConsumer when there aren't any more messages to process."""
+
+
+class RecordingConsumer(EventStreamConsumer):
+    """Consumer that records the numbers of the messages it processes in Redis."""
+
+    BATCH_SIZE = 5
+
+    def _get_messages(self, pending=False):
+        """Get messages like normal, but stop consuming when there aren't any new ones."""
+        messages = super()._get_messages(pending)
+
+        if not (messages or pending):
+            raise NoMoreMessages
+
+        return messages
+
+    def process_message(self, message):
+        """Record the message's number, or fail if it's a "poison" message."""
+        if message.fields["number"] == "poison":
+            raise ValueError("Poison message")
+
+        self.redis.rpush("processed", message.fields["number"])
+
+
+@fixture
+def consumer_factory(redis, monkeypatch):
+    """Return a function that creates consumers connected to the test Redis server."""
+    monkeypatch.setenv("INI_FILE", "development.ini")
+    monkeypatch.setattr("tildes.lib.event_stream.Redis", lambda **kwargs: redis)
+
+    # don't block for long when waiting for new messages that will never arrive
+    monkeypatch.setattr("tildes.lib.event_stream.RECLAIM_INTERVAL_MS", 10)
+
+    def make_consumer(consumer_class=RecordingConsumer, worker_number=1, **kwargs):
+        monkeypatch.setenv("CONSUMER_WORKER_NUMBER", str(worker_number))
+        return consumer_class("test_group", ["test"], uses_db=False, **kwargs)
+
+    return make_consumer
+
+
+def test_poison_message_in_batch_only_kills_itself(consumer_factory, redis):
+    """Ensure a failing message in a batch doesn't dead-letter the ones after it."""
+    # create the consumer first, since its group will only get messages added after
+    consumer = consumer_factory()
+
+    numbers = ["0", "1", "poison", "3", "4"]
+    message_ids = [
+        redis.xadd(f"{REDIS_KEY_PREFIX}test", {"number": number}) for number in numbers
+    ]
+
+    # the batch fails, then the messages are retried individually until the poison one
+    with raises(ValueError):
+        consumer.consume_streams()
+
+    # every restart only retries the poison message, until it's cleared as dead
+    for _ in range(MAX_RETRIES_PER_MESSAGE - 1):
+        with raises(ValueError):
+            consumer_factory().consume_streams()
+
+    with raises(NoMoreMessages):
+        consumer_factory().consume_streams()
+
+    # (the first attempt at the whole batch also records some, so only check the set)
+    assert set(redis.lrange("processed", 0, -1)) == {b"0", b"1", b"3", b"4"}
+
+    pending = redis.xpending_range(
+        f"{REDIS_KEY_PREFIX}test", "test_group", min="-", max="+", count=10
+    )
+    assert [(entry["message_id"], entry["consumer"]) for entry in pending] == [
+        (message_ids[2], b"test_group-dead")
+    ]
+
+
+def test_consumer_worker_names(consumer_factory):
+    """Ensure each worker gets a separate consumer name in the group."""
+    assert consumer_factory().name == "test_group-1"
+    assert consumer_factory(worker_number=3).name == "test_group-3"
+
+
+def test_consumer_worker_number_must_be_positive(consumer_factory):
+    """Ensure a worker number below 1 is rejected."""
+    with raises(ValueError):
+        consumer_factory(worker_number=0)
+
+
+def test_consumer_worker_metrics_ports(consumer_factory, monkeypatch):
+    """Ensure each worker serves its metrics on a separate port."""
+    ports = []
+    monkeypatch.setattr(
+        "tildes.lib.event_stream.start_http_server",
+        lambda port, registry: ports.append(port),
+    )
+
+    class MetricsConsumer(RecordingConsumer):
+        METRICS_PORT = 25000
+
+    consumer_factory(MetricsConsumer)
+    consumer_factory(MetricsConsumer, worker_number=3)
+
+    assert ports == [25000, 25000 + 2 * METRICS_PORT_WORKER_OFFSET]
+
+
+def _deliver_message(redis, consumer_name):
+    """Add a message to the test stream and deliver it to a consumer in the group."""
+    message_id = redis.xadd(f"{REDIS_KEY_PREFIX}test", {"number": "0"})
+    redis.xreadgroup(
+        "test_group", consumer_name, {f"{REDIS_KEY_PREFIX}test": ">"}, count=1
+    )
+
+    return message_id
+
+
+def _pending_entries(redis):
+    """Return the pending entries for the test stream's group, by message ID."""
+    pending = redis.xpending_range(
+        f"{REDIS_KEY_PREFIX}test", "test_group", min="-", max="+", count=10
+    )
+    return {entry["message_id"]: entry for entry in pending}
+
+
+def _pending_owners(redis):
+    """Return a dict of which consumer each pending message in the group belongs to."""
+    return {
+        message_id: entry["consumer"]
+        for message_id, entry in _pending_entries(redis).items()
+    }
+
+
+def test_reclaim_idle_messages(consumer_factory, redis, monkeypatch):
+    """Ensure idle messages are reclaimed from other workers, but not -dead."""
+    monkeypatch.setattr("tildes.lib.event_stream.RECLAIM_MIN_IDLE_MS", 1)
+    consumer = consumer_factory(skip_pending=True)
+
+    other_worker_id = _deliver_message(redis, "test_group-2")
+    own_id = _deliver_message(redis, "test_group-1")
+    dead_id = _deliver_message(redis, "test_group-1")
+    redis.xclaim(
+        f"{REDIS_KEY_PREFIX}test",
+        "test_group",
+        "test_group-dead",
+        min_idle_time=0,
+        message_ids=[dead_id],
+    )
+
+    # make sure all the messages have been idle for longer than the minimum
+    sleep(0.01)
+
+    consumer._reclaim_idle_messages()
+
+    assert _pending_owners(redis) == {
+        other_worker_id: b"test_group-1",
+        own_id: b"test_group-1",
+        dead_id: b"test_group-dead",
+    }
+    assert consumer.is_reading_pending
+
+    # claiming a message resets its idle time, so this shows it wasn't claimed again
+    assert _pending_entries(redis)[own_id]["time_since_delivered"] >= 10
+
+
+def test_reclaim_skips_recent_messages(consumer_factory, redis):
+    """Ensure messages other workers received recently aren't reclaimed."""
+    consumer = consumer_factory(skip_pending=True)
+    message_id = _deliver_message(redis, "test_group-2")
+
+    consumer._reclaim_idle_messages()
+
+    assert _pending_owners(redis) == {message_id: b"test_group-2"}
+    assert not consumer.is_reading_pending
+
+
+class SlowStubHandler(BaseHTTPRequestHandler):
+    """Request handler for a local HTTP server that responds slowly.
+
+    The handler keeps track of how many requests it's handling at the same time, and
+    the peak number of them since the server was started.
+    """
+
+    in_flight_lock = Lock()
+    num_in_flight = 0
+    peak_in_flight = 0
+
+    def do_GET(self):
+        """Wait a little while, then respond with the request's path."""
+        cls = self.__class__
+        with cls.in_flight_lock:
+            cls.num_in_flight += 1
+            cls.peak_in_flight = max(cls.peak_in_flight, cls.num_in_flight)
+
+        sleep(STUB_RESPONSE_DELAY)
+
+        with cls.in_flight_lock:
+            cls.num_in_flight -= 1
+
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(self.path.encode("utf-8"))
+
+    def log_message(self, *args):
+        """Don't log anything for requests."""
+        pass
+
+
+@fixture
+def stub_server_url():
+    """Run a local stub HTTP server in a thread, and return its url."""
+    SlowStubHandler.num_in_flight = 0
+    SlowStubHandler.peak_in_flight = 0
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowStubHandler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f"http://127.0.0.1:{server.server_port}"
+
+    server.shutdown()
+    server.server_close()
+
+
+class RecordingSession:
+    """Stand-in for a database session that records commits and rollbacks."""
+
+    def __init__(self, events):
+        """Record events into the list (shared with the consumer's acks)."""
+        self.events = events
+
+    def commit(self):
+        """Record a commit."""
+        self.events.append("commit")
+
+    def rollback(self):
+        """Record a rollback."""
+        self.events.append("rollback")
+
+
+class StubFetchingConsumer(AsyncEventStreamConsumer):
+    """Async consumer that fetches a path from the stub server for each message."""
+
+    MAX_CONCURRENCY = 5
+
+    def __init__(self, base_url):
+        """Set up the consumer without connecting to Redis or the database."""
+        # pylint: disable=super-init-not-called
+        self.base_url = base_url
+        self.responses = {}
+        self.events = []
+
+        self.db_session = RecordingSession(self.events)
+        self.metrics = None
+
+    async def process_message_async(self, message):
+        """Fetch the message's path from the stub server and save the response."""
+        if message.fields["path"] == "fail":
+            raise ValueError("Failing message")
+
+        response = await asyncio.to_thread(
+            requests.get, self.base_url + message.fields["path"], timeout=5
+        )
+        self.responses[message.message_id] = response.text
+
+    def _ack_messages(self, messages):
+        """Record which messages were acked instead of acking them in Redis."""
+        self.events.extend(f"ack {message.message_id}" for message in messages)
+
+
+def _messages_for_paths(paths):
+    """Create a list of Messages with the given paths as their fields."""
+    return [
+        Message(None, "test", message_id=str(number), fields={"path": path})
+        for number, path in enumerate(paths)
+    ]
+
+
+def test_async_consumer_processes_concurrently(stub_server_url):
+    """Ensure an async consumer processes a batch of messages concurrently."""
+    consumer = StubFetchingConsumer(stub_server_url)
+    paths = [f"/{number}" for number in range(5)]
+
+    consumer._process_batch(_messages_for_paths(paths))
+
+    assert consumer.responses == {
+        str(number): path for number, path in enumerate(paths)
+    }
+    assert SlowStubHandler.peak_in_flight > 1
+
+
+def test_async_consumer_limits_concurrency(stub_server_url):
+    """Ensure an async consumer doesn't go above its concurrency limit."""
+    consumer = StubFetchingConsumer(stub_server_url)
+    paths = [f"/{number}" for number in range(10)]
+
+    consumer._process_batch(_messages_for_paths(paths))
+
+    assert len(consumer.responses) == 10
+    assert SlowStubHandler.peak_in_flight <= consumer.MAX_CONCURRENCY
+
+
+def test_async_consumer_finishes_messages_individually(stub_server_url):
+    """Ensure each message in a batch is committed and acked by itself."""
+    consumer = StubFetchingConsumer(stub_server_url)
+
+    consumer._process_batch(_messages_for_paths(["/0", "/1", "/2"]))
+
+    # every message should have its own commit, immediately followed by its ack
+    assert len(consumer.events) == 6
+    assert consumer.events[::2] == ["commit"] * 3
+    assert sorted(consumer.events[1::2]) == ["ack 0", "ack 1", "ack 2"]
+
+
+def test_async_consumer_batch_failure_finishes_others(stub_server_url):
+    """Ensure a failing message in a batch doesn't stop the others being finished."""
+    consumer = StubFetchingConsumer(stub_server_url)
+
+    with raises(ValueError):
+        consumer._process_batch(_messages_for_paths(["/0", "fail", "/2"]))
+
+    assert consumer.responses == {"0": "/0", "2": "/2"}
+
+    # the failing message fails before the others finish, so it's rolled back first
+    assert consumer.events[0] == "rollback"
+    assert sorted(consumer.events[1:]) == ["ack 0", "ack 2", "commit", "commit"]
+    assert "ack 1" not in consumer.events
+
+
+def test_async_consumer_single_message(stub_server_url):
+    """Ensure an async consumer can still process a single message by itself."""
+    consumer = StubFetchingConsumer(stub_server_url)
+
+    consumer.process_message(_messages_for_paths(["/single"])[0])
+
+    assert consumer.responses == {"0": "/single"}
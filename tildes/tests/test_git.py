@@ -0,0 +1,83 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+from pygit2 import init_repository, Signature
+from pytest import fixture
+
+from tildes.lib.git import _get_entry_id, commit_file_edits, GitFileEdit
+
+
+@fixture
+def repo(tmp_path):
+    """Create a git repo with an initial (empty) commit."""
+    repo = init_repository(str(tmp_path))
+    author = Signature("Tildes", "Tildes")
+    tree_id = repo.TreeBuilder().write()
+    repo.create_commit("HEAD", author, author, "Initial commit", tree_id, [])
+
+    return repo
+
+
+def _edit(repo, file_path, content, message="Edit"):
+    """Return an edit for a file, storing its content in the repo."""
+    blob_id = repo.create_blob(content)
+    return GitFileEdit(file_path, str(blob_id), "SomeUser", message, 1600000000)
+
+
+def _read_file(repo, file_path):
+    """Return a file's content in the repo's HEAD commit."""
+    tree = repo[repo.head.target].tree
+    for part in file_path.split("/"):
+        tree = repo[tree[part].id]
+
+    return tree.data
+
+
+def test_edits_committed_in_order(repo):
+    """Ensure each edit gets its own commit, in order, on the HEAD branch."""
+    edits = [
+        _edit(repo, "group/page.md", b"first\n", "First"),
+        _edit(repo, "group/page.md", b"second\n", "Second"),
+    ]
+    commit_ids = commit_file_edits(repo, edits)
+
+    assert len(commit_ids) == 2
+    assert repo.head.target == commit_ids[-1]
+    assert repo[commit_ids[-1]].parents[0].id == commit_ids[0]
+    assert repo[commit_ids[0]].message == "First"
+    assert repo[commit_ids[0]].author.name == "SomeUser"
+    assert _read_file(repo, "group/page.md") == b"second\n"
+
+
+def test_other_files_kept(repo):
+    """Ensure committing an edit doesn't affect other files in the same folders."""
+    commit_file_edits(repo, [_edit(repo, "group/folder/one.md", b"one\n")])
+    commit_file_edits(repo, [_edit(repo, "group/folder/two.md", b"two\n")])
+
+    assert _read_file(repo, "group/folder/one.md") == b"one\n"
+    assert _read_file(repo, "group/folder/two.md") == b"two\n"
+
+
+def test_already_committed_edit_skipped(repo):
+    """Ensure committing the same edit again doesn't create an empty commit."""
+    edit = _edit(repo, "group/page.md", b"content\n")
+    commit_file_edits(repo, [edit])
+    head = repo.head.target
+
+    assert commit_file_edits(repo, [edit]) == []
+    assert repo.head.target == head
+
+
+def test_index_not_written(repo):
+    """Ensure committing edits doesn't write the repo's index."""
+    commit_file_edits(repo, [_edit(repo, "group/page.md", b"content\n")])
+
+    repo.index.read()
+    assert len(repo.index) == 0
+
+
+def test_empty_path_has_no_entry(repo):
+    """Ensure looking up an empty path returns None instead of crashing."""
+    tree = repo[repo.head.target].tree
+
+    assert _get_entry_id(repo, tree, ()) is None
@@ -3,7 +3,7 @@
 
 from bs4 import BeautifulSoup
 
-from tildes.lib.html import add_anchors_to_headings
+from tildes.lib.html import add_anchors_to_headings, get_linked_usernames
 from tildes.lib.markdown import convert_markdown_to_safe_html
 
 
@@ -33,3 +33,12 @@ def test_heading_links_to_itself():
 
     soup = BeautifulSoup(html, features="html5lib")
     assert soup.h2.a["href"] == "#" + soup.h2["id"]
+
+
+def test_linked_usernames():
+    """Ensure the usernames of linked user references are found (lowercased)."""
+    html = convert_markdown_to_safe_html(
+        "@SomeUser and /u/other, but not `@coded` or [@fake](/user/fake)"
+    )
+
+    assert get_linked_usernames(html) == {"someuser", "other"}
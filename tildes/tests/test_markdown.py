@@ -4,7 +4,17 @@
 from bs4 import BeautifulSoup
 
 from tildes.enums import HTMLSanitizationContext
-from tildes.lib.markdown import convert_markdown_to_safe_html
+from tildes.lib.cmark import render_markdown_to_html
+from tildes.lib.markdown import (
+    convert_markdown_to_safe_html,
+    extract_references,
+    get_lexer_for_language,
+    render_markdown,
+    render_markdown_preview,
+    render_markdown_uncached,
+)
+from tildes.lib.markdown_references import MarkdownReferences
+from tildes.lib.string import extract_text_from_html
 
 
 def test_script_tag_escaped():
@@ -496,3 +506,109 @@ def test_a_rel_kept_user_bio_context():
     )
 
     assert "rel=" in processed
+
+
+def test_reused_parser_keeps_no_state_between_documents():
+    """Ensure parsing a document isn't affected by the previous one."""
+    table = "| Header |\n| --- |\n| Cell |"
+    render_markdown_to_html(table.encode("utf8"))
+    render_markdown_to_html(b"An unterminated *emphasis and a [link")
+
+    # the table extension should still work after being re-used
+    assert b"<table>" in render_markdown_to_html(table.encode("utf8"))
+    assert render_markdown_to_html(b"Just text") == b"<p>Just text</p>\n"
+
+
+def test_syntax_highlighting_with_entities():
+    """Ensure code containing escaped characters is highlighted correctly."""
+    markdown = '```python\nif a < b and c & d:\n    print("quoted")\n```'
+    processed = convert_markdown_to_safe_html(markdown)
+
+    assert '<code class="highlight">' in processed
+    assert "&amp;lt;" not in processed
+    assert "&amp;amp;" not in processed
+
+
+def test_excerpt_text_matches_rendered_html():
+    """Ensure the excerpt text is the same as extracting it from the final HTML."""
+    markdown = (
+        "> A quote\n\n"
+        "Some **bold** ~~and deleted~~ text &copy; &notit; with a link to ~group\n\n"
+        "```python\nx = 1 < 2\n```"
+    )
+    rendered = render_markdown(markdown)
+
+    assert rendered.excerpt_text == extract_text_from_html(
+        rendered.html, skip_tags=["blockquote", "del"]
+    )
+
+
+def test_lexer_for_language_reused():
+    """Ensure the same lexer is returned each time a language is used."""
+    assert get_lexer_for_language("python") is get_lexer_for_language("python")
+
+
+def test_lexer_for_unknown_language():
+    """Ensure no lexer is returned for a language that doesn't exist."""
+    assert get_lexer_for_language("not-a-real-language") is None
+
+
+def test_php_lexer_starts_inline():
+    """Ensure the PHP lexer highlights code that isn't inside <?php ... ?>."""
+    assert get_lexer_for_language("php").options["startinline"]
+
+
+def test_references_extracted():
+    """Ensure valid group and user references are extracted (lowercased)."""
+    markdown = "@SomeUser and u/other-user posted in ~Some.Group and ~music"
+    references = extract_references(markdown)
+
+    assert references.group_paths == {"some.group", "music"}
+    assert references.usernames == {"someuser", "other-user"}
+
+
+def test_invalid_references_not_extracted():
+    """Ensure references that would never be linkified aren't extracted."""
+    markdown = "About ~10 of them, see @_underscores_ for details"
+    references = extract_references(markdown)
+
+    assert not references.group_paths
+    assert not references.usernames
+
+
+def test_only_existing_references_linkified():
+    """Ensure only existing references are linkified when they've been resolved."""
+    markdown = "@RealUser and @FakeUser posted in ~realgroup and ~fakegroup"
+    existing = MarkdownReferences(frozenset({"realgroup"}), frozenset({"realuser"}))
+    processed = render_markdown_uncached(markdown, existing_references=existing).html
+
+    soup = BeautifulSoup(processed, features="html5lib")
+    assert soup.find("a", href="/user/RealUser")
+    assert soup.find("a", href="/~realgroup")
+    assert not soup.find("a", href="/user/FakeUser")
+    assert not soup.find("a", href="/~fakegroup")
+
+
+def test_preview_matches_full_render():
+    """Ensure a preview rendered in blocks is the same as rendering all at once."""
+    markdown = (
+        "# Heading\n\n"
+        "Some text with a link to ~group\n\n"
+        "* a tight\n* list\n\n"
+        "```python\nx = 1 < 2\n```\n\n"
+        "[a reference link][ref] defined in a later block\n\n"
+        "[ref]: https://example.com"
+    )
+
+    assert render_markdown_preview(markdown) == render_markdown_uncached(markdown).html
+
+    # preview again with one block changed, so the others are re-used from the cache
+    markdown = markdown.replace("a tight", "an edited")
+    assert render_markdown_preview(markdown) == render_markdown_uncached(markdown).html
+
+
+def test_preview_with_html_across_blocks_matches_full_render():
+    """Ensure raw HTML spanning multiple blocks is previewed like the full render."""
+    markdown = "<b>Unclosed bold\n\nin a second paragraph"
+
+    assert render_markdown_preview(markdown) == render_markdown_uncached(markdown).html
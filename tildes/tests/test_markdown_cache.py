@@ -0,0 +1,93 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+from tildes.enums import HTMLSanitizationContext
+from tildes.lib.markdown import (
+    convert_markdown_to_safe_html,
+    RENDER_CACHE,
+    render_markdown_uncached,
+)
+from tildes.lib.markdown_cache import MarkdownRenderCache
+from tildes.metrics import get_histogram
+
+
+def _get_cache_count(result):
+    """Return the number of markdown_processing observations with a cache result."""
+    histogram = get_histogram("markdown_processing", cache=result)
+
+    for metric in histogram.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_count"):
+                return sample.value
+
+    return 0
+
+
+def test_cached_render_matches_full_render():
+    """Ensure a cached render returns the same HTML as the full processing."""
+    markdown = "Some **bold** text, a link to ~group and a mention of @someone"
+    RENDER_CACHE.clear()
+
+    first = convert_markdown_to_safe_html(markdown)
+    second = convert_markdown_to_safe_html(markdown)
+
+    assert first == second == render_markdown_uncached(markdown).html
+
+
+def test_cache_hits_and_misses_counted():
+    """Ensure the processing histogram records hits and misses separately."""
+    markdown = "A unique string for testing cache metrics"
+    RENDER_CACHE.clear()
+    hits = _get_cache_count("hit")
+    misses = _get_cache_count("miss")
+
+    convert_markdown_to_safe_html(markdown)
+    convert_markdown_to_safe_html(markdown)
+    convert_markdown_to_safe_html(markdown)
+
+    assert _get_cache_count("miss") == misses + 1
+    assert _get_cache_count("hit") == hits + 2
+
+
+def test_context_affects_cached_render():
+    """Ensure renders in different sanitization contexts aren't shared."""
+    markdown = '<a href="https://example.com" rel="me">My site</a>'
+    RENDER_CACHE.clear()
+
+    default_html = convert_markdown_to_safe_html(markdown)
+    bio_html = convert_markdown_to_safe_html(markdown, HTMLSanitizationContext.USER_BIO)
+
+    assert 'rel="me"' not in default_html
+    assert 'rel="me"' in bio_html
+
+
+def test_cache_key_depends_on_part_boundaries():
+    """Ensure moving text between key parts changes the key."""
+    assert MarkdownRenderCache.get_key("ab", "c") != MarkdownRenderCache.get_key(
+        "a", "bc"
+    )
+
+
+def test_least_recently_used_render_evicted():
+    """Ensure the in-process cache evicts the least recently used render."""
+    cache = MarkdownRenderCache(max_size=2)
+    cache.set("first", "<p>first</p>")
+    cache.set("second", "<p>second</p>")
+
+    # using "first" again should make "second" the one that gets evicted
+    assert cache.get("first") == "<p>first</p>"
+    cache.set("third", "<p>third</p>")
+
+    assert cache.get("first") == "<p>first</p>"
+    assert cache.get("second") is None
+    assert cache.get("third") == "<p>third</p>"
+
+
+def test_render_shared_through_redis(redis):
+    """Ensure a render cached in one process's cache can be used by another one."""
+    first_cache = MarkdownRenderCache(max_size=10, redis=redis)
+    second_cache = MarkdownRenderCache(max_size=10, redis=redis)
+
+    first_cache.set("key", "<p>shared</p>")
+
+    assert second_cache.get("key") == "<p>shared</p>"
@@ -0,0 +1,134 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import os
+from datetime import timedelta
+from threading import Thread
+from time import sleep
+
+from tildes.lib.markdown import render_markdown_uncached
+from tildes.lib.markdown_executor import MarkdownRenderExecutor
+
+
+def _get_pid(markdown):
+    """Return the id of the process the "render" happened in."""
+    # pylint: disable=unused-argument
+    return os.getpid()
+
+
+def _get_parent_pid(markdown):
+    """Return the id of the parent of the process the "render" happened in."""
+    # pylint: disable=unused-argument
+    return os.getppid()
+
+
+def _slow_get_pid(markdown):
+    """Return the id of the process the "render" happened in, after a delay."""
+    # pylint: disable=unused-argument
+    sleep(0.5)
+    return os.getpid()
+
+
+def test_short_markdown_rendered_inline():
+    """Ensure markdown below the thresholds isn't sent to the pool."""
+    executor = MarkdownRenderExecutor(workers=1, min_length=100)
+
+    assert executor.render(_get_pid, "short") == os.getpid()
+
+
+def test_long_markdown_offloaded():
+    """Ensure markdown above the length threshold is rendered in the pool."""
+    executor = MarkdownRenderExecutor(workers=1, min_length=100)
+
+    try:
+        assert executor.render(_get_pid, "a" * 100) != os.getpid()
+    finally:
+        executor.shutdown()
+
+
+def test_pool_not_forked_from_current_process():
+    """Ensure the pool's processes don't inherit anything from the current one."""
+    executor = MarkdownRenderExecutor(workers=1, min_length=0)
+
+    try:
+        assert executor.render(_get_parent_pid, "markdown") != os.getpid()
+    finally:
+        executor.shutdown()
+
+
+def test_start_creates_pool():
+    """Ensure starting the executor creates the pool before any renders."""
+    executor = MarkdownRenderExecutor(workers=1)
+
+    try:
+        executor.start()
+        assert executor._pool
+    finally:
+        executor.shutdown()
+
+
+def test_start_without_workers_does_nothing():
+    """Ensure starting an executor without any workers doesn't create a pool."""
+    executor = MarkdownRenderExecutor()
+
+    executor.start()
+
+    assert not executor._pool
+
+
+def test_many_code_blocks_offloaded():
+    """Ensure markdown above the code block threshold is rendered in the pool."""
+    executor = MarkdownRenderExecutor(workers=1, min_code_blocks=2)
+
+    try:
+        assert executor.render(_get_pid, "```\na\n```\n" * 2) != os.getpid()
+    finally:
+        executor.shutdown()
+
+
+def test_no_workers_always_inline():
+    """Ensure nothing is offloaded if the executor doesn't have any workers."""
+    executor = MarkdownRenderExecutor(min_length=0)
+
+    assert executor.render(_get_pid, "a" * 100) == os.getpid()
+
+
+def test_timeout_falls_back_to_inline():
+    """Ensure a render that takes too long in the pool is done inline instead."""
+    executor = MarkdownRenderExecutor(
+        workers=1, min_length=0, timeout=timedelta(milliseconds=50)
+    )
+
+    try:
+        assert executor.render(_slow_get_pid, "markdown") == os.getpid()
+    finally:
+        executor.shutdown()
+
+
+def test_saturated_pool_falls_back_to_inline():
+    """Ensure renders are done inline while the pool is busy with other ones."""
+    executor = MarkdownRenderExecutor(workers=1, min_length=0)
+
+    try:
+        busy_thread = Thread(target=executor.render, args=(_slow_get_pid, "markdown"))
+        busy_thread.start()
+        sleep(0.1)
+
+        assert executor.render(_get_pid, "markdown") == os.getpid()
+
+        busy_thread.join()
+    finally:
+        executor.shutdown()
+
+
+def test_offloaded_render_matches_inline():
+    """Ensure rendering markdown in the pool gives the same result as inline."""
+    markdown = "# Code\n\n```python\nx = 1\n```\n\nA reference to ~group"
+    executor = MarkdownRenderExecutor(workers=1, min_length=0)
+
+    try:
+        rendered = executor.render(render_markdown_uncached, markdown)
+    finally:
+        executor.shutdown()
+
+    assert rendered == render_markdown_uncached(markdown)
@@ -0,0 +1,57 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import logging
+
+from pytest import raises
+
+from tildes.lib.markdown import render_markdown_uncached
+from tildes.lib.markdown_profiling import MarkdownStageTimings
+from tildes.metrics import get_histogram
+
+
+def _get_stage_count(stage):
+    """Return the number of markdown_stage observations for a stage."""
+    histogram = get_histogram("markdown_stage", stage=stage)
+
+    for metric in histogram.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_count"):
+                return sample.value
+
+    return 0
+
+
+def test_stages_timed_when_rendering():
+    """Ensure each stage that happened is recorded when rendering markdown."""
+    stages = ("preprocess", "cmark", "html_parse", "linkify_sanitize")
+    counts = {stage: _get_stage_count(stage) for stage in stages}
+    highlighting_count = _get_stage_count("syntax_highlighting")
+
+    render_markdown_uncached("No code blocks here")
+
+    for stage in stages:
+        assert _get_stage_count(stage) == counts[stage] + 1
+
+    assert _get_stage_count("syntax_highlighting") == highlighting_count
+
+
+def test_invalid_stage_name():
+    """Ensure timing a stage that doesn't exist raises an error."""
+    with raises(ValueError):
+        with MarkdownStageTimings().time("not_a_stage"):
+            pass
+
+
+def test_slow_render_logged(caplog):
+    """Ensure a render slower than the threshold is logged with its size."""
+    MarkdownStageTimings.slow_render_log_threshold = 0.0
+
+    try:
+        with caplog.at_level(logging.WARNING):
+            render_markdown_uncached("Some *slow* markdown")
+    finally:
+        MarkdownStageTimings.slow_render_log_threshold = None
+
+    assert "Slow markdown processing" in caplog.text
+    assert "20 chars of markdown" in caplog.text
@@ -0,0 +1,85 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+from bs4 import BeautifulSoup
+from pyramid import testing
+from pytest import fixture
+
+from tildes.lib.markdown import REFERENCE_RESOLVER, RENDER_CACHE, render_markdown
+from tildes.lib.markdown_references import (
+    MarkdownReferenceResolver,
+    MarkdownReferences,
+)
+from tildes.models.user import User
+
+
+@fixture
+def db_request(db):
+    """Handle a request (using the testing db session) for the duration of a test."""
+    request = testing.DummyRequest(db_session=db)
+    testing.setUp(request=request)
+    RENDER_CACHE.clear()
+
+    yield request
+
+    testing.tearDown()
+
+
+def _linked_hrefs(html):
+    """Return the hrefs of all the links in some HTML."""
+    soup = BeautifulSoup(html, features="html5lib")
+    return {link["href"] for link in soup.find_all("a")}
+
+
+def test_existing_references_resolved(db, session_user, session_group):
+    """Ensure only references to groups and users that exist are kept."""
+    references = MarkdownReferences(
+        frozenset({str(session_group.path), "notarealgroup"}),
+        frozenset({session_user.username.lower(), "notarealuser"}),
+    )
+    resolved = MarkdownReferenceResolver().resolve_with_session(db, references)
+
+    assert resolved.group_paths == {str(session_group.path)}
+    assert resolved.usernames == {session_user.username.lower()}
+
+
+def test_resolve_without_request():
+    """Ensure references can't be resolved when no request is being handled."""
+    resolver = MarkdownReferenceResolver()
+
+    assert not resolver.can_resolve
+    assert resolver.resolve(MarkdownReferences(frozenset({"group"}))) is None
+
+
+def test_render_in_request_resolves_references(db_request, session_user, session_group):
+    """Ensure rendering during a request only links references that exist."""
+    markdown = (
+        f"@{session_user.username} @notarealuser ~{session_group.path} ~notarealgroup"
+    )
+    hrefs = _linked_hrefs(render_markdown(markdown).html)
+
+    assert hrefs == {f"/user/{session_user.username}", f"/~{session_group.path}"}
+
+
+def test_cached_render_not_resolved_again(db_request, session_user, monkeypatch):
+    """Ensure a cached render with only existing references doesn't query again."""
+    markdown = f"Hello @{session_user.username}"
+    first = render_markdown(markdown)
+
+    def fail_resolving(*args, **kwargs):
+        raise AssertionError("References were resolved again")
+
+    monkeypatch.setattr(REFERENCE_RESOLVER, "resolve_with_session", fail_resolving)
+
+    assert render_markdown(markdown) == first
+
+
+def test_cached_render_links_new_user(db, db_request):
+    """Ensure a cached render is updated once a referenced user starts to exist."""
+    markdown = "Hello @NewlyRegistered"
+    assert not _linked_hrefs(render_markdown(markdown).html)
+
+    db.add(User("NewlyRegistered", "password"))
+    db.flush()
+
+    assert _linked_hrefs(render_markdown(markdown).html) == {"/user/NewlyRegistered"}
@@ -0,0 +1,75 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+from tildes.lib.page_cache import CachedPage, PageCache
+
+
+def test_key_depends_on_params_and_theme():
+    """Ensure pages with different params or themes get different keys."""
+    key = PageCache.get_key("home", {}, [("order", "new")], None)
+
+    assert key != PageCache.get_key("home", {}, [("order", "votes")], None)
+    assert key != PageCache.get_key("home", {}, [("order", "new")], "dracula")
+
+
+def test_key_ignores_param_order():
+    """Ensure the order of query params doesn't affect the key."""
+    params = [("order", "new"), ("per_page", "50")]
+
+    assert PageCache.get_key("home", {}, params, None) == PageCache.get_key(
+        "home", {}, list(reversed(params)), None
+    )
+
+
+def test_page_round_trip(redis):
+    """Ensure a stored page can be looked up again."""
+    cache = PageCache(redis)
+    key = PageCache.get_key("home", {}, [], None)
+
+    page, generation = cache.lookup(key, "home", {})
+    assert page is None
+
+    stored_page = CachedPage("text/html; charset=UTF-8", b"<html></html>")
+    cache.set(key, generation, stored_page)
+
+    page, _ = cache.lookup(key, "home", {})
+    assert page == stored_page
+
+
+def test_invalidating_topic(redis):
+    """Ensure invalidating a topic invalidates its page and listings."""
+    cache = PageCache(redis)
+    page = CachedPage("text/html; charset=UTF-8", b"<html></html>")
+
+    topic_matchdict = {"topic_id36": "a", "title": "something"}
+    topic_key = PageCache.get_key("topic", topic_matchdict, [], None)
+    _, generation = cache.lookup(topic_key, "topic", topic_matchdict)
+    cache.set(topic_key, generation, page)
+
+    home_key = PageCache.get_key("home", {}, [], None)
+    _, generation = cache.lookup(home_key, "home", {})
+    cache.set(home_key, generation, page)
+
+    other_matchdict = {"topic_id36": "b", "title": "other"}
+    other_key = PageCache.get_key("topic", other_matchdict, [], None)
+    _, generation = cache.lookup(other_key, "topic", other_matchdict)
+    cache.set(other_key, generation, page)
+
+    # topic ID 10 has ID36 "a"
+    cache.invalidate_topics([10])
+
+    assert cache.lookup(topic_key, "topic", topic_matchdict)[0] is None
+    assert cache.lookup(home_key, "home", {})[0] is None
+    assert cache.lookup(other_key, "topic", other_matchdict)[0] == page
+
+
+def test_page_rendered_before_invalidation_not_used(redis):
+    """Ensure a page stored with an outdated generation isn't used."""
+    cache = PageCache(redis)
+    key = PageCache.get_key("home", {}, [], None)
+
+    _, generation = cache.lookup(key, "home", {})
+    cache.invalidate_topics([1])
+    cache.set(key, generation, CachedPage("text/html", b"stale"))
+
+    assert cache.lookup(key, "home", {})[0] is None
@@ -0,0 +1,78 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+"""Tests for signed pagination cursors."""
+
+from datetime import datetime, timezone
+
+from pytest import fixture, raises
+
+from tildes.lib.pagination_cursor import PaginationCursor, PaginationCursorSigner
+
+
+@fixture
+def signer():
+    """Return a cursor signer with a secret."""
+    return PaginationCursorSigner("test_secret")
+
+
+def test_datetime_cursor_round_trip(signer):
+    """Ensure a cursor with a datetime sort value decodes to the same values."""
+    cursor = PaginationCursor(
+        "topics",
+        "created_time",
+        datetime(2021, 3, 4, 5, 6, 7, 891011, tzinfo=timezone.utc),
+        12345,
+    )
+
+    assert signer.decode(signer.encode(cursor)) == cursor
+
+
+def test_integer_cursor_round_trip(signer):
+    """Ensure a cursor with an integer sort value decodes to the same values."""
+    cursor = PaginationCursor("comments", "num_votes", 42, 678)
+
+    assert signer.decode(signer.encode(cursor)) == cursor
+
+
+def test_cursor_is_not_id36(signer):
+    """Ensure encoded cursors can be told apart from ID36s."""
+    encoded = signer.encode(PaginationCursor("topics", "num_votes", 1, 2))
+
+    assert signer.is_cursor(encoded)
+    assert not signer.is_cursor("2fb")
+
+
+def test_tampered_cursor_rejected(signer):
+    """Ensure a cursor with a modified payload fails verification."""
+    encoded = signer.encode(PaginationCursor("topics", "num_votes", 1, 2))
+    other = signer.encode(PaginationCursor("topics", "num_votes", 1000, 2))
+
+    forged = other.split(".")[0] + "." + encoded.split(".")[1]
+
+    with raises(ValueError):
+        signer.decode(forged)
+
+
+def test_cursor_from_other_secret_rejected(signer):
+    """Ensure a cursor signed with a different secret fails verification."""
+    other_signer = PaginationCursorSigner("other_secret")
+    encoded = other_signer.encode(PaginationCursor("topics", "num_votes", 1, 2))
+
+    with raises(ValueError):
+        signer.decode(encoded)
+
+
+def test_garbage_cursor_rejected(signer):
+    """Ensure a string that isn't an encoded cursor fails decoding."""
+    with raises(ValueError):
+        signer.decode("not a.cursor!")
+
+
+def test_no_secret_cant_encode():
+    """Ensure a signer without a secret can't encode cursors."""
+    signer = PaginationCursorSigner()
+
+    assert not signer.can_encode
+    with raises(ValueError):
+        signer.encode(PaginationCursor("topics", "num_votes", 1, 2))
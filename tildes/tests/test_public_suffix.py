@@ -0,0 +1,140 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import json
+
+from pytest import fixture
+
+from tildes.lib.datetime import utc_now
+from tildes.lib.public_suffix import (
+    build_suffix_trie,
+    CACHE_FORMAT_VERSION,
+    MAX_CACHE_AGE,
+    PublicSuffixList,
+    PublicSuffixListLoader,
+)
+
+
+TEST_PSL_LINES = [
+    "// comments and blank lines should be ignored",
+    "",
+    "com",
+    "uk",
+    "co.uk",
+    "jp",
+    "*.kawasaki.jp",
+    "!city.kawasaki.jp",
+    "blogspot.com",
+]
+
+
+@fixture
+def psl():
+    """Create a PublicSuffixList from the test rules."""
+    return PublicSuffixList(build_suffix_trie(TEST_PSL_LINES))
+
+
+def test_simple_domain(psl):
+    """Ensure a normal domain returns itself."""
+    assert psl.get_public_suffix("example.com") == "example.com"
+
+
+def test_subdomain_stripped(psl):
+    """Ensure subdomains are removed."""
+    assert psl.get_public_suffix("www.some.example.com") == "example.com"
+
+
+def test_multiple_label_suffix(psl):
+    """Ensure a suffix with multiple labels is handled."""
+    assert psl.get_public_suffix("www.example.co.uk") == "example.co.uk"
+
+
+def test_private_suffix(psl):
+    """Ensure a suffix that extends another suffix is handled."""
+    assert psl.get_public_suffix("someone.blogspot.com") == "someone.blogspot.com"
+
+
+def test_wildcard_rule(psl):
+    """Ensure wildcard rules are applied."""
+    assert psl.get_public_suffix("a.b.kawasaki.jp") == "a.b.kawasaki.jp"
+    assert psl.get_public_suffix("x.a.b.kawasaki.jp") == "a.b.kawasaki.jp"
+
+
+def test_exception_rule(psl):
+    """Ensure exception rules override wildcards."""
+    assert psl.get_public_suffix("www.city.kawasaki.jp") == "city.kawasaki.jp"
+
+
+def test_unknown_tld(psl):
+    """Ensure an unknown TLD is treated as a single-label suffix."""
+    assert psl.get_public_suffix("www.example.unknowntld") == "example.unknowntld"
+
+
+def test_lookup_case_insensitive(psl):
+    """Ensure domains are lowercased and a trailing period is ignored."""
+    assert psl.get_public_suffix("WWW.Example.COM.") == "example.com"
+
+
+def test_suffix_only(psl):
+    """Ensure a domain that's only a public suffix returns itself."""
+    assert psl.get_public_suffix("co.uk") == "co.uk"
+
+
+def test_loader_uses_valid_cache(tmp_path):
+    """Ensure the loader uses the cache file without refreshing if it's new."""
+    cache_path = tmp_path / "psl.json"
+    loader = PublicSuffixListLoader(str(cache_path))
+    loader._write_cache(build_suffix_trie(TEST_PSL_LINES), utc_now())
+
+    refreshes = []
+    loader.refresh = lambda: refreshes.append(True)
+    loader.refresh_in_background = lambda: refreshes.append(True)
+
+    psl = loader.get_list()
+
+    assert psl.get_public_suffix("www.example.co.uk") == "example.co.uk"
+    assert not refreshes
+
+
+def test_loader_refreshes_old_cache_in_background(tmp_path):
+    """Ensure a stale cache is still used, but a background refresh is started."""
+    cache_path = tmp_path / "psl.json"
+    loader = PublicSuffixListLoader(str(cache_path))
+    old_time = utc_now() - MAX_CACHE_AGE * 2
+    loader._write_cache(build_suffix_trie(TEST_PSL_LINES), old_time)
+
+    background_refreshes = []
+    loader.refresh_in_background = lambda: background_refreshes.append(True)
+
+    psl = loader.get_list()
+
+    assert psl.get_public_suffix("www.example.co.uk") == "example.co.uk"
+    assert background_refreshes
+
+
+def test_loader_ignores_other_cache_version(tmp_path):
+    """Ensure a cache file in a different format version isn't used."""
+    cache_path = tmp_path / "psl.json"
+    cache_path.write_text(
+        json.dumps(
+            {
+                "version": CACHE_FORMAT_VERSION + 1,
+                "fetched_time": utc_now().isoformat(),
+                "trie": {},
+            }
+        )
+    )
+
+    loader = PublicSuffixListLoader(str(cache_path))
+
+    assert loader._read_cache() is None
+
+
+def test_loader_ignores_corrupt_cache(tmp_path):
+    """Ensure a cache file that isn't valid JSON isn't used."""
+    cache_path = tmp_path / "psl.json"
+    cache_path.write_text('{"version": ')
+
+    loader = PublicSuffixListLoader(str(cache_path))
+
+    assert loader._read_cache() is None
@@ -0,0 +1,157 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+from datetime import timedelta
+
+from pytest import fixture
+
+from consumers.topic_interesting_activity_updater import (
+    MAX_INTERESTING_DEPTH,
+    TopicInterestingActivityUpdater,
+)
+from tildes.lib.event_stream import Message
+from tildes.models.comment import Comment
+
+
+@fixture
+def updater(db):
+    """Create the consumer using the test database, without connecting to Redis."""
+    updater = TopicInterestingActivityUpdater.__new__(TopicInterestingActivityUpdater)
+    updater.db_session = db
+    updater.metrics = None
+
+    return updater
+
+
+def _add_comment(db, topic, user, minutes, parent_comment=None):
+    """Add a comment to the topic, posted the number of minutes after the topic."""
+    comment = Comment(topic, user, "A comment", parent_comment=parent_comment)
+    comment.created_time = topic.created_time + timedelta(minutes=minutes)
+    db.add(comment)
+    db.commit()
+
+    return comment
+
+
+def _message(stream, comment):
+    """Create a Message from one of the comment event streams."""
+    return Message(None, stream, "0-0", {"comment_id": str(comment.comment_id)})
+
+
+def test_batch_updates_each_topic_once(
+    mocker, db, updater, text_topic, link_topic, session_user
+):
+    """Ensure a batch of events only updates each affected topic once."""
+    edited_comment = _add_comment(db, text_topic, session_user, 1)
+    new_comment_in_edited_topic = _add_comment(db, text_topic, session_user, 2)
+    new_comments = [_add_comment(db, link_topic, session_user, n) for n in (1, 2)]
+
+    mocker.spy(updater, "_update_topic")
+    mocker.spy(updater, "_update_topic_for_new_comment")
+
+    updater.process_messages(
+        [
+            _message("comments.update.markdown", edited_comment),
+            _message("comments.update.is_deleted", edited_comment),
+            _message("comment_labels.insert", edited_comment),
+            _message("comments.insert", new_comment_in_edited_topic),
+            _message("comments.insert", new_comments[0]),
+            _message("comments.insert", new_comments[1]),
+        ]
+    )
+
+    # the topic with other events gets a single full update (covering its new comment)
+    updater._update_topic.assert_called_once_with(text_topic)
+    assert text_topic.last_interesting_activity_time == (
+        new_comment_in_edited_topic.created_time
+    )
+
+    # the topic that only had new comments is updated incrementally from each of them
+    assert [
+        call.args for call in updater._update_topic_for_new_comment.call_args_list
+    ] == [(new_comments[0],), (new_comments[1],)]
+    assert link_topic.last_interesting_activity_time == new_comments[1].created_time
+
+
+def _add_reply_chain(db, topic, user, length):
+    """Add a chain of replies to a new top-level comment, each a minute apart."""
+    chain = [_add_comment(db, topic, user, 1)]
+
+    while len(chain) < length:
+        chain.append(_add_comment(db, topic, user, len(chain) + 1, chain[-1]))
+
+    return chain
+
+
+def _update_incrementally_and_fully(updater, topic, new_comment):
+    """Update the topic for a new comment both ways, and check that they match.
+
+    Returns the topic's last_interesting_activity_time after the updates.
+    """
+    updater._update_topic_for_new_comment(new_comment)
+    incremental_time = topic.last_interesting_activity_time
+
+    updater._update_topic(topic)
+    assert topic.last_interesting_activity_time == incremental_time
+
+    return incremental_time
+
+
+def test_new_top_level_comment(db, updater, topic, session_user):
+    """Ensure a new top-level comment is interesting activity."""
+    updater._update_topic(topic)
+
+    comment = _add_comment(db, topic, session_user, 1)
+
+    assert _update_incrementally_and_fully(updater, topic, comment) == (
+        comment.created_time
+    )
+
+
+def test_new_reply_at_max_interesting_depth(db, updater, topic, session_user):
+    """Ensure a new reply at the deepest interesting depth is interesting activity."""
+    chain = _add_reply_chain(db, topic, session_user, MAX_INTERESTING_DEPTH - 1)
+    updater._update_topic(topic)
+
+    reply = _add_comment(db, topic, session_user, len(chain) + 1, chain[-1])
+
+    assert _update_incrementally_and_fully(updater, topic, reply) == (
+        reply.created_time
+    )
+
+
+def _check_reply_too_deep(db, updater, topic, user, depth):
+    """Check that a new reply at the depth isn't interesting activity."""
+    chain = _add_reply_chain(db, topic, user, depth)
+    updater._update_topic(topic)
+    previous_time = topic.last_interesting_activity_time
+
+    reply = _add_comment(db, topic, user, len(chain) + 1, chain[-1])
+
+    # the deepest interesting comment in the chain should still be the latest one
+    assert previous_time == chain[MAX_INTERESTING_DEPTH - 1].created_time
+    assert _update_incrementally_and_fully(updater, topic, reply) == previous_time
+
+
+def test_new_reply_past_max_interesting_depth(db, updater, topic, session_user):
+    """Ensure a new reply just past the deepest interesting depth isn't interesting."""
+    _check_reply_too_deep(db, updater, topic, session_user, MAX_INTERESTING_DEPTH)
+
+
+def test_new_reply_far_past_max_interesting_depth(db, updater, topic, session_user):
+    """Ensure a new reply far past the deepest interesting depth isn't interesting."""
+    _check_reply_too_deep(db, updater, topic, session_user, MAX_INTERESTING_DEPTH + 2)
+
+
+def test_new_reply_under_deleted_comment(db, updater, topic, session_user):
+    """Ensure a new reply under a deleted comment is still interesting activity."""
+    chain = _add_reply_chain(db, topic, session_user, 2)
+    chain[0].is_deleted = True
+    db.commit()
+    updater._update_topic(topic)
+
+    reply = _add_comment(db, topic, session_user, len(chain) + 1, chain[-1])
+
+    assert _update_incrementally_and_fully(updater, topic, reply) == (
+        reply.created_time
+    )
@@ -0,0 +1,70 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+from tildes.enums import TopicSortOption
+from tildes.models.topic import TopicListingIndex
+
+
+def _add_to_index(redis, group_id, scores):
+    """Add topic IDs with scores directly to a group's NEW index."""
+    key = f"{TopicListingIndex.KEY_PREFIX}{group_id}:new"
+    redis.zadd(key, {str(topic_id): score for topic_id, score in scores.items()})
+
+
+def test_candidates_merged_across_groups(redis):
+    """Ensure candidates from multiple groups are merged in score order."""
+    _add_to_index(redis, 1, {10: 100.0, 11: 300.0})
+    _add_to_index(redis, 2, {20: 200.0, 21: 400.0})
+
+    index = TopicListingIndex(redis)
+    candidate_ids, is_complete = index.get_candidate_ids(
+        [1, 2], TopicSortOption.NEW, None, 3
+    )
+
+    assert candidate_ids == [21, 11, 20]
+    assert not is_complete
+
+
+def test_candidates_complete_when_all_fit(redis):
+    """Ensure the candidates are complete when every topic was returned."""
+    _add_to_index(redis, 1, {10: 100.0, 11: 300.0})
+    _add_to_index(redis, 2, {20: 200.0})
+
+    index = TopicListingIndex(redis)
+    candidate_ids, is_complete = index.get_candidate_ids(
+        [1, 2], TopicSortOption.NEW, None, 5
+    )
+
+    assert candidate_ids == [11, 20, 10]
+    assert is_complete
+
+
+def test_candidates_max_score(redis):
+    """Ensure candidates above the max score are excluded."""
+    _add_to_index(redis, 1, {10: 100.0, 11: 300.0, 12: 500.0})
+
+    index = TopicListingIndex(redis)
+    candidate_ids, _ = index.get_candidate_ids([1], TopicSortOption.NEW, 300.0, 5)
+
+    assert candidate_ids == [11, 10]
+
+
+def test_update_topics_adds_and_removes(db, redis, topic):
+    """Ensure updating the index follows a topic being deleted."""
+    index = TopicListingIndex(redis)
+    group_id = topic.group_id
+
+    index.update_topics(db, [topic.topic_id])
+    candidate_ids, _ = index.get_candidate_ids(
+        [group_id], TopicSortOption.ACTIVITY, None, 10
+    )
+    assert topic.topic_id in candidate_ids
+
+    topic.is_deleted = True
+    db.commit()
+
+    index.update_topics(db, [topic.topic_id])
+    candidate_ids, _ = index.get_candidate_ids(
+        [group_id], TopicSortOption.ACTIVITY, None, 10
+    )
+    assert topic.topic_id not in candidate_ids
@@ -0,0 +1,105 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+from pyramid.testing import DummyRequest
+
+from tildes.enums import TopicSortOption
+from tildes.lib.datetime import utc_now
+from tildes.lib.pagination_cursor import CURSOR_SIGNER, PaginationCursor
+from tildes.models.topic import TopicBookmark, TopicQuery, TopicVote
+
+
+def _explain(db, query):
+    """Return the plan Postgres would use for a query, with sorting disabled.
+
+    Sequential scans and sorts are disabled so that the plan will only avoid sorting
+    if it's able to read the rows in order from an index (since the test database is
+    too small for the planner to prefer an index otherwise).
+    """
+    connection = db.connection()
+    connection.execute("SET LOCAL enable_seqscan = off")
+    connection.execute("SET LOCAL enable_sort = off")
+
+    statement = query.statement.compile(dialect=connection.dialect)
+    result = connection.execute(f"EXPLAIN {statement}", statement.params)
+
+    return "\n".join(row[0] for row in result)
+
+
+def _listing_query(db, session_user):
+    """Return a home page listing query, for a logged-in user."""
+    request = DummyRequest(db_session=db, user=session_user)
+
+    return (
+        TopicQuery(request)
+        .exclude_ignored()
+        .batch_user_data()
+        .apply_sort_option(TopicSortOption.ACTIVITY)
+    )
+
+
+def test_batched_listing_uses_keyset_index(db, session_user):
+    """Ensure a listing with batched user data can be read from the keyset index."""
+    query = _listing_query(db, session_user).limit(51)
+
+    plan = _explain(db, query)
+
+    assert "ix_topics_last_interesting_activity_time_keyset" in plan
+    assert "Sort" not in plan
+
+
+def test_batched_listing_does_not_join_user_data(db, session_user):
+    """Ensure a listing with batched user data doesn't join the user's data."""
+    query = _listing_query(db, session_user).limit(51)
+
+    statement = str(query.statement)
+
+    assert "topic_votes" not in statement
+    assert "topic_bookmarks" not in statement
+    assert "topic_last_visits" not in statement
+
+
+def test_cursor_page_uses_keyset_index_without_anchor_lookup(db, session_user):
+    """Ensure a page after a cursor is only a comparison against the keyset index."""
+    CURSOR_SIGNER.secret = "test_secret"
+    cursor = PaginationCursor(
+        "topics", "last_interesting_activity_time", utc_now(), 12345
+    )
+    query = (
+        _listing_query(db, session_user)
+        .after_anchor(CURSOR_SIGNER.encode(cursor))
+        .limit(51)
+    )
+
+    plan = _explain(db, query)
+
+    assert "ix_topics_last_interesting_activity_time_keyset" in plan
+    assert "topics_pkey" not in plan
+    assert "Sort" not in plan
+
+
+def test_user_data_query_uses_primary_key(db, session_user):
+    """Ensure the batched user data is fetched with primary key lookups."""
+    query = _listing_query(db, session_user)._user_data_query([1, 2, 3])
+
+    plan = _explain(db, query)
+
+    assert "topics_pkey" in plan
+
+
+def test_batched_user_data_merged(db, session_user, topic):
+    """Ensure batched user data is merged onto the topics from the listing."""
+    db.add(TopicVote(session_user, topic))
+    db.add(TopicBookmark(session_user, topic))
+    db.commit()
+
+    topics = _listing_query(db, session_user).all()
+    listing_topic = next(t for t in topics if t.topic_id == topic.topic_id)
+
+    assert listing_topic.user_voted
+    assert listing_topic.user_bookmarked
+    assert not listing_topic.user_ignored
+
+    db.query(TopicVote).filter_by(topic=topic).delete()
+    db.query(TopicBookmark).filter_by(topic=topic).delete()
+    db.commit()
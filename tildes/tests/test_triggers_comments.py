@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: AGPL-3.0-or-later
 
 from tildes.models.comment import Comment
+from tildes.models.topic import TopicLastVisit
 
 
 def test_comments_affect_topic_num_comments(session_user, topic, db):
@@ -67,3 +68,55 @@ def test_remove_delete_single_decrement(db, topic, session_user):
     db.commit()
     db.refresh(topic)
     assert topic.num_comments == 1
+
+
+def test_comment_changes_increment_comments_version(db, topic, session_user):
+    """Ensure changes to comments increment the topic's comments_version."""
+    starting_version = topic.comments_version
+
+    comment = Comment(topic, session_user, "comment")
+    db.add(comment)
+    db.commit()
+    db.refresh(topic)
+    assert topic.comments_version == starting_version + 1
+
+    comment.is_removed = True
+    db.commit()
+    db.refresh(topic)
+    assert topic.comments_version == starting_version + 2
+
+
+def test_comments_affect_last_visit_num_comments(session_user, topic, db):
+    """Ensure posting and deleting comments adjusts the author's last visit."""
+    visit = TopicLastVisit(session_user, topic)
+    db.add(visit)
+    db.commit()
+    assert visit.num_comments == 0
+
+    comment = Comment(topic, session_user, "comment")
+    db.add(comment)
+    db.commit()
+    db.refresh(visit)
+    assert visit.num_comments == 1
+
+    comment.is_deleted = True
+    db.commit()
+    db.refresh(visit)
+    assert visit.num_comments == 1
+
+    db.delete(visit)
+    db.commit()
+
+
+def test_comment_votes_dont_increment_comments_version(db, topic, session_user):
+    """Ensure changes to comments' vote counts don't update the topic's version."""
+    comment = Comment(topic, session_user, "comment")
+    db.add(comment)
+    db.commit()
+    db.refresh(topic)
+    starting_version = topic.comments_version
+
+    comment.num_votes = 5
+    db.commit()
+    db.refresh(topic)
+    assert topic.comments_version == starting_version
@@ -7,9 +7,14 @@ import sentry_sdk
 from marshmallow.exceptions import ValidationError
 from paste.deploy.config import PrefixMiddleware
 from pyramid.config import Configurator
+from redis import Redis
 from sentry_sdk.integrations.pyramid import PyramidIntegration
 from webassets import Bundle
 
+from tildes.lib.markdown import RENDER_CACHE, RENDER_EXECUTOR
+from tildes.lib.markdown_profiling import MarkdownStageTimings
+from tildes.lib.pagination_cursor import CURSOR_SIGNER
+
 
 def main(global_config: dict[str, str], **settings: str) -> PrefixMiddleware:
     """Configure and return a Pyramid WSGI application."""
@@ -38,6 +43,22 @@ def main(global_config: dict[str, str], **settings: str) -> PrefixMiddleware:
 
     config.add_static_view("images", "/images")
 
+    # share rendered markdown between all the app's processes
+    RENDER_CACHE.redis = Redis(unix_socket_path=settings["redis.unix_socket_path"])
+
+    # render expensive markdown in a separate pool of processes, if enabled
+    if settings.get("tildes.markdown_render_workers"):
+        RENDER_EXECUTOR.workers = int(settings["tildes.markdown_render_workers"])
+
+    if settings.get("tildes.markdown_slow_render_log_ms"):
+        MarkdownStageTimings.slow_render_log_threshold = (
+            float(settings["tildes.markdown_slow_render_log_ms"]) / 1000
+        )
+
+    # sign pagination cursors, if enabled (otherwise ID36s are used for pagination)
+    if settings.get("tildes.pagination_cursor_secret"):
+        CURSOR_SIGNER.secret = settings["tildes.pagination_cursor_secret"]
+
     if settings.get("sentry_dsn"):
         # pylint: disable=abstract-class-instantiated
         sentry_sdk.init(
@@ -21,8 +21,8 @@ from tildes.models.topic import (
     Topic,
     TopicBookmark,
     TopicIgnore,
+    TopicLastVisit,
     TopicSchedule,
-    TopicVisit,
     TopicVote,
 )
 from tildes.models.user import User, UserGroupSettings, UserInviteCode, UserRateLimit
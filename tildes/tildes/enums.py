@@ -58,6 +58,11 @@ class CommentTreeSortOption(enum.Enum):
 
         return "most {}".format(self.name.lower())
 
+    @property
+    def depends_on_votes(self) -> bool:
+        """Return whether the comments' vote counts affect this sort's order."""
+        return self.name in ("VOTES", "RELEVANCE")
+
 
 class CommentLabelOption(enum.Enum):
     """Enum for the (site-wide) comment label options."""
@@ -2,6 +2,7 @@
 # pylint: disable=invalid-name
 
 from ctypes import c_char_p, c_int, c_size_t, c_void_p, CDLL
+from threading import local
 
 
 CMARK_DLL = CDLL("/usr/local/lib/libcmark-gfm.so")
@@ -18,6 +19,12 @@ CMARK_OPTS = (
 
 CMARK_EXTENSIONS = (b"autolink", b"strikethrough", b"table")
 
+# Also defined in cmark.h, values for the cmark_event_type enum
+CMARK_EVENT_DONE = 1
+CMARK_EVENT_ENTER = 2
+
+CMARK_RAW_HTML_NODE_TYPES = (b"html_block", b"html_inline")
+
 cmark_parser_new = CMARK_DLL.cmark_parser_new
 cmark_parser_new.restype = c_void_p
 cmark_parser_new.argtypes = (c_int,)
@@ -54,7 +61,128 @@ cmark_render_html = CMARK_DLL.cmark_render_html
 cmark_render_html.restype = c_char_p
 cmark_render_html.argtypes = (c_void_p, c_int, c_void_p)
 
+cmark_node_first_child = CMARK_DLL.cmark_node_first_child
+cmark_node_first_child.restype = c_void_p
+cmark_node_first_child.argtypes = (c_void_p,)
+
+cmark_node_next = CMARK_DLL.cmark_node_next
+cmark_node_next.restype = c_void_p
+cmark_node_next.argtypes = (c_void_p,)
+
+cmark_node_get_type_string = CMARK_DLL.cmark_node_get_type_string
+cmark_node_get_type_string.restype = c_char_p
+cmark_node_get_type_string.argtypes = (c_void_p,)
+
+cmark_iter_new = CMARK_DLL.cmark_iter_new
+cmark_iter_new.restype = c_void_p
+cmark_iter_new.argtypes = (c_void_p,)
+
+cmark_iter_next = CMARK_DLL.cmark_iter_next
+cmark_iter_next.restype = c_int
+cmark_iter_next.argtypes = (c_void_p,)
+
+cmark_iter_get_node = CMARK_DLL.cmark_iter_get_node
+cmark_iter_get_node.restype = c_void_p
+cmark_iter_get_node.argtypes = (c_void_p,)
+
+cmark_iter_free = CMARK_DLL.cmark_iter_free
+cmark_iter_free.restype = None
+cmark_iter_free.argtypes = (c_void_p,)
+
 register = CMARK_EXT_DLL.cmark_gfm_core_extensions_ensure_registered
 register.restype = None
 register.argtypes = ()
 register()
+
+
+# Look up the extensions once, since the registered extensions never change after this.
+# These are pointers into the library's own registry, so they stay valid for the life of
+# the process (including in forked children).
+CMARK_EXTENSION_POINTERS = tuple(
+    cmark_find_syntax_extension(name) for name in CMARK_EXTENSIONS
+)
+
+# cmark_parser_finish() resets the parser (keeping its options and extensions) so that
+# it can be used for another document, but a single parser can't be used by multiple
+# threads at once, so each thread gets its own
+_THREAD_STATE = local()
+
+
+def _get_thread_parser() -> int:
+    """Return this thread's parser, creating it if it doesn't exist yet.
+
+    Parsers are never freed, but there's only one per thread and threads are long-lived
+    (generally for the life of the process).
+    """
+    try:
+        return _THREAD_STATE.parser
+    except AttributeError:
+        pass
+
+    parser = cmark_parser_new(CMARK_OPTS)
+    for extension in CMARK_EXTENSION_POINTERS:
+        cmark_parser_attach_syntax_extension(parser, extension)
+
+    _THREAD_STATE.parser = parser
+    _THREAD_STATE.extensions = cmark_parser_get_syntax_extensions(parser)
+
+    return parser
+
+
+def render_markdown_to_html(markdown_bytes: bytes) -> bytes:
+    """Parse markdown with this thread's parser and return it rendered as HTML."""
+    parser = _get_thread_parser()
+
+    cmark_parser_feed(parser, markdown_bytes, len(markdown_bytes))
+    doc = cmark_parser_finish(parser)
+
+    try:
+        return cmark_render_html(doc, CMARK_OPTS, _THREAD_STATE.extensions)
+    finally:
+        cmark_node_free(doc)
+
+
+def render_markdown_to_html_blocks(markdown_bytes: bytes) -> list[bytes]:
+    """Parse markdown and return each of its top-level blocks rendered as HTML.
+
+    Joining the blocks together gives the same HTML as rendering the whole document, but
+    blocks that are the same as in another document can be processed separately (such
+    as when previewing edits to a long document).
+
+    If the document contains any raw HTML it's returned as a single block, since tags
+    from raw HTML can affect the parsing of other blocks once they're combined.
+    """
+    parser = _get_thread_parser()
+
+    cmark_parser_feed(parser, markdown_bytes, len(markdown_bytes))
+    doc = cmark_parser_finish(parser)
+
+    try:
+        if b"<" in markdown_bytes and _contains_raw_html(doc):
+            return [cmark_render_html(doc, CMARK_OPTS, _THREAD_STATE.extensions)]
+
+        blocks = []
+
+        node = cmark_node_first_child(doc)
+        while node:
+            blocks.append(cmark_render_html(node, CMARK_OPTS, _THREAD_STATE.extensions))
+            node = cmark_node_next(node)
+
+        return blocks
+    finally:
+        cmark_node_free(doc)
+
+
+def _contains_raw_html(doc: int) -> bool:
+    """Return whether a parsed document contains any raw HTML nodes."""
+    iterator = cmark_iter_new(doc)
+
+    try:
+        while cmark_iter_next(iterator) != CMARK_EVENT_DONE:
+            node_type = cmark_node_get_type_string(cmark_iter_get_node(iterator))
+            if node_type in CMARK_RAW_HTML_NODE_TYPES:
+                return True
+    finally:
+        cmark_iter_free(iterator)
+
+    return False
@@ -3,10 +3,13 @@
 
 """Contains classes related to handling the Redis-based event streams."""
 
+import asyncio
 import os
 from abc import abstractmethod
+from collections import defaultdict
 from collections.abc import Sequence
 from configparser import ConfigParser
+from time import monotonic
 from typing import Any, Optional
 
 from prometheus_client import CollectorRegistry, Counter, start_http_server
@@ -18,6 +21,18 @@ from tildes.lib.string import camelcase_to_snakecase
 REDIS_KEY_PREFIX = "event_stream:"
 MAX_RETRIES_PER_MESSAGE = 3
 
+# Each additional worker process for a consumer serves its metrics on a port this much
+# higher than the previous one, so workers don't collide with each other or with the
+# other consumers (which all use consecutive METRICS_PORT values)
+METRICS_PORT_WORKER_OFFSET = 100
+
+# Pending messages belonging to another worker that have been idle for longer than this
+# are assumed to have been left behind by a worker that died (or was scaled down)
+RECLAIM_MIN_IDLE_MS = 5 * 60 * 1000
+
+# How often (in milliseconds) each worker checks for messages it should reclaim
+RECLAIM_INTERVAL_MS = 60 * 1000
+
 
 class Message:
     """Represents a single message taken from a stream."""
@@ -46,10 +61,23 @@ class EventStreamConsumer:
     connecting to Redis, creating the consumer group and the relevant streams, and
     (optionally) connecting to the database to be able to fetch and modify data as
     necessary. It relies on the environment variable INI_FILE being set.
+
+    Multiple worker processes can consume from the same consumer group by running them
+    with different values in the CONSUMER_WORKER_NUMBER environment variable (which
+    defaults to 1 if it's not set). Each worker periodically reclaims messages that
+    have been left pending for too long by other workers.
     """
 
     METRICS_PORT: Optional[int] = None
 
+    # Maximum number of messages to process before committing the transaction and
+    # acking them all at once. Leaving this at 1 processes each message individually.
+    BATCH_SIZE: int = 1
+
+    # When batching, how long to wait (in milliseconds) for more new messages to fill
+    # up a batch after the first one arrives before processing a partial batch.
+    BATCH_MAX_WAIT_MS: int = 0
+
     def __init__(
         self,
         consumer_group: str,
@@ -70,8 +98,11 @@ class EventStreamConsumer:
             f"{REDIS_KEY_PREFIX}{stream}" for stream in source_streams
         ]
 
-        # hardcoded for now, will need to change for multiple consumers in same group
-        self.name = f"{consumer_group}-1"
+        self.worker_number = int(os.environ.get("CONSUMER_WORKER_NUMBER", 1))
+        if self.worker_number < 1:
+            raise ValueError("CONSUMER_WORKER_NUMBER must be 1 or higher")
+
+        self.name = f"{consumer_group}-{self.worker_number}"
 
         # create all the consumer groups and streams (if necessary)
         for stream in self.source_streams:
@@ -91,6 +122,8 @@ class EventStreamConsumer:
         # start by reading any already-pending messages by default
         self.is_reading_pending = not skip_pending
 
+        self.next_reclaim_time = 0.0
+
         self._init_metrics()
 
     @property
@@ -103,7 +136,8 @@ class EventStreamConsumer:
         """Initialize this consumer's metrics, registry, and launch HTTP server.
 
         Requires class property METRICS_PORT to be set, otherwise it just sets
-        self.metrics to None (and will crash if the port is already in use).
+        self.metrics to None (and will crash if the port is already in use). Workers
+        after the first one use ports offset by METRICS_PORT_WORKER_OFFSET.
         """
         if not self.METRICS_PORT:
             self.metrics = None
@@ -119,11 +153,16 @@ class EventStreamConsumer:
             ),
         }
 
-        start_http_server(self.METRICS_PORT, registry=self.metrics_registry)
+        port = self.METRICS_PORT + (self.worker_number - 1) * METRICS_PORT_WORKER_OFFSET
+        start_http_server(port, registry=self.metrics_registry)
 
     def consume_streams(self) -> None:
         """Process messages from the streams indefinitely."""
         while True:
+            if monotonic() >= self.next_reclaim_time:
+                self._reclaim_idle_messages()
+                self.next_reclaim_time = monotonic() + RECLAIM_INTERVAL_MS / 1000
+
             if self.is_reading_pending:
                 # clear out any persistently-failing messages first
                 self._clear_dead_messages()
@@ -136,18 +175,73 @@ class EventStreamConsumer:
             else:
                 messages = self._get_messages(pending=False)
 
+            if not messages:
+                continue
+
+            # pending messages are always retried individually, so that a message that's
+            # failing consistently doesn't also use up the retries of other messages
+            if self.is_reading_pending or len(messages) == 1:
+                for message in messages:
+                    self._process_single(message)
+            else:
+                self._process_batch(messages)
+
+    def _process_single(self, message: Message) -> None:
+        """Process a single message, then commit and ack it."""
+        self.process_message(message)
+
+        # after processing finishes, commit the transaction and ack the message
+        if self.db_session:
+            self.db_session.commit()
+
+        message.ack(self.consumer_group)
+
+        if self.metrics:
+            counter = self.metrics["messages_counter"]
+            counter.inc()
+
+    def _process_batch(self, messages: list[Message]) -> None:
+        """Process a batch of messages with a single commit and a pipelined ack.
+
+        If anything fails while processing the batch, the transaction is rolled back
+        and the messages are processed again individually, in order. If one of them
+        fails again, its exception is raised the same as it would have been without
+        batching, and it and any messages after it are left pending. Pending messages
+        are read and retried one at a time, so only the failing message's delivery
+        count goes up on each retry, and _clear_dead_messages() can handle it normally.
+        """
+        try:
+            self.process_messages(messages)
+
+            if self.db_session:
+                self.db_session.commit()
+        except Exception:  # pylint: disable=broad-except
+            if self.db_session:
+                self.db_session.rollback()
+
             for message in messages:
-                self.process_message(message)
+                self._process_single(message)
 
-                # after processing finishes, commit the transaction and ack the message
-                if self.db_session:
-                    self.db_session.commit()
+            return
+
+        self._ack_messages(messages)
 
-                message.ack(self.consumer_group)
+        if self.metrics:
+            counter = self.metrics["messages_counter"]
+            counter.inc(len(messages))
 
-                if self.metrics:
-                    counter = self.metrics["messages_counter"]
-                    counter.inc()
+    def _ack_messages(self, messages: list[Message]) -> None:
+        """Acknowledge multiple messages, using a single XACK for each stream."""
+        message_ids_by_stream = defaultdict(list)
+        for message in messages:
+            message_ids_by_stream[message.stream].append(message.message_id)
+
+        pipeline = self.redis.pipeline(transaction=False)
+        for stream, message_ids in message_ids_by_stream.items():
+            pipeline.xack(
+                f"{REDIS_KEY_PREFIX}{stream}", self.consumer_group, *message_ids
+            )
+        pipeline.execute()
 
     def _clear_dead_messages(self) -> None:
         """Clear any pending messages that have failed too many times.
@@ -182,10 +276,65 @@ class EventStreamConsumer:
                     message_ids=[entry["message_id"]],
                 )
 
+    def _reclaim_idle_messages(self) -> None:
+        """Claim messages that other workers have left pending for too long.
+
+        This uses XPENDING's IDLE filter to find messages that were delivered to other
+        workers in the group a long time ago but never acked (most likely because that
+        worker died), and XCLAIMs them for this worker. They'll then be processed
+        through the normal pending-messages path, including the dead message handling.
+
+        This is similar to what XAUTOCLAIM does, but that would also claim messages
+        that _clear_dead_messages() has deliberately parked with the -dead consumer.
+        """
+        dead_consumer_name = f"{self.consumer_group}-dead"
+
+        for stream in self.source_streams:
+            # redis-py's xpending_range() doesn't support XPENDING's IDLE argument, so
+            # the command is sent manually (parse_detail gives the same result format)
+            response = self.redis.execute_command(
+                "XPENDING",
+                stream,
+                self.consumer_group,
+                "IDLE",
+                RECLAIM_MIN_IDLE_MS,
+                "-",
+                "+",
+                100,
+                parse_detail=True,
+            )
+
+            message_ids = [
+                entry["message_id"]
+                for entry in response
+                if entry["consumer"].decode("utf-8")
+                not in (self.name, dead_consumer_name)
+            ]
+            if not message_ids:
+                continue
+
+            # XCLAIM re-checks the idle time, so if another worker already reclaimed
+            # any of these messages, they won't be claimed a second time here
+            claimed = self.redis.xclaim(
+                stream,
+                self.consumer_group,
+                self.name,
+                min_idle_time=RECLAIM_MIN_IDLE_MS,
+                message_ids=message_ids,
+                justid=True,
+            )
+
+            if claimed:
+                self.is_reading_pending = True
+
     def _xreadgroup_response_to_messages(self, response: Any) -> list[Message]:
         """Convert a response from XREADGROUP to a list of Messages."""
         messages = []
 
+        # XREADGROUP returns nothing if it blocked until the timeout without messages
+        if not response:
+            return messages
+
         # responses come back in an ugly format, a list of (one for each stream):
         # [b'<stream name>', [(b'<entry id>', {<entry fields, all bytestrings>})]]
         for stream_response in response:
@@ -208,32 +357,158 @@ class EventStreamConsumer:
     def _get_messages(self, pending: bool = False) -> list[Message]:
         """Get any messages from the streams for this consumer.
 
-        This method will return at most one message from each of the source streams per
-        call.
+        This method will return at most BATCH_SIZE messages from each of the source
+        streams per call.
 
         If pending is True, the messages will be ones previously delivered to this
-        consumer but not acked.
+        consumer but not acked, and only one message will be returned from each of the
+        source streams (reading a message again counts as another delivery of it).
 
         If pending is False, messages will be ones that haven't been delivered to any
-        consumer in this group, and this method will block indefinitely until there are
-        messages available.
+        consumer in this group, and this method will block until there are messages
+        available, or until it's time to check for messages to reclaim again. If
+        batching is enabled, it will then keep waiting up to BATCH_MAX_WAIT_MS for more
+        messages to fill the rest of the batch.
         """
         if pending:
             message_id = "0"
+            count = 1
         else:
             message_id = ">"
+            count = self.BATCH_SIZE
 
         response = self.redis.xreadgroup(
             self.consumer_group,
             self.name,
             {stream: message_id for stream in self.source_streams},
-            count=1,
-            block=0,
+            count=count,
+            block=RECLAIM_INTERVAL_MS,
         )
+        messages = self._xreadgroup_response_to_messages(response)
 
-        return self._xreadgroup_response_to_messages(response)
+        # reading pending messages again would just return the same ones, so only try
+        # to fill up the batch when reading new messages
+        if pending or self.BATCH_MAX_WAIT_MS <= 0:
+            return messages
+
+        deadline = monotonic() + self.BATCH_MAX_WAIT_MS / 1000
+        while len(messages) < self.BATCH_SIZE:
+            remaining_ms = int((deadline - monotonic()) * 1000)
+            if remaining_ms <= 0:
+                break
+
+            response = self.redis.xreadgroup(
+                self.consumer_group,
+                self.name,
+                {stream: message_id for stream in self.source_streams},
+                count=self.BATCH_SIZE - len(messages),
+                block=remaining_ms,
+            )
+
+            # XREADGROUP returns nothing if the block times out without any messages
+            if not response:
+                break
+
+            messages.extend(self._xreadgroup_response_to_messages(response))
+
+        return messages
+
+    def process_messages(self, messages: list[Message]) -> None:
+        """Process a batch of messages from the streams.
+
+        By default this just processes each of the messages individually, but
+        subclasses can override it to handle a whole batch more efficiently (for
+        example, to avoid doing redundant work for multiple related messages).
+        """
+        for message in messages:
+            self.process_message(message)
 
     @abstractmethod
     def process_message(self, message: Message) -> None:
         """Process a message from the stream (subclasses must implement)."""
         pass
+
+
+class AsyncEventStreamConsumer(EventStreamConsumer):
+    """Base class for consumers that process multiple messages concurrently.
+
+    This is intended for consumers that spend most of their time waiting on I/O, such
+    as requests to external APIs. Messages are read in batches of up to BATCH_SIZE, and
+    then processed concurrently (with at most MAX_CONCURRENCY at once) by running the
+    process_message_async() coroutine for each of them on an asyncio event loop.
+
+    Blocking calls inside process_message_async() should be wrapped with
+    asyncio.to_thread() so that they don't block the other messages. Database access
+    should *not* be done inside those threads though, since all the messages share the
+    same database session. Each message is committed and acked as soon as it finishes,
+    so any database writes should be done after the last await, where they can't be
+    interleaved with another message's processing.
+    """
+
+    BATCH_SIZE = 20
+    BATCH_MAX_WAIT_MS = 1000
+
+    # maximum number of messages that will be processed at the same time
+    MAX_CONCURRENCY = 10
+
+    def _process_batch(self, messages: list[Message]) -> None:
+        """Process a batch of messages concurrently, finishing each one separately.
+
+        Unlike the base class, the batch doesn't share a single commit: each message is
+        committed and acked as soon as its processing finishes, and a message that
+        fails is rolled back and left pending. This way, a failure doesn't cause the
+        rest of the batch's (possibly slow or paid) external requests to be repeated.
+        The first failure is still raised once the rest of the batch has finished, the
+        same as a failing message would be if it was processed individually.
+        """
+        asyncio.run(self._process_messages_concurrently(messages))
+
+    async def _process_messages_concurrently(self, messages: list[Message]) -> None:
+        """Run process_message_async() for all the messages, with limited concurrency.
+
+        Each message is committed and acked when it finishes successfully, or rolled
+        back if it fails. If processing any of the messages fails, this waits for all
+        of the others to finish before raising the first exception (so that nothing is
+        left running in the background when the message gets retried).
+        """
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENCY)
+
+        async def process_with_limit(message: Message) -> None:
+            async with semaphore:
+                try:
+                    await self.process_message_async(message)
+                except Exception:
+                    if self.db_session:
+                        self.db_session.rollback()
+                    raise
+
+            self._finish_message(message)
+
+        results = await asyncio.gather(
+            *[process_with_limit(message) for message in messages],
+            return_exceptions=True,
+        )
+
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    def _finish_message(self, message: Message) -> None:
+        """Commit the transaction and ack a single message from a batch."""
+        if self.db_session:
+            self.db_session.commit()
+
+        self._ack_messages([message])
+
+        if self.metrics:
+            counter = self.metrics["messages_counter"]
+            counter.inc()
+
+    def process_message(self, message: Message) -> None:
+        """Process a single message by running its coroutine to completion."""
+        asyncio.run(self.process_message_async(message))
+
+    @abstractmethod
+    async def process_message_async(self, message: Message) -> None:
+        """Process a message from the stream (subclasses must implement)."""
+        pass
@@ -0,0 +1,106 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+"""Functions related to committing to git repos."""
+
+from collections.abc import Sequence
+from pathlib import PurePosixPath
+from typing import NamedTuple, Optional
+
+from pygit2 import (
+    GIT_FILEMODE_BLOB,
+    GIT_FILEMODE_TREE,
+    Oid,
+    Repository,
+    Signature,
+    Tree,
+)
+
+
+class GitFileEdit(NamedTuple):
+    """A change to a single file, with its content already stored as a blob."""
+
+    file_path: str
+    blob_id: str
+    author_name: str
+    message: str
+    edit_time: int
+
+
+def commit_file_edits(repo: Repository, edits: Sequence[GitFileEdit]) -> list[Oid]:
+    """Commit each of the edits (in order) on top of HEAD, and return the commit ids.
+
+    The commits are built directly from tree objects, so neither the index nor the
+    working tree are read or written, and the HEAD branch is only updated once, after
+    all the commits have been created.
+
+    Edits whose blob is already the file's content in the latest tree are skipped,
+    since committing them would only create empty commits (this will happen if the same
+    edits are committed again after a failure).
+    """
+    parent_id = repo.head.target
+    tree = repo[parent_id].tree
+    commit_ids = []
+
+    for edit in edits:
+        blob_id = Oid(hex=edit.blob_id)
+        path_parts = PurePosixPath(edit.file_path).parts
+
+        if _get_entry_id(repo, tree, path_parts) == blob_id:
+            continue
+
+        tree = repo[_insert_blob(repo, tree, path_parts, blob_id)]
+
+        author = Signature(edit.author_name, edit.author_name, edit.edit_time, 0)
+        parent_id = repo.create_commit(
+            None, author, author, edit.message, tree.id, [parent_id]
+        )
+        commit_ids.append(parent_id)
+
+    if commit_ids:
+        repo.references[repo.head.name].set_target(parent_id)
+
+    return commit_ids
+
+
+def _get_entry_id(
+    repo: Repository, tree: Optional[Tree], path_parts: Sequence[str]
+) -> Optional[Oid]:
+    """Return the id of the object at a path inside a tree, or None if there's none."""
+    if not path_parts:
+        return None
+
+    for part in path_parts:
+        if tree is None or part not in tree:
+            return None
+
+        entry = repo[tree[part].id]
+        tree = entry if isinstance(entry, Tree) else None
+
+    return entry.id
+
+
+def _insert_blob(
+    repo: Repository, tree: Optional[Tree], path_parts: Sequence[str], blob_id: Oid
+) -> Oid:
+    """Write a new tree with a blob inserted at the path, and return the tree's id.
+
+    Only the trees along the path need to be written, since all the other entries are
+    re-used from the existing tree.
+    """
+    builder = repo.TreeBuilder(tree) if tree is not None else repo.TreeBuilder()
+    name = path_parts[0]
+
+    if len(path_parts) == 1:
+        builder.insert(name, blob_id, GIT_FILEMODE_BLOB)
+    else:
+        subtree = None
+        if tree is not None and name in tree:
+            entry = repo[tree[name].id]
+            if isinstance(entry, Tree):
+                subtree = entry
+
+        subtree_id = _insert_blob(repo, subtree, path_parts[1:], blob_id)
+        builder.insert(name, subtree_id, GIT_FILEMODE_TREE)
+
+    return builder.write()
@@ -30,3 +30,17 @@ def add_anchors_to_headings(html: str) -> str:
 
     # html5lib adds <html> and <body> tags around the fragment, strip them back out
     return "".join([str(tag) for tag in soup.body.children])
+
+
+def get_linked_usernames(html: str) -> frozenset[str]:
+    """Return the (lowercased) usernames of the user references linked in HTML.
+
+    These are the references that were found to be valid (and existing) users when the
+    markdown was rendered, so they don't need to be extracted and checked again.
+    """
+    soup = BeautifulSoup(html, features="html5lib")
+
+    return frozenset(
+        link["href"].removeprefix("/user/").lower()
+        for link in soup.find_all("a", class_="link-user", href=True)
+    )
@@ -3,38 +3,39 @@
 
 """Functions/constants related to markdown handling."""
 
+import json
 import re
-from collections.abc import Callable, Iterator
-from functools import partial
-from typing import Any, Optional, Union
+from collections.abc import Callable, Iterator, Sequence
+from functools import lru_cache, partial
+from html import unescape
+from threading import local
+from time import perf_counter
+from typing import Any, NamedTuple, Optional, Union
+from xml.etree.ElementTree import Element
 
 import bleach
-from bs4 import BeautifulSoup
+from bleach.html5lib_shim import BleachHTMLParser
+from bleach.sanitizer import BleachSanitizerFilter
 from html5lib.filters.base import Filter
 from html5lib.treewalkers.base import NonRecursiveTreeWalker
 from pygments import highlight
 from pygments.formatters import HtmlFormatter
+from pygments.lexer import Lexer
 from pygments.lexers import get_lexer_by_name, PhpLexer
 from pygments.util import ClassNotFound
 
 from tildes.enums import HTMLSanitizationContext
-from tildes.metrics import histogram_timer
+from tildes.metrics import get_histogram
 from tildes.schemas.group import is_valid_group_path
 from tildes.schemas.user import is_valid_username
 
-from .cmark import (
-    CMARK_EXTENSIONS,
-    cmark_find_syntax_extension,
-    cmark_node_free,
-    CMARK_OPTS,
-    cmark_parser_attach_syntax_extension,
-    cmark_parser_feed,
-    cmark_parser_finish,
-    cmark_parser_free,
-    cmark_parser_get_syntax_extensions,
-    cmark_parser_new,
-    cmark_render_html,
-)
+from .string import simplify_string
+
+from .cmark import render_markdown_to_html, render_markdown_to_html_blocks
+from .markdown_cache import MarkdownRenderCache
+from .markdown_executor import MarkdownRenderExecutor
+from .markdown_profiling import MarkdownStageTimings
+from .markdown_references import MarkdownReferenceResolver, MarkdownReferences
 
 
 def allow_syntax_highlighting_classes(tag: str, name: str, value: str) -> bool:
@@ -122,38 +123,300 @@ STRIP_IMAGE_ELEMENTS_REGEX = re.compile(r'<img src="([^"<>]*?)" alt="([^"<>]*?)"
 
 SUBSEQUENT_BLOCKQUOTES_REGEX = re.compile("^>([^\n]*?)\n\n(?=>)", flags=re.MULTILINE)
 
+# list of tag names to exclude from linkification
+LINKIFY_SKIPPED_TAGS = ("code", "pre")
+
+# list of tag names to exclude from the text used for excerpts (quotes and deleted text
+# usually aren't representative of what the text itself is saying)
+EXCERPT_SKIPPED_TAGS = ("blockquote", "del")
+
+# Increment this whenever a change affects the HTML generated from markdown, so that
+# renders cached by the previous version will no longer be used.
+MARKDOWN_PIPELINE_VERSION = 4
+
+# The redis connection is set during app startup (processes that don't set one will
+# only use the in-process cache)
+RENDER_CACHE = MarkdownRenderCache(max_size=2000)
+
+# References are only checked for existence while handling a request (other processes
+# will linkify all group and user references that are valid)
+REFERENCE_RESOLVER = MarkdownReferenceResolver()
+
+# The number of workers is set during app startup (processes that don't set any will
+# render everything inline)
+RENDER_EXECUTOR = MarkdownRenderExecutor()
+
+
+class RenderedMarkdown(NamedTuple):
+    """The results of rendering markdown: sanitized HTML and its text for excerpts."""
+
+    html: str
+    excerpt_text: str
+
 
-@histogram_timer("markdown_processing")
 def convert_markdown_to_safe_html(
     markdown: str, context: Optional[HTMLSanitizationContext] = None
 ) -> str:
-    """Convert markdown to sanitized HTML."""
+    """Convert markdown to sanitized HTML, using a cached render if possible."""
+    return render_markdown(markdown, context).html
+
+
+def render_markdown(
+    markdown: str, context: Optional[HTMLSanitizationContext] = None
+) -> RenderedMarkdown:
+    """Render markdown to sanitized HTML and excerpt text, using the cache if possible.
+
+    Renders are cached by a hash of the markdown, sanitization context, pipeline
+    version and whether its group/user references were checked for existence, so
+    converting identical markdown again (for previews, edits that didn't change
+    anything, re-renders, etc.) doesn't need to repeat any of the processing. Renders
+    that aren't cached and are expensive may be done in another process (see
+    RENDER_EXECUTOR).
+
+    Groups and users don't stop existing, so a cached render only needs its references
+    checked again if some of them didn't exist when it was rendered. It's rendered
+    again if any of those have started to exist since.
+    """
+    start_time = perf_counter()
+
+    references = extract_references(markdown)
+    is_resolving = bool(
+        (references.group_paths or references.usernames)
+        and REFERENCE_RESOLVER.can_resolve
+    )
+
+    cache_key = RENDER_CACHE.get_key(
+        str(MARKDOWN_PIPELINE_VERSION),
+        context.name if context else "",
+        "resolved" if is_resolving else "",
+        markdown,
+    )
+
+    rendered = None
+    existing_references = None
+
+    cached_render = RENDER_CACHE.get(cache_key)
+    if cached_render is not None:
+        html, excerpt_text, group_paths, usernames = json.loads(cached_render)
+        rendered = RenderedMarkdown(html, excerpt_text)
+
+        if is_resolving:
+            existing_references = MarkdownReferences(
+                frozenset(group_paths), frozenset(usernames)
+            )
+            updated_references = _get_updated_references(
+                references, existing_references
+            )
+
+            # if any references have started to exist, it needs to be rendered again
+            if updated_references is not None:
+                rendered = None
+                existing_references = updated_references
+    elif is_resolving:
+        existing_references = REFERENCE_RESOLVER.resolve(references)
+
+    if rendered is not None:
+        cache_result = "hit"
+    else:
+        rendered = RENDER_EXECUTOR.render(
+            render_markdown_uncached, markdown, context, existing_references
+        )
+
+        cached_references = existing_references or MarkdownReferences()
+        RENDER_CACHE.set(
+            cache_key,
+            json.dumps(
+                [
+                    *rendered,
+                    sorted(cached_references.group_paths),
+                    sorted(cached_references.usernames),
+                ]
+            ),
+        )
+        cache_result = "miss"
+
+    get_histogram("markdown_processing", cache=cache_result).observe(
+        perf_counter() - start_time
+    )
+
+    return rendered
+
+
+def render_markdown_uncached(
+    markdown: str,
+    context: Optional[HTMLSanitizationContext] = None,
+    existing_references: Optional[MarkdownReferences] = None,
+) -> RenderedMarkdown:
+    """Render markdown to sanitized HTML and excerpt text, doing the full processing.
+
+    If existing_references is set, only the group and user references in it will be
+    linkified (see REFERENCE_RESOLVER). Otherwise, all valid references will be.
+    """
+    timings = MarkdownStageTimings()
+
     # apply custom pre-processing to markdown
-    markdown = preprocess_markdown(markdown)
+    with timings.time("preprocess"):
+        processed_markdown = preprocess_markdown(markdown)
 
-    markdown_bytes = markdown.encode("utf8")
+    with timings.time("cmark"):
+        markdown_bytes = processed_markdown.encode("utf8")
+        html_bytes = render_markdown_to_html(markdown_bytes)
+        html = html_bytes.decode("utf8")
 
-    parser = cmark_parser_new(CMARK_OPTS)
-    for name in CMARK_EXTENSIONS:
-        ext = cmark_find_syntax_extension(name)
-        cmark_parser_attach_syntax_extension(parser, ext)
-    exts = cmark_parser_get_syntax_extensions(parser)
+    # apply custom post-processing, linkification and sanitization to the HTML
+    rendered = postprocess_markdown_html(html, context, existing_references, timings)
 
-    cmark_parser_feed(parser, markdown_bytes, len(markdown_bytes))
-    doc = cmark_parser_finish(parser)
+    timings.record(len(markdown), len(rendered.html))
 
-    html_bytes = cmark_render_html(doc, CMARK_OPTS, exts)
+    return rendered
 
-    cmark_parser_free(parser)
-    cmark_node_free(doc)
 
-    html = html_bytes.decode("utf8")
+def render_markdown_preview(
+    markdown: str, context: Optional[HTMLSanitizationContext] = None
+) -> str:
+    """Render markdown to sanitized HTML for a preview, only processing changed blocks.
 
-    # apply custom post-processing to HTML
-    html = postprocess_markdown_html(html)
+    Previews of the same document are usually requested repeatedly while it's being
+    written, with most of it unchanged each time. The document is split into its
+    top-level blocks and each block's post-processing (syntax highlighting,
+    linkification and sanitization, the slow parts) is cached separately, so only the
+    blocks that changed since the previous preview need to be processed again.
+
+    The resulting HTML is the same as from convert_markdown_to_safe_html().
+    """
+    timings = MarkdownStageTimings()
+
+    with timings.time("preprocess"):
+        processed_markdown = preprocess_markdown(markdown)
+
+    existing_references = REFERENCE_RESOLVER.resolve(
+        extract_references(processed_markdown)
+    )
+
+    with timings.time("cmark"):
+        html_blocks_bytes = render_markdown_to_html_blocks(
+            processed_markdown.encode("utf8")
+        )
+
+    html_blocks = []
+
+    for block_bytes in html_blocks_bytes:
+        block_html = block_bytes.decode("utf8")
+
+        # only include the references that could be in this block, so that changing
+        # the references in one block doesn't change the cache keys for the others
+        block_references = None
+        if existing_references is not None:
+            possible_references = extract_references(block_html)
+            block_references = MarkdownReferences(
+                existing_references.group_paths & possible_references.group_paths,
+                existing_references.usernames & possible_references.usernames,
+            )
+
+        cache_key = RENDER_CACHE.get_key(
+            str(MARKDOWN_PIPELINE_VERSION),
+            "preview_block",
+            context.name if context else "",
+            _get_references_key(block_references),
+            block_html,
+        )
+
+        processed_html = RENDER_CACHE.get(cache_key)
+        if processed_html is None:
+            processed_html = postprocess_markdown_html(
+                block_html, context, block_references, timings
+            ).html
+            RENDER_CACHE.set(cache_key, processed_html)
+
+        html_blocks.append(processed_html)
+
+    html = "".join(html_blocks)
+
+    timings.record(len(markdown), len(html))
+
+    return html
+
+
+def _get_references_key(existing_references: Optional[MarkdownReferences]) -> str:
+    """Return a string for the existing references, for use in render cache keys."""
+    if existing_references is None:
+        return ""
+
+    return json.dumps(
+        [sorted(existing_references.group_paths), sorted(existing_references.usernames)]
+    )
+
+
+def _get_updated_references(
+    references: MarkdownReferences, existing_references: MarkdownReferences
+) -> Optional[MarkdownReferences]:
+    """Return the existing references updated with any others that exist now.
+
+    Only the references that didn't exist before need to be checked, since groups and
+    users don't stop existing. Returns None if none of them exist yet (or there weren't
+    any to check), so the existing references haven't changed.
+    """
+    missing_references = MarkdownReferences(
+        references.group_paths - existing_references.group_paths,
+        references.usernames - existing_references.usernames,
+    )
+    if not (missing_references.group_paths or missing_references.usernames):
+        return None
+
+    new_references = REFERENCE_RESOLVER.resolve(missing_references)
+    if new_references is None or not (
+        new_references.group_paths or new_references.usernames
+    ):
+        return None
+
+    return MarkdownReferences(
+        existing_references.group_paths | new_references.group_paths,
+        existing_references.usernames | new_references.usernames,
+    )
+
+
+def extract_references(markdown: str) -> MarkdownReferences:
+    """Return all the valid group paths and usernames referenced in markdown.
+
+    These are all the references that might be linkified (some may not be, such as ones
+    inside code blocks), and the usernames are also used for generating mentions.
+    """
+    group_paths = frozenset(
+        group_path.lower()
+        for group_path in LinkifyFilter.GROUP_REFERENCE_REGEX.findall(markdown)
+        if is_linkable_group_path(group_path.lower())
+    )
+
+    usernames = frozenset(
+        username.lower()
+        for username in LinkifyFilter.USERNAME_REFERENCE_REGEX.findall(markdown)
+        if is_linkable_username(username)
+    )
+
+    return MarkdownReferences(group_paths, usernames)
 
-    # add linkification and sanitize the final HTML before returning it
-    return linkify_and_sanitize_html(html, context)
+
+@lru_cache(maxsize=1000)
+def is_linkable_group_path(group_path: str) -> bool:
+    """Return whether a (lowercased) group path can be linkified.
+
+    The validity check is relatively slow and the same groups are referenced frequently,
+    so the results are cached.
+    """
+    # Even though they're technically valid paths, we don't want to linkify anything
+    # starting with a number like "~10" or "~4.5", since that's just going to be
+    # someone using it in the "approximately" sense. This will be a problem if a
+    # top-level group's name ever starts with a number, but I think that's unlikely.
+    if group_path.startswith(tuple("0123456789")):
+        return False
+
+    return is_valid_group_path(group_path)
+
+
+@lru_cache(maxsize=1000)
+def is_linkable_username(username: str) -> bool:
+    """Return whether a username can be linkified (results cached, as above)."""
+    return is_valid_username(username)
 
 
 def preprocess_markdown(markdown: str) -> str:
@@ -194,26 +457,61 @@ def escape_accidental_ordered_lists(markdown: str) -> str:
     return BAD_ORDERED_LIST_REGEX.sub(r"\1\\. ", markdown)
 
 
-def postprocess_markdown_html(html: str) -> str:
-    """Apply post-processing to HTML generated by markdown parser."""
+def postprocess_markdown_html(
+    html: str,
+    context: Optional[HTMLSanitizationContext] = None,
+    existing_references: Optional[MarkdownReferences] = None,
+    timings: Optional[MarkdownStageTimings] = None,
+) -> RenderedMarkdown:
+    """Apply post-processing to HTML generated by markdown parser, and sanitize it.
+
+    The HTML is only parsed once: syntax highlighting is applied to the parsed tree,
+    then linkification, sanitization and extracting the text all happen in a single
+    pass over it while serializing the final HTML.
+
+    If timings is set, the time taken by each stage will be added to it.
+    """
+    if timings is None:
+        timings = MarkdownStageTimings()
+
     # cmark (and cmark-gfm) replaces double-quote characters with the &quot; entity.
-    # This is almost always unnecessary, and is causing issues with some of the HTML
-    # processing, since (for example) BeautifulSoup will convert them back, which causes
-    # the string-replacement in apply_syntax_highlighting() to fail if a code block
-    # contains any double-quote characters.
+    # This is almost always unnecessary, and since the sanitizer leaves entities as they
+    # are, they would otherwise all end up in the final HTML.
     #
     # We'll just do a full replacement here - this has a possibility of being dangerous,
     # but it should be extremely unlikely and the sanitization function should make sure
     # that nothing malicious can happen regardless.
-    html = html.replace("&quot;", '"')
+    with timings.time("strip_images"):
+        html = html.replace("&quot;", '"')
 
-    # apply syntax highlighting to code blocks
-    html = apply_syntax_highlighting(html)
+        # replace <img> elements that were generated by `![ ]( )` Markdown syntax (this
+        # is done before parsing since <img> isn't an allowed tag, so the sanitizer's
+        # parser won't treat it as an element)
+        html = strip_image_elements(html)
 
-    # replace <img> elements that were generated by `![ ]( )` Markdown syntax
-    html = strip_image_elements(html)
+    cleaner = _get_cleaner(context)
 
-    return html
+    with timings.time("html_parse"):
+        fragment = cleaner.parser.parseFragment(html)
+
+    # apply syntax highlighting to code blocks (most documents don't have any code
+    # blocks with a language, so skip searching the tree if there can't be any)
+    if "language-" in html:
+        with timings.time("syntax_highlighting"):
+            apply_syntax_highlighting(fragment, cleaner.parser)
+
+    # add linkification and sanitize the final HTML before returning it
+    with timings.time("linkify_sanitize"):
+        return cleaner.clean_fragment(
+            fragment,
+            filters=[
+                partial(
+                    LinkifyFilter,
+                    skip_tags=LINKIFY_SKIPPED_TAGS,
+                    existing_references=existing_references,
+                )
+            ],
+        )
 
 
 class CodeHtmlFormatter(HtmlFormatter):
@@ -232,31 +530,67 @@ class CodeHtmlFormatter(HtmlFormatter):
         yield (0, "</code>")
 
 
-def apply_syntax_highlighting(html: str) -> str:
-    """Get all code blocks with defined info string in class and highlight them."""
-    soup = BeautifulSoup(html, features="html5lib")
+# formatters don't keep any state between uses, so the same one can always be used
+SYNTAX_HIGHLIGHTING_FORMATTER = CodeHtmlFormatter(classprefix="syntax-")
 
-    # Get all code blocks and for every code block that has info string
-    code_blocks = soup.find_all("code", class_=re.compile("^language-"))
-    for code_block in code_blocks:
-        language = code_block["class"][0].replace("language-", "")
 
-        try:
-            lexer = get_lexer_by_name(language)
-            # If target language is PHP, override default lexer construction
-            # and set startinline to True, so even code that is not enclosed
-            # inside <?php ... ?> will get highlighted.
-            if isinstance(lexer, PhpLexer):
-                lexer = PhpLexer(startinline=True)
-        except ClassNotFound:
-            continue
+@lru_cache(maxsize=256)
+def get_lexer_for_language(language: str) -> Optional[Lexer]:
+    """Return the Pygments lexer to use for a language, or None if there isn't one.
 
-        highlighted = highlight(
-            code_block.text, lexer, CodeHtmlFormatter(classprefix="syntax-")
+    Lexers don't keep any state between uses either, so they're cached to avoid looking
+    them up again every time the same language is used.
+    """
+    try:
+        lexer = get_lexer_by_name(language)
+    except ClassNotFound:
+        return None
+
+    # If target language is PHP, override default lexer construction and set
+    # startinline to True, so even code that is not enclosed inside <?php ... ?> will
+    # get highlighted.
+    if isinstance(lexer, PhpLexer):
+        lexer = PhpLexer(startinline=True)
+
+    return lexer
+
+
+def apply_syntax_highlighting(fragment: Element, parser: BleachHTMLParser) -> None:
+    """Get all code blocks with defined info string in class and highlight them.
+
+    The highlighted code blocks are parsed with the same parser that parsed the
+    fragment, and replace the original code blocks in the tree.
+    """
+    # Get all code blocks that have an info string, along with their parents (so they
+    # can be replaced)
+    code_blocks = [
+        (parent, index, element)
+        for parent in fragment.iter()
+        for index, element in enumerate(parent)
+        if element.tag == "code"
+        and any(
+            class_.startswith("language-")
+            for class_ in element.get("class", "").split()
         )
-        html = html.replace(str(code_block), highlighted, 1)
+    ]
 
-    return html
+    for parent, index, code_block in code_blocks:
+        language = code_block.get("class").split()[0].replace("language-", "")
+
+        lexer = get_lexer_for_language(language)
+        if not lexer:
+            continue
+
+        # the parser leaves character entities unconverted in text (for the sanitizer
+        # to handle), so they need to be converted before highlighting the code
+        code = unescape("".join(code_block.itertext()))
+
+        highlighted = highlight(code, lexer, SYNTAX_HIGHLIGHTING_FORMATTER)
+
+        # the formatter wraps the highlighted code in a single <code> element
+        highlighted_block = parser.parseFragment(highlighted)[0]
+        highlighted_block.tail = code_block.tail
+        parent[index] = highlighted_block
 
 
 def strip_image_elements(html: str) -> str:
@@ -301,18 +635,25 @@ class LinkifyFilter(Filter):
     SUBREDDIT_REFERENCE_REGEX = re.compile(r"(?<!\w)/?r/(\w+)\b")
 
     def __init__(
-        self, source: NonRecursiveTreeWalker, skip_tags: Optional[list[str]] = None
+        self,
+        source: NonRecursiveTreeWalker,
+        skip_tags: Optional[Sequence[str]] = None,
+        existing_references: Optional[MarkdownReferences] = None,
     ):
         """Initialize a linkification filter to apply to HTML.
 
         The skip_tags argument can be a list of tag names, and the contents of any of
         those tags will be excluded from linkification.
+
+        If existing_references is set, only the group paths and usernames in it will be
+        linkified, in addition to needing to be valid.
         """
         super().__init__(source)
-        self.skip_tags = skip_tags or []
 
         # always skip the contents of <a> tags in addition to any others
-        self.skip_tags.append("a")
+        self.skip_tags = [*(skip_tags or []), "a"]
+
+        self.existing_references = existing_references
 
     def __iter__(self) -> Iterator[dict]:
         """Iterate over the tree, modifying it as necessary before yielding."""
@@ -423,21 +764,18 @@ class LinkifyFilter(Filter):
 
         return new_tokens
 
-    @staticmethod
-    def _tokenize_group_match(match: re.Match) -> list[dict]:
+    def _tokenize_group_match(self, match: re.Match) -> list[dict]:
         """Convert a potential group reference into HTML tokens."""
         # convert the potential group path to lowercase to allow people to use incorrect
         # casing but still have it link properly
         group_path = match[1].lower()
 
-        # Even though they're technically valid paths, we don't want to linkify anything
-        # starting with a number like "~10" or "~4.5", since that's just going to be
-        # someone using it in the "approximately" sense. This will be a problem if a
-        # top-level group's name ever starts with a number, but I think that's unlikely.
-        is_ignored = group_path.startswith(tuple("0123456789"))
+        is_linkable = is_linkable_group_path(group_path)
+        if is_linkable and self.existing_references is not None:
+            is_linkable = group_path in self.existing_references.group_paths
 
-        # if it's a valid group path and not ignored by the above logic, convert to <a>
-        if is_valid_group_path(group_path) and not is_ignored:
+        # if it's a linkable group path, convert to <a>
+        if is_linkable:
             return [
                 {
                     "type": "StartTag",
@@ -454,11 +792,14 @@ class LinkifyFilter(Filter):
         # one of the checks failed, so just keep it as the original text
         return [{"type": "Characters", "data": match[0]}]
 
-    @staticmethod
-    def _tokenize_username_match(match: re.Match) -> list[dict]:
+    def _tokenize_username_match(self, match: re.Match) -> list[dict]:
         """Convert a potential username reference into HTML tokens."""
-        # if it's a valid username, convert to <a>
-        if is_valid_username(match[1]):
+        is_linkable = is_linkable_username(match[1])
+        if is_linkable and self.existing_references is not None:
+            is_linkable = match[1].lower() in self.existing_references.usernames
+
+        # if it's a linkable username, convert to <a>
+        if is_linkable:
             return [
                 {
                     "type": "StartTag",
@@ -472,7 +813,7 @@ class LinkifyFilter(Filter):
                 {"type": "EndTag", "name": "a"},
             ]
 
-        # the username wasn't valid, so just keep it as the original text
+        # the username wasn't linkable, so just keep it as the original text
         return [{"type": "Characters", "data": match[0]}]
 
     @staticmethod
@@ -489,25 +830,108 @@ class LinkifyFilter(Filter):
         ]
 
 
-def linkify_and_sanitize_html(
-    html: str, context: Optional[HTMLSanitizationContext] = None
-) -> str:
-    """Use bleach and html5lib filters to linkify and sanitize HTML."""
-    # list of tag names to exclude from linkification
-    linkify_skipped_tags = ["code", "pre"]
-
-    tildes_linkifier = partial(LinkifyFilter, skip_tags=linkify_skipped_tags)
-
-    allowed_attributes = ALLOWED_HTML_ATTRIBUTES_DEFAULT
-    if context:
-        # include overrides for the current context
-        overrides = ALLOWED_HTML_ATTRIBUTES_OVERRIDES.get(context, {})
-        allowed_attributes = {**allowed_attributes, **overrides}
-
-    cleaner = bleach.Cleaner(
-        tags=ALLOWED_HTML_TAGS,
-        attributes=allowed_attributes,
-        protocols=ALLOWED_LINK_PROTOCOLS,
-        filters=[tildes_linkifier],
-    )
-    return cleaner.clean(html)
+class TextExtractionFilter(Filter):
+    """html5lib Filter to extract the text content from the HTML passing through it.
+
+    This gives the same text as tildes.lib.string.extract_text_from_html() would from
+    the final HTML, without needing to parse it again.
+    """
+
+    def __init__(self, source: Filter, skip_tags: tuple[str, ...] = ()):
+        """Initialize a text extraction filter.
+
+        The skip_tags argument can be a list of tag names, and the contents of any of
+        those tags will be excluded from the extracted text.
+        """
+        super().__init__(source)
+        self.skip_tags = skip_tags
+        self.text_parts: list[str] = []
+
+    @property
+    def text(self) -> str:
+        """Return the text extracted so far, simplified."""
+        return simplify_string("".join(self.text_parts))
+
+    def __iter__(self) -> Iterator[dict]:
+        """Iterate over the tokens, extracting text from any outside skipped tags."""
+        num_skipped_tags_open = 0
+
+        for token in super().__iter__():
+            if token["type"] == "StartTag" and token["name"] in self.skip_tags:
+                num_skipped_tags_open += 1
+            elif token["type"] == "EndTag" and token["name"] in self.skip_tags:
+                num_skipped_tags_open -= 1
+            elif num_skipped_tags_open == 0:
+                if token["type"] in ("Characters", "SpaceCharacters"):
+                    self.text_parts.append(token["data"])
+                elif token["type"] == "Entity":
+                    # the entity is output as-is, so convert it the same way that
+                    # parsing the final HTML would
+                    self.text_parts.append(unescape(f"&{token['name']};"))
+
+            yield token
+
+
+class SanitizingCleaner(bleach.Cleaner):
+    """Bleach Cleaner that can sanitize an already-parsed HTML fragment.
+
+    The fragment must have been parsed by the cleaner's parser. Like bleach's Cleaner,
+    this has internal state and isn't thread-safe.
+    """
+
+    def clean_fragment(
+        self, fragment: Element, filters: Optional[list[Callable]] = None
+    ) -> RenderedMarkdown:
+        """Sanitize (and apply filters to) a fragment, and extract its text.
+
+        This does the same as bleach's Cleaner.clean() after parsing, except that the
+        text is also extracted for excerpts during serialization. The filters argument
+        can be used for filters specific to this fragment, which will be applied after
+        the cleaner's own filters.
+        """
+        filtered = BleachSanitizerFilter(
+            source=self.walker(fragment),
+            attributes=self.attributes,
+            strip_disallowed_elements=self.strip,
+            strip_html_comments=self.strip_comments,
+            allowed_elements=self.tags,
+            allowed_css_properties=self.styles,
+            allowed_protocols=self.protocols,
+            allowed_svg_properties=[],
+        )
+
+        for filter_class in [*self.filters, *(filters or [])]:
+            filtered = filter_class(source=filtered)
+
+        text_filter = TextExtractionFilter(filtered, skip_tags=EXCERPT_SKIPPED_TAGS)
+        html = self.serializer.render(text_filter)
+
+        return RenderedMarkdown(html, text_filter.text)
+
+
+# creating a Cleaner is relatively expensive, so each thread keeps its own for each
+# context (they can't be shared between threads)
+_THREAD_STATE = local()
+
+
+def _get_cleaner(context: Optional[HTMLSanitizationContext]) -> SanitizingCleaner:
+    """Return this thread's cleaner for a context, creating it if necessary."""
+    try:
+        cleaners = _THREAD_STATE.cleaners
+    except AttributeError:
+        cleaners = _THREAD_STATE.cleaners = {}
+
+    if context not in cleaners:
+        allowed_attributes = ALLOWED_HTML_ATTRIBUTES_DEFAULT
+        if context:
+            # include overrides for the current context
+            overrides = ALLOWED_HTML_ATTRIBUTES_OVERRIDES.get(context, {})
+            allowed_attributes = {**allowed_attributes, **overrides}
+
+        cleaners[context] = SanitizingCleaner(
+            tags=ALLOWED_HTML_TAGS,
+            attributes=allowed_attributes,
+            protocols=ALLOWED_LINK_PROTOCOLS,
+        )
+
+    return cleaners[context]
@@ -0,0 +1,106 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+"""Cache for HTML rendered from markdown."""
+
+from collections import OrderedDict
+from datetime import timedelta
+from hashlib import sha256
+from threading import Lock
+from typing import Optional
+
+from redis import Redis, RedisError
+
+
+class MarkdownRenderCache:
+    """A content-addressed cache of HTML rendered from markdown.
+
+    Entries are keyed by a hash of everything that affects the rendered HTML, so they
+    never need to be invalidated: changing any of those inputs just results in a
+    different key. Old entries fall out of the in-process LRU layer as new ones are
+    added, and expire from the (optional) Redis layer after redis_ttl.
+
+    The Redis layer allows renders to be shared between processes. It's strictly a
+    best-effort addition, so any errors from Redis are treated as cache misses.
+    """
+
+    REDIS_KEY_PREFIX = "markdown_render:"
+
+    def __init__(
+        self,
+        max_size: int,
+        redis: Optional[Redis] = None,
+        redis_ttl: timedelta = timedelta(days=1),
+    ):
+        """Create a cache holding up to max_size renders in-process."""
+        self.max_size = max_size
+        self.redis = redis
+        self.redis_ttl = redis_ttl
+
+        self._renders: OrderedDict[str, str] = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def get_key(*parts: str) -> str:
+        """Return the cache key for a render that depends on the given parts."""
+        key_hash = sha256()
+
+        for part in parts:
+            encoded = part.encode("utf8")
+
+            # prefix each part with its length so that the boundaries between parts
+            # can't shift without changing the hash
+            key_hash.update(f"{len(encoded)}:".encode("ascii"))
+            key_hash.update(encoded)
+
+        return key_hash.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached HTML for a key, or None if it isn't cached."""
+        with self._lock:
+            html = self._renders.get(key)
+            if html is not None:
+                self._renders.move_to_end(key)
+                return html
+
+        if not self.redis:
+            return None
+
+        try:
+            cached_html = self.redis.get(self.REDIS_KEY_PREFIX + key)
+        except RedisError:
+            return None
+
+        if cached_html is None:
+            return None
+
+        html = cached_html.decode("utf8")
+        self._store_locally(key, html)
+
+        return html
+
+    def set(self, key: str, html: str) -> None:
+        """Store the HTML for a key in all layers of the cache."""
+        self._store_locally(key, html)
+
+        if not self.redis:
+            return
+
+        try:
+            self.redis.setex(self.REDIS_KEY_PREFIX + key, self.redis_ttl, html)
+        except RedisError:
+            pass
+
+    def clear(self) -> None:
+        """Remove all entries from the in-process layer of the cache."""
+        with self._lock:
+            self._renders.clear()
+
+    def _store_locally(self, key: str, html: str) -> None:
+        """Store the HTML for a key in the in-process layer, evicting if necessary."""
+        with self._lock:
+            self._renders[key] = html
+            self._renders.move_to_end(key)
+
+            while len(self._renders) > self.max_size:
+                self._renders.popitem(last=False)
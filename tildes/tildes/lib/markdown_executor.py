@@ -0,0 +1,176 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+"""Offloading of expensive markdown renders to a pool of worker processes."""
+
+import os
+from collections.abc import Callable
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from multiprocessing import get_context
+from threading import Lock
+from typing import Any, Optional, TypeVar
+
+from tildes.metrics import get_histogram, incr_counter
+
+
+RenderResult = TypeVar("RenderResult")
+
+
+class MarkdownRenderExecutor:
+    """Renders expensive markdown in a pool of worker processes instead of inline.
+
+    Rendering a very long document (or one with many code blocks to highlight) can take
+    hundreds of milliseconds, and nothing else can be handled by the web worker process
+    during that time. Documents at least min_length characters long or with at least
+    min_code_blocks fenced code blocks are sent to the pool instead, and all others are
+    rendered inline as usual.
+
+    The pool is optional, and is only used if workers is set (during app startup). Each
+    process gets its own pool, which web workers create when they start (through the
+    post_worker_init hook in gunicorn_config.py), and other processes create when they
+    first offload a render. The pool's processes are started by a "forkserver" process,
+    so they never inherit the creating process's database or Redis connections, or any
+    locks it was holding.
+
+    Offloading always falls back to rendering inline: if there are already max_pending
+    renders waiting for the pool, if a render takes longer than timeout, or if the
+    pool breaks.
+    """
+
+    def __init__(
+        self,
+        workers: int = 0,
+        min_length: int = 20_000,
+        min_code_blocks: int = 10,
+        timeout: timedelta = timedelta(seconds=2),
+        max_pending: Optional[int] = None,
+    ):
+        """Create an executor (with no pool unless workers is set)."""
+        self.workers = workers
+        self.min_length = min_length
+        self.min_code_blocks = min_code_blocks
+        self.timeout = timeout
+        self.max_pending = max_pending
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_pid: Optional[int] = None
+        self._num_pending = 0
+        self._lock = Lock()
+
+    def should_offload(self, markdown: str) -> bool:
+        """Return whether a render of the markdown should be sent to the pool."""
+        if not self.workers:
+            return False
+
+        if len(markdown) >= self.min_length:
+            return True
+
+        # this will over-count if the code blocks contain fences (for example, a block
+        # showing how to write a code block), but that's fine for an estimate
+        num_fences = markdown.count("```") + markdown.count("~~~")
+        return num_fences // 2 >= self.min_code_blocks
+
+    def render(
+        self, render_function: Callable[..., RenderResult], markdown: str, *args: Any
+    ) -> RenderResult:
+        """Call render_function(markdown, *args), in the pool if it's expensive.
+
+        The function and all of the arguments must be able to be pickled.
+        """
+        if not self.should_offload(markdown):
+            return render_function(markdown, *args)
+
+        future = self._submit(render_function, markdown, *args)
+
+        if future:
+            try:
+                result = future.result(timeout=self.timeout.total_seconds())
+                incr_counter("markdown_render_offloads", result="completed")
+                return result
+            except TimeoutError:
+                # the render will still finish in the pool, but won't be waited for
+                future.cancel()
+                incr_counter("markdown_render_offloads", result="timeout")
+            except BrokenProcessPool:
+                self._discard_pool()
+                incr_counter("markdown_render_offloads", result="error")
+
+        return render_function(markdown, *args)
+
+    def start(self) -> None:
+        """Create this process's pool ahead of any renders (if the pool is enabled)."""
+        if not self.workers:
+            return
+
+        with self._lock:
+            pool = self._get_pool()
+
+        # make sure the forkserver is started now instead of during a request
+        pool.submit(os.getpid).result()
+
+    def shutdown(self) -> None:
+        """Shut down this process's pool (a new one is created if needed again)."""
+        with self._lock:
+            if self._pool and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+
+            self._pool = None
+
+    def _submit(
+        self, render_function: Callable[..., RenderResult], markdown: str, *args: Any
+    ) -> Optional[Future]:
+        """Submit a render to the pool, returning None if it can't be submitted."""
+        max_pending = self.max_pending or self.workers
+
+        with self._lock:
+            get_histogram("markdown_render_queue_depth").observe(self._num_pending)
+
+            if self._num_pending >= max_pending:
+                incr_counter("markdown_render_offloads", result="saturated")
+                return None
+
+            try:
+                future = self._get_pool().submit(render_function, markdown, *args)
+            except BrokenProcessPool:
+                self._pool = None
+                incr_counter("markdown_render_offloads", result="error")
+                return None
+
+            self._num_pending += 1
+
+        future.add_done_callback(self._render_done)
+
+        return future
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Return this process's pool, creating it if necessary (must hold the lock).
+
+        Pools can't be shared with forked processes, so if this process was forked
+        from one that had already created a pool, a new one is created.
+        """
+        if not self._pool or self._pool_pid != os.getpid():
+            # forking the pool's processes directly from this one would copy its open
+            # sockets and held locks into them, but spawning each one is slow, so they
+            # are forked from a clean server process that has the markdown processing
+            # modules already imported
+            context = get_context("forkserver")
+            context.set_forkserver_preload(["tildes.lib.markdown"])
+
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=context)
+            self._pool_pid = os.getpid()
+            self._num_pending = 0
+
+        return self._pool
+
+    def _discard_pool(self) -> None:
+        """Stop using the current pool, so that a new one is created next time."""
+        with self._lock:
+            self._pool = None
+
+    def _render_done(self, future: Future) -> None:
+        """Update the number of pending renders when one finishes (or is cancelled)."""
+        # pylint: disable=unused-argument
+        with self._lock:
+            self._num_pending = max(self._num_pending - 1, 0)
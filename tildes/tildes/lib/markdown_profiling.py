@@ -0,0 +1,83 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+"""Timing of the individual stages of markdown processing."""
+
+import logging
+from collections.abc import Iterator
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Optional
+
+from tildes.metrics import get_histogram
+
+
+# The stages of processing, in the order they happen. Note that linkification and
+# sanitization are done in a single pass while serializing the HTML (along with
+# extracting the excerpt text), so they can only be timed together.
+MARKDOWN_STAGES = (
+    "preprocess",
+    "cmark",
+    "strip_images",
+    "html_parse",
+    "syntax_highlighting",
+    "linkify_sanitize",
+)
+
+
+class MarkdownStageTimings:
+    """Collects how long each stage of processing a single document took.
+
+    A stage can be timed multiple times for the same document (such as when the blocks
+    of a preview are processed separately), and the times will be added together.
+    Stages that didn't happen at all (such as syntax highlighting for documents with no
+    code blocks with a language) aren't recorded.
+    """
+
+    # Documents that take longer than this to process will be logged along with their
+    # sizes and stage timings. Set during app startup from the
+    # tildes.markdown_slow_render_log_ms setting (None disables the logging).
+    slow_render_log_threshold: Optional[float] = None
+
+    def __init__(self) -> None:
+        """Create an empty set of timings."""
+        self.durations: dict[str, float] = {}
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        """Context manager that adds the time spent inside it to a stage."""
+        if stage not in MARKDOWN_STAGES:
+            raise ValueError(f"Invalid markdown stage: {stage}")
+
+        start_time = perf_counter()
+
+        try:
+            yield
+        finally:
+            self.durations[stage] = (
+                self.durations.get(stage, 0.0) + perf_counter() - start_time
+            )
+
+    @property
+    def total(self) -> float:
+        """Return the total time spent in all stages."""
+        return sum(self.durations.values())
+
+    def record(self, markdown_length: int, html_length: int) -> None:
+        """Record the timings in metrics, and log the document if it was slow."""
+        for stage, duration in self.durations.items():
+            get_histogram("markdown_stage", stage=stage).observe(duration)
+
+        threshold = MarkdownStageTimings.slow_render_log_threshold
+        if threshold is None or self.total < threshold:
+            return
+
+        stage_times = ", ".join(
+            f"{stage} {duration * 1000:.2f} ms"
+            for stage, duration in self.durations.items()
+        )
+        logging.warning(
+            f"Slow markdown processing: {self.total * 1000:.2f} ms for "
+            f"{markdown_length} chars of markdown ({html_length} chars of HTML): "
+            f"{stage_times}"
+        )
@@ -0,0 +1,100 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+"""Functions/classes related to group and user references in markdown."""
+
+from datetime import timedelta
+from time import monotonic
+from typing import NamedTuple, Optional
+
+from pyramid.threadlocal import get_current_request
+from sqlalchemy.orm.session import Session
+from sqlalchemy.sql.expression import text
+
+
+class MarkdownReferences(NamedTuple):
+    """The (lowercased) group paths and usernames referenced in some markdown."""
+
+    group_paths: frozenset[str] = frozenset()
+    usernames: frozenset[str] = frozenset()
+
+
+class MarkdownReferenceResolver:
+    """Checks which of the groups and users referenced in markdown actually exist.
+
+    Group paths are checked against an in-process cache of all of them, since there
+    aren't many groups and new ones are rarely added. Usernames are checked with a
+    single query for all of the ones being resolved.
+
+    Resolving is only possible while a request is being handled, and uses the
+    request's own database session, so it doesn't need a separate connection and can
+    see anything the request itself has changed.
+    """
+
+    def __init__(self, group_paths_max_age: timedelta = timedelta(minutes=5)):
+        """Create a resolver, reloading group paths when they're older than max age."""
+        self.group_paths_max_age = group_paths_max_age
+
+        self._group_paths: frozenset[str] = frozenset()
+        self._group_paths_load_time: Optional[float] = None
+
+    @staticmethod
+    def _get_request_db_session() -> Optional[Session]:
+        """Return the database session of the current request, if there is one."""
+        return getattr(get_current_request(), "db_session", None)
+
+    @property
+    def can_resolve(self) -> bool:
+        """Return whether references can be resolved (if a request is being handled)."""
+        return self._get_request_db_session() is not None
+
+    def resolve(self, references: MarkdownReferences) -> Optional[MarkdownReferences]:
+        """Return only the references that exist, using the request's session.
+
+        Returns None if the references can't be resolved, since no request is being
+        handled (for example, in scripts and consumers).
+        """
+        db_session = self._get_request_db_session()
+        if db_session is None:
+            return None
+
+        if not (references.group_paths or references.usernames):
+            return references
+
+        return self.resolve_with_session(db_session, references)
+
+    def resolve_with_session(
+        self, db_session: Session, references: MarkdownReferences
+    ) -> MarkdownReferences:
+        """Return only the references that exist, using an existing database session."""
+        group_paths: frozenset[str] = frozenset()
+        if references.group_paths:
+            group_paths = references.group_paths & self._get_group_paths(db_session)
+
+        usernames: frozenset[str] = frozenset()
+        if references.usernames:
+            # the username column is case-insensitive (citext), so the array needs to be
+            # cast for the comparison to be case-insensitive too
+            rows = db_session.execute(
+                text(
+                    "SELECT lower(username) FROM users "
+                    "WHERE username = ANY(CAST(:usernames AS citext[]))"
+                ),
+                {"usernames": list(references.usernames)},
+            )
+            usernames = frozenset(row[0] for row in rows)
+
+        return MarkdownReferences(group_paths, usernames)
+
+    def _get_group_paths(self, db_session: Session) -> frozenset[str]:
+        """Return the paths of all groups, reloading them if they're too old."""
+        if (
+            self._group_paths_load_time is None
+            or monotonic() - self._group_paths_load_time
+            > self.group_paths_max_age.total_seconds()
+        ):
+            rows = db_session.execute(text("SELECT path::text FROM groups"))
+            self._group_paths = frozenset(row[0] for row in rows)
+            self._group_paths_load_time = monotonic()
+
+        return self._group_paths
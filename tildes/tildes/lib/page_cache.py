@@ -0,0 +1,160 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+"""Cache of full pages rendered for logged-out visitors."""
+
+import json
+from collections.abc import Collection, Mapping
+from datetime import timedelta
+from hashlib import sha256
+from typing import Any, NamedTuple, Optional
+
+from redis import Redis, RedisError
+
+from tildes.lib.id import id_to_id36
+
+
+class CachedPage(NamedTuple):
+    """A page's response data, as stored in the cache."""
+
+    content_type: str
+    body: bytes
+
+
+class PageCache:
+    """Cache of full pages rendered for logged-out visitors, stored in Redis.
+
+    Logged-out visitors all see identical pages (other than their theme), so a page
+    rendered for one of them can be served to all of them. Each cached page expires
+    after ttl, and is also invalidated when the topics (or their comments) that it
+    shows change, by using "generation" counters: every topic page is stored along
+    with the current generation of its topic, and every listing page along with the
+    current generation of all listings. Incrementing a generation causes all pages
+    stored with an older one to be ignored.
+
+    The cache is strictly a best-effort addition, so any errors from Redis are treated
+    as cache misses.
+    """
+
+    KEY_PREFIX = "page_cache:"
+
+    LISTINGS_GENERATION_KEY = f"{KEY_PREFIX}generation:listings"
+
+    LISTING_ROUTES = frozenset(
+        (
+            "home",
+            "home_atom",
+            "home_rss",
+            "group",
+            "group_topics",
+            "group_topics_atom",
+            "group_topics_rss",
+        )
+    )
+    TOPIC_ROUTES = frozenset(("topic",))
+
+    # Generation keys expire eventually so that old topics' ones don't accumulate. This
+    # must be longer than the ttl for pages, since a page can only be safely used while
+    # its generation key still exists.
+    GENERATION_TTL = timedelta(days=1)
+
+    def __init__(self, redis: Redis, ttl: timedelta = timedelta(seconds=30)):
+        """Create an interface to the cache, stored in a Redis server."""
+        if ttl >= self.GENERATION_TTL:
+            raise ValueError("Page cache ttl must be shorter than GENERATION_TTL")
+
+        self.redis = redis
+        self.ttl = ttl
+
+    @classmethod
+    def is_route_cached(cls, route_name: str) -> bool:
+        """Return whether pages from a route can be cached."""
+        return route_name in cls.LISTING_ROUTES or route_name in cls.TOPIC_ROUTES
+
+    @classmethod
+    def get_key(
+        cls,
+        route_name: str,
+        matchdict: Mapping[str, Any],
+        params: Collection[tuple[str, str]],
+        theme: Optional[str],
+    ) -> str:
+        """Return the cache key for a page, from everything that affects its HTML."""
+        key_data = json.dumps(
+            [route_name, sorted(matchdict.items()), sorted(params), theme or ""]
+        )
+        return cls.KEY_PREFIX + sha256(key_data.encode("utf8")).hexdigest()
+
+    @classmethod
+    def _get_generation_key(cls, route_name: str, matchdict: Mapping[str, Any]) -> str:
+        """Return the key of the generation counter that applies to a route."""
+        if route_name in cls.TOPIC_ROUTES:
+            return cls._get_topic_generation_key(matchdict["topic_id36"])
+
+        return cls.LISTINGS_GENERATION_KEY
+
+    @classmethod
+    def _get_topic_generation_key(cls, topic_id36: str) -> str:
+        """Return the key of a topic's generation counter."""
+        return f"{cls.KEY_PREFIX}generation:topic:{topic_id36}"
+
+    def lookup(
+        self, key: str, route_name: str, matchdict: Mapping[str, Any]
+    ) -> tuple[Optional[CachedPage], Optional[bytes]]:
+        """Look up a page, returning it (if there's a current one) and the generation.
+
+        The generation must be passed to set() if the page is stored after rendering
+        it, so that a page rendered from data that was changed in the meantime will be
+        stored with an outdated generation (and won't be used). If Redis couldn't be
+        reached, the generation will be None and the page shouldn't be stored.
+        """
+        generation_key = self._get_generation_key(route_name, matchdict)
+
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.get(generation_key)
+        pipeline.hgetall(key)
+
+        try:
+            generation, cached = pipeline.execute()
+        except RedisError:
+            return None, None
+
+        generation = generation or b"0"
+
+        if not cached or cached[b"generation"] != generation:
+            return None, generation
+
+        page = CachedPage(cached[b"content_type"].decode("ascii"), cached[b"body"])
+        return page, generation
+
+    def set(self, key: str, generation: bytes, page: CachedPage) -> None:
+        """Store a page in the cache, along with the generation it was rendered at."""
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.hset(
+            key,
+            mapping={
+                "generation": generation,
+                "content_type": page.content_type,
+                "body": page.body,
+            },
+        )
+        pipeline.expire(key, self.ttl)
+
+        try:
+            pipeline.execute()
+        except RedisError:
+            pass
+
+    def invalidate_topics(self, topic_ids: Collection[int]) -> None:
+        """Invalidate the cached pages for topics, and all cached listings."""
+        pipeline = self.redis.pipeline(transaction=False)
+
+        pipeline.incr(self.LISTINGS_GENERATION_KEY)
+        pipeline.expire(self.LISTINGS_GENERATION_KEY, self.GENERATION_TTL)
+
+        for topic_id in topic_ids:
+            generation_key = self._get_topic_generation_key(id_to_id36(topic_id))
+            pipeline.incr(generation_key)
+            pipeline.expire(generation_key, self.GENERATION_TTL)
+
+        pipeline.execute()
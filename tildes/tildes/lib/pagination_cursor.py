@@ -0,0 +1,117 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+"""Functions and classes related to signed pagination cursors."""
+
+import hmac
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from hashlib import sha256
+from typing import Any, NamedTuple, Optional, Union
+
+
+SortValue = Union[datetime, int, float, None]
+
+
+class PaginationCursor(NamedTuple):
+    """The position of an "anchor" item that a page of results is relative to.
+
+    Along with the anchor item's ID, this includes its value for the column that the
+    listing was sorted by, so that the next page can be fetched by comparing directly
+    against those values, without needing to look up the anchor item again.
+    """
+
+    anchor_table: str
+    sort_column: str
+    sort_value: SortValue
+    anchor_id: int
+
+
+class PaginationCursorSigner:
+    """Encodes pagination cursors into signed strings, and decodes them again.
+
+    Cursors are signed so that they can be trusted to contain values that came from
+    the anchor item, even though they're passed back in the url. Cursors can only be
+    encoded if a secret has been set, so pagination should fall back to using ID36s if
+    it hasn't been.
+    """
+
+    SEPARATOR = "."
+    SIGNATURE_LENGTH = 12
+
+    def __init__(self, secret: Optional[str] = None):
+        """Create a signer, with the secret used for signing (can be set later)."""
+        self.secret = secret
+
+    @property
+    def can_encode(self) -> bool:
+        """Return whether cursors can be encoded (whether a secret is set)."""
+        return bool(self.secret)
+
+    @classmethod
+    def is_cursor(cls, value: str) -> bool:
+        """Return whether a string is in the format of a cursor (not an ID36)."""
+        return cls.SEPARATOR in value
+
+    def encode(self, cursor: PaginationCursor) -> str:
+        """Encode a cursor into a signed string."""
+        sort_value: Any = cursor.sort_value
+        if isinstance(sort_value, datetime):
+            sort_value = sort_value.isoformat()
+
+        data = [cursor.anchor_table, cursor.sort_column, sort_value, cursor.anchor_id]
+        payload = json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+        return (
+            _b64encode(payload) + self.SEPARATOR + _b64encode(self._signature(payload))
+        )
+
+    def decode(self, value: str) -> PaginationCursor:
+        """Decode a cursor from a signed string.
+
+        Raises ValueError if the string isn't a valid cursor, or its signature doesn't
+        match (so it wasn't encoded with this signer's secret).
+        """
+        encoded_payload, _, encoded_signature = value.partition(self.SEPARATOR)
+
+        try:
+            payload = _b64decode(encoded_payload)
+            signature = _b64decode(encoded_signature)
+        except ValueError as exc:
+            raise ValueError("Invalid cursor encoding") from exc
+
+        if not hmac.compare_digest(signature, self._signature(payload)):
+            raise ValueError("Invalid cursor signature")
+
+        anchor_table, sort_column, sort_value, anchor_id = json.loads(payload)
+
+        # the only sort values that are strings are encoded datetimes
+        if isinstance(sort_value, str):
+            sort_value = datetime.fromisoformat(sort_value)
+
+        return PaginationCursor(anchor_table, sort_column, sort_value, anchor_id)
+
+    def _signature(self, payload: bytes) -> bytes:
+        """Return the signature for a cursor's payload."""
+        if not self.secret:
+            raise ValueError("Can't sign or verify cursors without a secret")
+
+        digest = hmac.new(self.secret.encode("utf-8"), payload, sha256).digest()
+
+        return digest[: self.SIGNATURE_LENGTH]
+
+
+def _b64encode(data: bytes) -> str:
+    """Encode bytes to url-safe base64, without padding."""
+    return urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    """Decode url-safe base64 that had its padding removed."""
+    return urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+# The secret is set during app startup (processes that don't set one will paginate
+# using ID36s instead of cursors)
+CURSOR_SIGNER = PaginationCursorSigner()
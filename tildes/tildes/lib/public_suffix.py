@@ -0,0 +1,268 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+"""Functions/classes related to the Public Suffix List (PSL).
+
+The PSL is downloaded from publicsuffix.org, but a parsed version of it is also cached
+on disk, so that processes starting up don't need to wait on (or even be able to
+reach) publicsuffix.org. If the cached version gets too old it's still used, but a new
+copy is downloaded in a background thread and swapped in once it's ready.
+"""
+
+import json
+import os
+from collections.abc import Iterable
+from datetime import datetime, timedelta
+from tempfile import NamedTemporaryFile
+from threading import Lock, Thread
+from typing import Any, Optional
+
+import publicsuffix
+import requests
+
+from tildes.lib.datetime import utc_now
+
+
+PSL_URL = "https://publicsuffix.org/list/public_suffix_list.dat"
+
+DEFAULT_CACHE_PATH = "/var/tmp/tildes_public_suffix_list.json"
+
+# increment this whenever the format of the cached data changes, so that old caches
+# will be ignored instead of being misinterpreted
+CACHE_FORMAT_VERSION = 1
+
+# how old the cached list can get before a new one is downloaded
+MAX_CACHE_AGE = timedelta(days=7)
+
+# Keys used to mark rules in the trie. These can't collide with any real labels from
+# the list, since labels can't be empty or contain a "!".
+RULE_KEY = ""
+EXCEPTION_RULE_KEY = "!"
+
+
+def build_suffix_trie(lines: Iterable[str]) -> dict[str, Any]:
+    """Build a suffix trie from the lines of a public suffix list file.
+
+    The trie is made of nested dicts keyed by domain labels, starting from the
+    rightmost label (so "co.uk" is stored as root["uk"]["co"]). A node that's the end of
+    a rule has a RULE_KEY or EXCEPTION_RULE_KEY entry. Since it only uses dicts and
+    strings, it can be serialized directly to JSON for caching.
+    """
+    root: dict[str, Any] = {}
+
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("//"):
+            continue
+
+        rule = line.split()[0].lstrip(".").lower()
+
+        if rule.startswith("!"):
+            rule = rule[1:]
+            rule_key = EXCEPTION_RULE_KEY
+        else:
+            rule_key = RULE_KEY
+
+        node = root
+        for label in reversed(rule.split(".")):
+            node = node.setdefault(label, {})
+
+        node[rule_key] = 1
+
+    return root
+
+
+class PublicSuffixList:
+    """A Public Suffix List backed by a suffix trie."""
+
+    def __init__(self, trie: dict[str, Any]):
+        """Create a PublicSuffixList from a trie (see build_suffix_trie())."""
+        self.trie = trie
+
+    def get_public_suffix(self, domain: str) -> str:
+        """Return the registrable part of a domain (the public suffix plus one label).
+
+        For example, both "example.co.uk" and "www.example.co.uk" will return
+        "example.co.uk". If the domain itself is a public suffix, the whole domain is
+        returned. The method name matches the one from the publicsuffix library, so
+        this can be used as a drop-in replacement. The only difference is for unknown
+        TLDs, where this applies the PSL's implicit "*" rule like the spec says.
+        """
+        labels = domain.lower().strip(".").split(".")
+
+        # length of the longest matching rule, starting with the implicit "*" rule
+        suffix_length = 1
+
+        # walk down the trie one label at a time, following both exact matches and
+        # wildcards (since both can lead to a matching rule)
+        nodes = [self.trie]
+        depth = 0
+        for label in reversed(labels):
+            depth += 1
+            next_nodes = []
+
+            for node in nodes:
+                for child in (node.get(label), node.get("*")):
+                    if child is None:
+                        continue
+
+                    # an exception rule always wins, and its suffix excludes the
+                    # leftmost label from the rule
+                    if EXCEPTION_RULE_KEY in child:
+                        return ".".join(labels[-depth:])
+
+                    if RULE_KEY in child:
+                        suffix_length = depth
+
+                    next_nodes.append(child)
+
+            if not next_nodes:
+                break
+
+            nodes = next_nodes
+
+        return ".".join(labels[-(suffix_length + 1) :])
+
+
+class PublicSuffixListLoader:
+    """Loads the Public Suffix List using the on-disk cache when possible.
+
+    Only a single instance should generally be needed per process, which can be
+    retrieved with get_public_suffix_list() below.
+    """
+
+    def __init__(self, cache_path: str = DEFAULT_CACHE_PATH):
+        """Create a loader that uses the cache file at the specified path."""
+        self.cache_path = cache_path
+        self._psl: Optional[PublicSuffixList] = None
+        self._refresh_lock = Lock()
+        self._is_refreshing = False
+
+    def get_list(self) -> PublicSuffixList:
+        """Return the PublicSuffixList, loading it first if necessary.
+
+        The cached version will always be used if one is available, but if it's older
+        than MAX_CACHE_AGE, a background refresh will also be started.
+        """
+        if self._psl:
+            return self._psl
+
+        cached = self._read_cache()
+        if cached:
+            trie, fetched_time = cached
+            self._psl = PublicSuffixList(trie)
+
+            if utc_now() - fetched_time > MAX_CACHE_AGE:
+                self.refresh_in_background()
+
+            return self._psl
+
+        # no usable cache, so we have to wait for the download this time
+        try:
+            return self.refresh()
+        except requests.exceptions.RequestException:
+            pass
+
+        # fall back to the (possibly quite outdated) list included in the library, but
+        # don't cache it so that the download will be tried again next time
+        with open(publicsuffix.PSL_FILE, encoding="utf-8") as psl_file:
+            self._psl = PublicSuffixList(build_suffix_trie(psl_file))
+
+        return self._psl
+
+    def refresh(self) -> PublicSuffixList:
+        """Download the latest list, replace the in-memory one and update the cache.
+
+        If a list has already been loaded, its trie is replaced in-place so that
+        anything holding a reference to it will start using the new data too.
+        """
+        response = requests.get(PSL_URL, timeout=30)
+        response.raise_for_status()
+
+        trie = build_suffix_trie(response.text.splitlines())
+
+        if self._psl:
+            self._psl.trie = trie
+        else:
+            self._psl = PublicSuffixList(trie)
+
+        # the cache is only an optimization, so failing to write it isn't a problem
+        try:
+            self._write_cache(trie, utc_now())
+        except OSError:
+            pass
+
+        return self._psl
+
+    def refresh_in_background(self) -> None:
+        """Refresh the list in a background thread (if one isn't already running)."""
+        with self._refresh_lock:
+            if self._is_refreshing:
+                return
+
+            self._is_refreshing = True
+
+        Thread(target=self._background_refresh, daemon=True).start()
+
+    def _background_refresh(self) -> None:
+        """Refresh the list, ignoring any failures (the old list is still usable)."""
+        try:
+            self.refresh()
+        except requests.exceptions.RequestException:
+            pass
+        finally:
+            with self._refresh_lock:
+                self._is_refreshing = False
+
+    def _read_cache(self) -> Optional[tuple[dict[str, Any], datetime]]:
+        """Read the trie and the time it was fetched from the cache file, if valid."""
+        try:
+            with open(self.cache_path, encoding="utf-8") as cache_file:
+                cached = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(cached, dict):
+            return None
+
+        if cached.get("version") != CACHE_FORMAT_VERSION:
+            return None
+
+        try:
+            fetched_time = datetime.fromisoformat(cached["fetched_time"])
+            trie = cached["trie"]
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        return (trie, fetched_time)
+
+    def _write_cache(self, trie: dict[str, Any], fetched_time: datetime) -> None:
+        """Write the trie to the cache file.
+
+        Writes to a temporary file and then renames it into place, so that other
+        processes will never read a partially-written cache.
+        """
+        cache_dir = os.path.dirname(self.cache_path) or "."
+
+        with NamedTemporaryFile(
+            "w", encoding="utf-8", dir=cache_dir, delete=False
+        ) as temp_file:
+            json.dump(
+                {
+                    "version": CACHE_FORMAT_VERSION,
+                    "fetched_time": fetched_time.isoformat(),
+                    "trie": trie,
+                },
+                temp_file,
+                separators=(",", ":"),
+            )
+
+        os.replace(temp_file.name, self.cache_path)
+
+
+_LOADER = PublicSuffixListLoader()
+
+
+def get_public_suffix_list() -> PublicSuffixList:
+    """Return the shared PublicSuffixList for this process."""
+    return _LOADER.get_list()
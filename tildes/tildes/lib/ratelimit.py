@@ -308,6 +308,7 @@ _RATE_LIMITED_ACTIONS = (
     RateLimitedAction("register", timedelta(hours=1), 50),
     RateLimitedAction("topic_post", timedelta(hours=4), 10, max_burst=4),
     RateLimitedAction("comment_post", timedelta(hours=1), 10, max_burst=5),
+    RateLimitedAction("markdown_preview", timedelta(minutes=5), 100, by_ip=False),
     RateLimitedAction("donate_stripe", timedelta(hours=1), 5, by_user=False),
     RateLimitedAction(
         "global_donate_stripe", timedelta(hours=1), 20, by_user=False, by_ip=False
@@ -18,6 +18,21 @@ _COUNTERS = {
     "comment_labels": Counter(
         "tildes_comment_labels_total", "Comment Labels", labelnames=["label"]
     ),
+    "topic_listing_index": Counter(
+        "tildes_topic_listing_index_total",
+        "Topic Listing Index Lookups",
+        labelnames=["result"],
+    ),
+    "page_cache": Counter(
+        "tildes_page_cache_total",
+        "Page Cache Lookups",
+        labelnames=["route", "result"],
+    ),
+    "comment_tree_cache": Counter(
+        "tildes_comment_tree_cache_total",
+        "Comment Tree Cache Lookups",
+        labelnames=["result"],
+    ),
     "donations": Counter(
         "tildes_donations_total", "Donation Attempts", labelnames=["type"]
     ),
@@ -28,6 +43,11 @@ _COUNTERS = {
         "tildes_invite_code_failures_total", "Invite Code Failures"
     ),
     "logins": Counter("tildes_logins_total", "Login Attempts"),
+    "markdown_render_offloads": Counter(
+        "tildes_markdown_render_offloads_total",
+        "Markdown renders sent to the render pool",
+        labelnames=["result"],
+    ),
     "login_failures": Counter("tildes_login_failures_total", "Login Failures"),
     "messages": Counter("tildes_messages_total", "Messages", labelnames=["type"]),
     "registrations": Counter("tildes_registrations_total", "User Registrations"),
@@ -40,8 +60,20 @@ _HISTOGRAMS = {
     "markdown_processing": Histogram(
         "tildes_markdown_processing_seconds",
         "Markdown processing",
+        labelnames=["cache"],
         buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0],
     ),
+    "markdown_stage": Histogram(
+        "tildes_markdown_stage_seconds",
+        "Markdown processing time by stage",
+        labelnames=["stage"],
+        buckets=[0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5],
+    ),
+    "markdown_render_queue_depth": Histogram(
+        "tildes_markdown_render_queue_depth",
+        "Markdown renders already pending in the render pool when offloading",
+        buckets=[0, 1, 2, 4, 8, 16],
+    ),
     "comment_tree_sorting": Histogram(
         "tildes_comment_tree_sorting_seconds",
         "Comment tree sorting time",
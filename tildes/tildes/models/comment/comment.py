@@ -33,8 +33,8 @@ from sqlalchemy.sql.expression import text
 from tildes.lib.auth import aces_for_permission
 from tildes.lib.datetime import utc_now
 from tildes.lib.id import id_to_id36
-from tildes.lib.markdown import convert_markdown_to_safe_html
-from tildes.lib.string import extract_text_from_html, truncate_string
+from tildes.lib.markdown import render_markdown
+from tildes.lib.string import truncate_string
 from tildes.metrics import incr_counter
 from tildes.models import DatabaseModel
 from tildes.models.topic import Topic
@@ -65,15 +65,15 @@ class Comment(DatabaseModel):
         - Inserting or deleting rows, or updating is_deleted/is_removed to change
           visibility will increment or decrement num_comments accordingly on the
           relevant topic.
-        - Inserting a row will increment num_comments on any topic_visit rows for the
-          comment's author and the relevant topic.
+        - Inserting a row will increment num_comments on the topic_last_visits row for
+          the comment's author and the relevant topic.
         - Inserting a new comment or updating is_deleted or is_removed will update
           last_activity_time on the relevant topic.
         - Setting is_deleted or is_removed to true will delete any rows in
           comment_notifications related to the comment.
-        - Changing is_deleted or is_removed will adjust num_comments on all topic_visit
-          rows for the relevant topic, where the visit_time was after the time the
-          comment was originally posted.
+        - Changing is_deleted or is_removed will adjust num_comments on all
+          topic_last_visits rows for the relevant topic, where the visit_time was after
+          the time the comment was originally posted.
       Internal:
         - deleted_time will be set or unset when is_deleted is changed
     """
@@ -135,13 +135,11 @@ class Comment(DatabaseModel):
             return
 
         self._markdown = new_markdown
-        self.rendered_html = convert_markdown_to_safe_html(new_markdown)
 
-        extracted_text = extract_text_from_html(
-            self.rendered_html, skip_tags=["blockquote", "del"]
-        )
+        rendered = render_markdown(new_markdown)
+        self.rendered_html = rendered.html
         self.excerpt = truncate_string(
-            extracted_text, length=200, truncate_at_chars=" "
+            rendered.excerpt_text, length=200, truncate_at_chars=" "
         )
 
         if self.age > EDIT_GRACE_PERIOD:
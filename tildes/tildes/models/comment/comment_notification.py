@@ -3,7 +3,6 @@
 
 """Contains the CommentNotification class."""
 
-import re
 from datetime import datetime
 
 from pyramid.security import Allow, DENY_ALL
@@ -13,7 +12,7 @@ from sqlalchemy.orm import relationship, Session
 from sqlalchemy.sql.expression import text
 
 from tildes.enums import CommentNotificationType
-from tildes.lib.markdown import LinkifyFilter
+from tildes.lib.html import get_linked_usernames
 from tildes.models import DatabaseModel
 from tildes.models.topic import TopicIgnore
 from tildes.models.user import User
@@ -120,13 +119,20 @@ class CommentNotification(DatabaseModel):
     def get_mentions_for_comment(
         cls, db_session: Session, comment: Comment
     ) -> list["CommentNotification"]:
-        """Get a list of notifications for user mentions in the comment."""
+        """Get a list of notifications for user mentions in the comment.
+
+        The mentioned users are the ones that were linked when the comment's markdown
+        was rendered, so mentions always match the links that are displayed.
+        """
         notifications = []
 
-        raw_names = re.findall(LinkifyFilter.USERNAME_REFERENCE_REGEX, comment.markdown)
+        usernames = get_linked_usernames(comment.rendered_html)
+        if not usernames:
+            return notifications
+
         users_to_mention = (
             db_session.query(User)
-            .filter(User.username.in_(raw_names))  # type: ignore
+            .filter(User.username.in_(usernames))  # type: ignore
             .all()
         )
 
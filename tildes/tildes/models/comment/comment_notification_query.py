@@ -79,7 +79,7 @@ class CommentNotificationResults(PaginatedResults):
     """Specialized results class for CommentNotifications."""
 
     @property
-    def next_page_after_id36(self) -> str:
+    def next_page_after(self) -> str:
         """Return "after" ID36 that should be used to fetch the next page."""
         if not self.has_next_page:
             raise AttributeError
@@ -87,7 +87,7 @@ class CommentNotificationResults(PaginatedResults):
         return id_to_id36(self.results[-1].comment_id)
 
     @property
-    def prev_page_before_id36(self) -> str:
+    def prev_page_before(self) -> str:
         """Return "before" ID36 that should be used to fetch the prev page."""
         if not self.has_prev_page:
             raise AttributeError
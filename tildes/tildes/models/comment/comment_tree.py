@@ -1,15 +1,16 @@
 # Copyright (c) 2018 Tildes contributors <code@tildes.net>
 # SPDX-License-Identifier: AGPL-3.0-or-later
 
-"""Contains the CommentTree and CommentInTree classes."""
+"""Contains the CommentTree class."""
 
+from __future__ import annotations
 from collections import Counter
 from collections.abc import Iterator, Sequence
 from datetime import datetime
-from typing import Optional
+from operator import attrgetter
+from typing import Any, Callable, Optional
 
 from prometheus_client import Histogram
-from wrapt import ObjectProxy
 
 from tildes.enums import CommentTreeSortOption
 from tildes.metrics import get_histogram
@@ -18,122 +19,318 @@ from tildes.models.user import User
 from .comment import Comment
 
 
+# bit flags stored for each comment in CommentTree._flags
+_IS_DELETED = 1
+_IS_REMOVED = 2
+_HAS_VISIBLE_DESCENDANT = 4
+
+
 class CommentTree:
-    """Class representing the tree of comments on a particular topic."""
+    """Class representing the tree of comments on a particular topic.
+
+    The tree's structure is stored in flat parallel arrays, indexed by each comment's
+    position in self.comments (which is sorted by posting time): the index of its
+    parent, its depth, the range of its replies' indexes inside a single flat array,
+    and a set of bit flags. Since replies are always posted after their parents,
+    iterating forwards through the arrays always processes parents first and iterating
+    backwards always processes replies first, so nothing needs to use recursion.
+
+    The attributes used by templates (replies, depth, num_children, etc.) are set
+    directly on the Comments from the arrays once the tree's structure is complete.
+    """
 
     def __init__(
         self,
         comments: Sequence[Comment],
         sort: CommentTreeSortOption,
         viewer: Optional[User] = None,
+        snapshot: Optional[dict[str, Any]] = None,
     ):
-        """Create a sorted CommentTree from a flat list of Comments."""
-        self.tree: list[CommentInTree] = []
+        """Create a sorted CommentTree from a flat list of Comments.
+
+        If a snapshot (from get_snapshot()) is passed, the tree's structure will be
+        restored from it instead of being built and sorted again.
+        """
+        self.tree: list[Comment] = []
         self.sort = sort
         self.viewer = viewer
 
         # sort the comments by date, since replies will always be posted later this will
         # ensure that parent comments are always processed first
-        self.comments = sorted(
-            [CommentInTree(comment) for comment in comments],
-            key=lambda c: c.created_time,
-        )
+        self.comments = sorted(comments, key=attrgetter("created_time"))
+        comment_ids = [comment.comment_id for comment in self.comments]
+        self.comments_by_id = dict(zip(comment_ids, self.comments))
+        self._index_by_id = {
+            comment_id: index for index, comment_id in enumerate(comment_ids)
+        }
 
-        self.comments_by_id = {comment.comment_id: comment for comment in comments}
+        num_comments = len(self.comments)
+        self._parent_indexes = [-1] * num_comments
+        self._depths = [0] * num_comments
+        self._num_children = [0] * num_comments
+        self._flags = bytearray(num_comments)
+
+        # the replies to the comment at index i are the indexes from _reply_indexes in
+        # the range _reply_starts[i] to _reply_starts[i + 1]
+        self._reply_starts = [0] * (num_comments + 1)
+        self._reply_indexes: list[int] = []
+        self._top_level_indexes: list[int] = []
+
+        for index, comment in enumerate(self.comments):
+            if comment.parent_comment_id:
+                self._parent_indexes[index] = self._index_by_id[
+                    comment.parent_comment_id
+                ]
 
-        self._build_tree()
+            if comment.is_deleted:
+                self._flags[index] |= _IS_DELETED
+            if comment.is_removed:
+                self._flags[index] |= _IS_REMOVED
 
-        # The method of building the tree already sorts it by posting time, so there's
-        # no need to sort again if that's the desired sorting. Note also that because
-        # _sort_tree() uses sorted() which is a stable sort, this means that the
-        # "secondary sort" will always be by posting time as well.
-        if self.tree and sort != CommentTreeSortOption.POSTED:
-            with self._sorting_histogram().time():
-                self.tree = self._sort_tree(self.tree, self.sort)
+            comment.collapsed_state = None
+            comment.removed_marker = None
 
-        self.tree = self._prune_empty_branches(self.tree)
+        if snapshot:
+            self._load_snapshot(snapshot)
+        else:
+            self._build_tree()
 
-        self._add_removed_markers()
+        self._set_comment_attributes()
+
+    def get_snapshot(self) -> dict[str, Any]:
+        """Return the structure of the tree in a form that can be serialized to JSON.
+
+        The snapshot only contains the results of building and sorting the tree (IDs and
+        computed attributes), not any data from the comments themselves.
+        """
+        comments = {}
+        for index, comment in enumerate(self.comments):
+            data = [
+                self._depths[index],
+                bool(self._flags[index] & _HAS_VISIBLE_DESCENDANT),
+                self._num_children[index],
+                [
+                    self.comments[reply_index].comment_id
+                    for reply_index in self._get_reply_indexes(index)
+                ],
+            ]
+
+            if comment.removed_marker:
+                data.append(comment.removed_marker)
+
+            comments[str(comment.comment_id)] = data
+
+        return {
+            "sort": self.sort.name,
+            "tree": [comment.comment_id for comment in self.tree],
+            "comments": comments,
+        }
+
+    def _load_snapshot(self, snapshot: dict[str, Any]) -> None:
+        """Restore the tree's structure from a snapshot (see get_snapshot()).
+
+        Raises ValueError if the snapshot doesn't match the tree's sort or comments.
+        """
+        if snapshot["sort"] != self.sort.name:
+            raise ValueError("Snapshot is for a different comment sort")
+
+        comment_data = snapshot["comments"]
+        index_by_id = self._index_by_id
+        if set(comment_data) != {str(comment_id) for comment_id in index_by_id}:
+            raise ValueError("Snapshot is for a different set of comments")
+
+        # only modify the comments themselves after the whole snapshot has loaded, so a
+        # mismatched snapshot doesn't leave them in a partially-loaded state
+        reply_lists = []
+        removed_markers = {}
+        try:
+            for index, comment in enumerate(self.comments):
+                data = comment_data[str(comment.comment_id)]
+
+                self._depths[index] = data[0]
+                if data[1]:
+                    self._flags[index] |= _HAS_VISIBLE_DESCENDANT
+                self._num_children[index] = data[2]
+                reply_lists.append([index_by_id[reply_id] for reply_id in data[3]])
+
+                if len(data) > 4:
+                    removed_markers[index] = data[4]
+
+            self._top_level_indexes = [
+                index_by_id[comment_id] for comment_id in snapshot["tree"]
+            ]
+        except (KeyError, IndexError, TypeError) as exc:
+            raise ValueError("Invalid comment tree snapshot") from exc
+
+        # Votes don't increment the topic's comments_version (since that would mean
+        # updating the topic for every comment vote), so the order in a snapshot can be
+        # out of date for sorts that use votes. Votes never change the structure of the
+        # tree though, so it's enough to re-sort with the current vote counts. Sorting
+        # the indexes first restores the "secondary sort" by posting time.
+        if self._top_level_indexes and self.sort.depends_on_votes:
+            with self._sorting_histogram().time():
+                sort_indexes = self._index_sorter(self.comments, self.sort)
 
-        self._count_children()
+                self._top_level_indexes = sort_indexes(sorted(self._top_level_indexes))
 
-    def _count_children(self) -> None:
-        """Set the num_children attr for all comments."""
-        # work backwards through comments so that all children will have their count
-        # done first, and we can just sum all the counts from the replies
-        for comment in reversed(self.comments):
-            for reply in comment.replies:
-                comment.num_children += reply.num_children
+                for index, replies in enumerate(reply_lists):
+                    if len(replies) > 1:
+                        reply_lists[index] = sort_indexes(sorted(replies))
 
-                if not (reply.is_deleted or reply.is_removed):
-                    comment.num_children += 1
+        self._set_reply_indexes(reply_lists)
+
+        for index, removed_marker in removed_markers.items():
+            self.comments[index].removed_marker = removed_marker
 
     def _build_tree(self) -> None:
-        """Build the initial tree from the flat list of Comments."""
-        for comment in self.comments:
-            if comment.parent_comment_id:
-                parent_comment = self.comments_by_id[comment.parent_comment_id]
+        """Build, sort and prune the tree, filling in the arrays of its structure."""
+        num_comments = len(self.comments)
+        parent_indexes = self._parent_indexes
+        depths = self._depths
+        flags = self._flags
+
+        # the replies are collected into separate lists while sorting and pruning, and
+        # only moved into the flat array once they're final
+        reply_lists: list[list[int]] = [[] for _ in range(num_comments)]
+        top_level_indexes = []
+
+        for index, parent_index in enumerate(parent_indexes):
+            if parent_index >= 0:
+                depths[index] = depths[parent_index] + 1
+                reply_lists[parent_index].append(index)
+            else:
+                top_level_indexes.append(index)
 
-                comment.depth = parent_comment.depth + 1
-                parent_comment.replies.append(comment)
+        # a comment should stay in the tree if it isn't deleted, or has a visible
+        # descendant (working backwards so that all replies are checked first)
+        def is_visible(index: int) -> bool:
+            """Return whether the comment at the index should stay in the tree."""
+            return not flags[index] & _IS_DELETED or bool(
+                flags[index] & _HAS_VISIBLE_DESCENDANT
+            )
 
-                # if this comment isn't deleted, work back up towards the root,
-                # indicating to all parents they have a visible descendant
-                if not comment.is_deleted:
-                    while not parent_comment.has_visible_descendant:
-                        parent_comment.has_visible_descendant = True
+        for index in reversed(range(num_comments)):
+            parent_index = parent_indexes[index]
+            if parent_index >= 0 and is_visible(index):
+                flags[parent_index] |= _HAS_VISIBLE_DESCENDANT
 
-                        if not parent_comment.parent_comment_id:
-                            break
+        # The method of building the tree already sorts it by posting time, so there's
+        # no need to sort again if that's the desired sorting. Note also that because
+        # _index_sorter() uses sorted() which is a stable sort, this means that the
+        # "secondary sort" will always be by posting time as well.
+        if top_level_indexes and self.sort != CommentTreeSortOption.POSTED:
+            with self._sorting_histogram().time():
+                sort_indexes = self._index_sorter(self.comments, self.sort)
+
+                top_level_indexes = sort_indexes(top_level_indexes)
+
+                for index in range(num_comments):
+                    # no need to bother sorting replies if none will be visible
+                    if (
+                        flags[index] & _HAS_VISIBLE_DESCENDANT
+                        and len(reply_lists[index]) > 1
+                    ):
+                        reply_lists[index] = sort_indexes(reply_lists[index])
+
+        # prune branches from the tree with no visible comments
+        self._top_level_indexes = [
+            index for index in top_level_indexes if is_visible(index)
+        ]
+        for index in range(num_comments):
+            if reply_lists[index]:
+                reply_lists[index] = [
+                    reply_index
+                    for reply_index in reply_lists[index]
+                    if is_visible(reply_index)
+                ]
+
+        self._set_reply_indexes(reply_lists)
 
-                        next_parent_id = parent_comment.parent_comment_id
-                        parent_comment = self.comments_by_id[next_parent_id]
-            else:
-                comment.depth = 0
-                self.tree.append(comment)
+        self._add_removed_markers()
+
+        # count the (visible) descendants of each comment, working backwards so that all
+        # replies will have their count done first (the parent of a comment that's
+        # still in the tree can never have been pruned)
+        num_children = self._num_children
+        for index in reversed(range(num_comments)):
+            parent_index = parent_indexes[index]
+            if parent_index < 0 or not is_visible(index):
+                continue
+
+            num_children[parent_index] += num_children[index]
+            if not flags[index] & (_IS_DELETED | _IS_REMOVED):
+                num_children[parent_index] += 1
+
+    def _set_reply_indexes(self, reply_lists: Sequence[list[int]]) -> None:
+        """Store the final lists of each comment's replies in the flat array."""
+        reply_indexes = self._reply_indexes
+        for index, replies in enumerate(reply_lists):
+            reply_indexes.extend(replies)
+            self._reply_starts[index + 1] = len(reply_indexes)
+
+    def _get_reply_indexes(self, index: int) -> list[int]:
+        """Return the indexes of the replies to the comment at the index."""
+        return self._reply_indexes[
+            self._reply_starts[index] : self._reply_starts[index + 1]
+        ]
+
+    def _set_comment_attributes(self) -> None:
+        """Set the attributes used by templates on the comments, from the arrays."""
+        comments = self.comments
+        reply_starts = self._reply_starts
+        reply_indexes = self._reply_indexes
+
+        for index, comment in enumerate(comments):
+            comment.depth = self._depths[index]
+            comment.has_visible_descendant = bool(
+                self._flags[index] & _HAS_VISIBLE_DESCENDANT
+            )
+            comment.num_children = self._num_children[index]
+            comment.replies = [
+                comments[reply_index]
+                for reply_index in reply_indexes[
+                    reply_starts[index] : reply_starts[index + 1]
+                ]
+            ]
+
+        self.tree = [comments[index] for index in self._top_level_indexes]
 
     @staticmethod
-    def _sort_tree(tree: list[Comment], sort: CommentTreeSortOption) -> list[Comment]:
-        """Sort the tree by the desired ordering (recursively).
+    def _index_sorter(
+        comments: Sequence[Comment], sort: CommentTreeSortOption
+    ) -> Callable[[list[int]], list[int]]:
+        """Return a function that sorts a list of comment indexes by the desired order.
 
-        Because Python's sorted() function is stable, the ordering of any comments that
-        compare equal on the sorting method will be the same as the order that they were
-        originally in when passed to this function.
+        The sorting key for each comment is only calculated once, the first time that
+        it's needed.
         """
+        key: Callable[[Comment], Any]
         if sort == CommentTreeSortOption.NEWEST:
-            tree = sorted(tree, key=lambda c: c.created_time, reverse=True)
+            key, reverse = attrgetter("created_time"), True
         elif sort == CommentTreeSortOption.POSTED:
-            tree = sorted(tree, key=lambda c: c.created_time)
+            key, reverse = attrgetter("created_time"), False
         elif sort == CommentTreeSortOption.VOTES:
-            tree = sorted(tree, key=lambda c: c.num_votes, reverse=True)
+            key, reverse = attrgetter("num_votes"), True
         elif sort == CommentTreeSortOption.RELEVANCE:
-            tree = sorted(tree, key=lambda c: c.relevance_sorting_value, reverse=True)
-
-        for comment in tree:
-            if not comment.has_visible_descendant:
-                # no need to bother sorting replies if none will be visible
-                continue
-
-            comment.replies = CommentTree._sort_tree(comment.replies, sort)
-
-        return tree
-
-    @staticmethod
-    def _prune_empty_branches(tree: Sequence[Comment]) -> list[Comment]:
-        """Remove branches from the tree with no visible comments."""
-        pruned_tree = []
+            key, reverse = _relevance_sorting_value, True
+        else:
+            raise ValueError(f"Unknown comment tree sort: {sort}")
 
-        for comment in tree:
-            if comment.is_deleted and not comment.has_visible_descendant:
-                # prune this branch from the tree
-                continue
+        sort_keys: dict[int, Any] = {}
 
-            # recursively prune the tree of replies to this comment
-            comment.replies = CommentTree._prune_empty_branches(comment.replies)
+        def get_sort_key(index: int) -> Any:
+            """Return the sorting key for the comment at the index (cached)."""
+            try:
+                return sort_keys[index]
+            except KeyError:
+                sort_keys[index] = key(comments[index])
+                return sort_keys[index]
 
-            pruned_tree.append(comment)
+        def sort_indexes(indexes: list[int]) -> list[int]:
+            """Return the list of indexes sorted by their comments' sorting keys."""
+            return sorted(indexes, key=get_sort_key, reverse=reverse)
 
-        return pruned_tree
+        return sort_indexes
 
     def _add_removed_markers(self) -> None:
         """Add markers to chains of removed comments with more info.
@@ -141,31 +338,69 @@ class CommentTree:
         When displaying a comment tree, these markers should be displayed to users
         that can't view the removed comment, and stop recursing down the branch.
         """
+        # counts of removed comments by user for every comment that's the top of a chain
+        # where it and all its descendants are removed
+        removed_counts: dict[int, Counter] = {}
+
         # work backwards so all replies are always processed first
-        for comment in reversed(self.comments):
-            if not comment.is_removed:
+        for index in reversed(range(len(self.comments))):
+            if not self._flags[index] & _IS_REMOVED:
                 continue
 
-            # we can only compress when all descendants are also removed - checking
-            # for this attr works because it's only added after passing this check
-            if not all(
-                hasattr(reply, "removed_comments_by_user") for reply in comment.replies
-            ):
+            # we can only compress when all descendants are also removed
+            reply_indexes = self._get_reply_indexes(index)
+            if not all(reply_index in removed_counts for reply_index in reply_indexes):
                 continue
 
-            comment.removed_comments_by_user = Counter({comment.user: 1})
+            comment = self.comments[index]
+            counts = Counter({comment.user: 1})
 
             # add all the descendants' counts onto this comment's
-            for reply in comment.replies:
-                comment.removed_comments_by_user += reply.removed_comments_by_user
+            for reply_index in reply_indexes:
+                counts += removed_counts[reply_index]
+
+            removed_counts[index] = counts
 
-            num_comments = sum(comment.removed_comments_by_user.values())
-            num_users = len(comment.removed_comments_by_user)
+            num_comments = sum(counts.values())
+            num_users = len(counts)
             if num_comments > 1:
                 comment.removed_marker = (
                     f"Removed by admin: {num_comments} comments by {num_users} users"
                 )
 
+    def get_top_level_page(
+        self, limit: int, after_comment_id: Optional[int] = None
+    ) -> list[Comment]:
+        """Return a "page" of top-level comments, in the tree's sorted order.
+
+        If after_comment_id is specified, the page will start with the top-level comment
+        after that one. Raises ValueError if that comment isn't a top-level comment in
+        the tree (which can happen if it was pruned since the last page was loaded).
+        """
+        start_index = 0
+
+        if after_comment_id:
+            for index, comment in enumerate(self.tree):
+                if comment.comment_id == after_comment_id:
+                    start_index = index + 1
+                    break
+            else:
+                raise ValueError("Comment is not a top-level comment in the tree")
+
+        return self.tree[start_index : start_index + limit]
+
+    @staticmethod
+    def iter_to_depth(branches: Sequence[Comment], max_depth: int) -> Iterator[Comment]:
+        """Iterate over all comments in the branches, down to a maximum depth."""
+        # use a stack (with everything pushed in reverse) to iterate in display order
+        stack = list(reversed(branches))
+        while stack:
+            comment = stack.pop()
+            yield comment
+
+            if comment.depth < max_depth:
+                stack.extend(reversed(comment.replies))
+
     def __iter__(self) -> Iterator[Comment]:
         """Iterate over the (top-level) Comments in the tree."""
         for comment in self.tree:
@@ -183,9 +418,9 @@ class CommentTree:
     @property
     def most_recent_comment(self) -> Optional[Comment]:
         """Return the most recent Comment in the tree (excluding deleted/removed)."""
-        for comment in reversed(self.comments):
-            if not (comment.is_deleted or comment.is_removed):
-                return comment
+        for index in reversed(range(len(self.comments))):
+            if not self._flags[index] & (_IS_DELETED | _IS_REMOVED):
+                return self.comments[index]
 
         return None
 
@@ -214,6 +449,10 @@ class CommentTree:
     def collapse_from_labels(self) -> None:
         """Collapse comments based on how they've been labeled."""
         for comment in self.comments:
+            # most comments don't have any labels, so they can be skipped right away
+            if not comment.labels:
+                continue
+
             # never affect the viewer's own comments
             if comment.user == self.viewer:
                 continue
@@ -223,12 +462,14 @@ class CommentTree:
 
     def uncollapse_new_comments(self, threshold: datetime) -> None:
         """Mark comments newer than the threshold (and parents) to stay uncollapsed."""
-        for comment in reversed(self.comments):
+        for index in reversed(range(len(self.comments))):
+            comment = self.comments[index]
+
             # as soon as we reach an old comment, we can stop
             if comment.created_time <= threshold:
                 break
 
-            if comment.is_deleted or comment.is_removed:
+            if self._flags[index] & (_IS_DELETED | _IS_REMOVED):
                 continue
 
             # don't apply to the viewer's own comments
@@ -240,17 +481,53 @@ class CommentTree:
                 comment.collapsed_state = "uncollapsed"
 
             # fetch its direct parent and uncollapse it as well
-            if comment.parent_comment_id:
-                parent_comment = self.comments_by_id[comment.parent_comment_id]
-                parent_comment.collapsed_state = "uncollapsed"
+            parent_index = self._parent_indexes[index]
+            if parent_index >= 0:
+                self.comments[parent_index].collapsed_state = "uncollapsed"
 
     def finalize_collapsing_maximized(self) -> None:
         """Finish collapsing comments, collapsing as much as possible."""
+        comments = self.comments
+
         # whether the collapsed state of each top-level comment starts out unknown
         top_unknown_initial = [comment.collapsed_state is None for comment in self.tree]
 
-        for comment in self.tree:
-            comment.recursively_collapse()
+        # find all the comments with an uncollapsed descendant in a single pass, working
+        # backwards so that all replies are processed before their parents
+        has_uncollapsed_descendant = bytearray(len(comments))
+        for index in reversed(range(len(comments))):
+            parent_index = self._parent_indexes[index]
+            if parent_index < 0:
+                continue
+
+            if (
+                has_uncollapsed_descendant[index]
+                or comments[index].collapsed_state == "uncollapsed"
+            ):
+                has_uncollapsed_descendant[parent_index] = True
+
+        stack = list(self._top_level_indexes)
+        while stack:
+            index = stack.pop()
+            comment = comments[index]
+
+            # stop processing this branch if we hit a fully-collapsed comment
+            if comment.collapsed_state == "full":
+                continue
+
+            # if it doesn't have any uncollapsed descendants, collapse the whole branch
+            # and stop looking any deeper into it
+            if not has_uncollapsed_descendant[index] and not comment.collapsed_state:
+                comment.collapsed_state = "full"
+                continue
+
+            # otherwise (does have uncollapsed descendant), collapse this comment
+            # individually if it doesn't already have another state set, then continue
+            # into all branches underneath it
+            if not comment.collapsed_state:
+                comment.collapsed_state = "individual"
+
+            stack.extend(self._get_reply_indexes(index))
 
         # if all the top-level comments end up fully collapsed,
         # uncollapse the ones we just collapsed (so we don't have a
@@ -261,78 +538,34 @@ class CommentTree:
                     comment.collapsed_state = None
 
 
-class CommentInTree(ObjectProxy):
-    # pylint: disable=abstract-method
-    """Wrapper for Comments inside a CommentTree that adds some methods/properties."""
+def _relevance_sorting_value(comment: Comment) -> tuple[int, ...]:
+    """Return the value to use for a comment with the "relevance" comment sorting.
 
-    def __init__(self, comment: Comment):
-        """Wrap a comment and add the new attributes needed by CommentTree."""
-        super().__init__(comment)
+    Returns a tuple, which allows sorting the comments into "tiers" and then still
+    supporting further sorting inside those tiers when it's useful. For example,
+    comments labeled as offtopic can be sorted below all non-offtopic comments, but
+    then still sorted by votes relative to other offtopic comments.
+    """
+    if comment.is_removed:
+        return (-100,)
 
-        self.collapsed_state: Optional[str] = None
-        self.replies: list[CommentInTree] = []
-        self.has_visible_descendant = False
-        self.num_children = 0
-        self.depth = 0
-
-    @property
-    def has_uncollapsed_descendant(self) -> bool:
-        """Recursively check if the comment has an uncollapsed descendant."""
-        for reply in self.replies:
-            if reply.collapsed_state == "uncollapsed":
-                return True
-
-            if reply.has_uncollapsed_descendant:
-                return True
-
-        return False
-
-    def recursively_collapse(self) -> None:
-        """Recursively collapse a comment and its replies as much as possible."""
-        # stop processing this branch if we hit a fully-collapsed comment
-        if self.collapsed_state == "full":
-            return
-
-        # if it doesn't have any uncollapsed descendants, collapse the whole branch
-        # and stop looking any deeper into it
-        if not self.has_uncollapsed_descendant and not self.collapsed_state:
-            self.collapsed_state = "full"
-            return
-
-        # otherwise (does have uncollapsed descendant), collapse this comment
-        # individually if it doesn't already have another state set, then recurse into
-        # all branches underneath it
-        if not self.collapsed_state:
-            self.collapsed_state = "individual"
-
-        for reply in self.replies:
-            reply.recursively_collapse()
-
-    @property
-    def relevance_sorting_value(self) -> tuple[int, ...]:
-        """Value to use for the comment with the "relevance" comment sorting method.
-
-        Returns a tuple, which allows sorting the comments into "tiers" and then still
-        supporting further sorting inside those tiers when it's useful. For example,
-        comments labeled as offtopic can be sorted below all non-offtopic comments, but
-        then still sorted by votes relative to other offtopic comments.
-        """
-        if self.is_removed:
-            return (-100,)
+    # most comments don't have any labels, so skip checking all of them individually
+    if not comment.labels:
+        return (comment.num_votes,)
 
-        if self.is_label_active("noise"):
-            return (-2, self.num_votes)
+    if comment.is_label_active("noise"):
+        return (-2, comment.num_votes)
 
-        if self.is_label_active("offtopic"):
-            return (-1, self.num_votes)
+    if comment.is_label_active("offtopic"):
+        return (-1, comment.num_votes)
 
-        if self.is_label_active("joke"):
-            return (self.num_votes // 2,)
+    if comment.is_label_active("joke"):
+        return (comment.num_votes // 2,)
 
-        # Exemplary comments add 1.0 to the the total weight of the exemplary labels,
-        # and multiply the vote count by that. For example, weight 1.0 = votes doubled.
-        if self.is_label_active("exemplary"):
-            multiplier = self.label_weights["exemplary"] + 1.0
-            return (multiplier * self.num_votes,)
+    # Exemplary comments add 1.0 to the the total weight of the exemplary labels,
+    # and multiply the vote count by that. For example, weight 1.0 = votes doubled.
+    if comment.is_label_active("exemplary"):
+        multiplier = comment.label_weights["exemplary"] + 1.0
+        return (multiplier * comment.num_votes,)
 
-        return (self.num_votes,)
+    return (comment.num_votes,)
@@ -7,10 +7,10 @@ from datetime import datetime
 from pathlib import Path, PurePath
 from typing import Optional
 
-from pygit2 import Repository, Signature
+from pygit2 import Repository
 from pyramid.security import Allow, DENY_ALL, Everyone
 from sqlalchemy import BigInteger, CheckConstraint, Column, ForeignKey, Text, TIMESTAMP
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import object_session, relationship
 from sqlalchemy.sql.expression import text
 
 from tildes.lib.auth import aces_for_permission
@@ -130,21 +130,32 @@ class GroupWikiPage(DatabaseModel):
     def markdown(self) -> Optional[str]:
         """Return the wiki page's markdown."""
         try:
-            return self.file_path.read_text().rstrip("\r\n")
+            return self.file_path.read_text(encoding="utf-8").rstrip("\r\n")
         except FileNotFoundError:
             return None
 
     @markdown.setter
     def markdown(self, new_markdown: str) -> None:
         """Write the wiki page's markdown to its file."""
-        # write the markdown to the file, appending a newline if necessary
-        if not new_markdown.endswith("\n"):
-            new_markdown = new_markdown + "\n"
+        self.file_path.write_bytes(self._file_content(new_markdown))
 
-        self.file_path.write_text(new_markdown)
+    @staticmethod
+    def _file_content(markdown: str) -> bytes:
+        """Return the content of a page's file for the markdown, as bytes."""
+        # the file should always end with a newline
+        if not markdown.endswith("\n"):
+            markdown = markdown + "\n"
+
+        return markdown.encode("utf-8")
 
     def edit(self, new_markdown: str, user: User, edit_message: str) -> None:
-        """Set the page's markdown, render its HTML, and commit the repo."""
+        """Set the page's markdown, render its HTML, and queue a commit to the repo.
+
+        The new content is stored in the repo as a blob immediately, but the commit is
+        done afterwards by the group_wiki_page_committer consumer, which is the only
+        process that writes commits. The commit is queued through the group's database
+        session, so it will only happen if the transaction is committed.
+        """
         if new_markdown == self.markdown:
             return
 
@@ -153,22 +164,34 @@ class GroupWikiPage(DatabaseModel):
         self.rendered_html = add_anchors_to_headings(self.rendered_html)
         self.last_edited_time = utc_now()
 
+        # writing a blob only adds a new object file, so it's safe to do concurrently
+        # (it's created from the new markdown instead of reading the file back, since
+        # another edit to the same page could have overwritten the file since then)
         repo = Repository(self.BASE_PATH)
-        author = Signature(user.username, user.username)
-
-        repo.index.read()
-        repo.index.add(str(self.file_path.relative_to(self.BASE_PATH)))
-        repo.index.write()
+        blob_id = repo.create_blob(self._file_content(new_markdown))
 
         # Prepend the group name and page path to the edit message - if you change the
         # format of this, make sure to also change the page-editing template to match
         edit_message = f"~{self.group.path}/{self.path}: {edit_message}"
 
-        repo.create_commit(
-            repo.head.name,
-            author,
-            author,
-            edit_message,
-            repo.index.write_tree(),
-            [repo.head.target],
+        # use the function that the triggers use, since this is the same as an event
+        # from a trigger (it's only sent if the transaction is committed), but the
+        # message and author aren't stored anywhere that a trigger could get them from
+        object_session(self.group).execute(
+            text("SELECT add_to_event_stream(:stream_name_pieces, :fields)"),
+            {
+                "stream_name_pieces": ["group_wiki_pages", "edit"],
+                "fields": [
+                    "file_path",
+                    self.relative_path.as_posix(),
+                    "blob_id",
+                    str(blob_id),
+                    "author_name",
+                    user.username,
+                    "message",
+                    edit_message,
+                    "edit_time",
+                    str(int(self.last_edited_time.timestamp())),
+                ],
+            },
         )
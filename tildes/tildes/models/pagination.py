@@ -9,9 +9,10 @@ from itertools import chain
 from typing import Any, Optional, TypeVar
 
 from pyramid.request import Request
-from sqlalchemy import Column, func, inspect
+from sqlalchemy import Column, func, inspect, literal
 
 from tildes.lib.id import id36_to_id, id_to_id36
+from tildes.lib.pagination_cursor import CURSOR_SIGNER, PaginationCursor
 
 from .model_query import ModelQuery
 
@@ -33,6 +34,9 @@ class PaginatedQuery(ModelQuery):
         self.after_id: Optional[int] = None
         self.before_id: Optional[int] = None
 
+        self.after_cursor: Optional[PaginationCursor] = None
+        self.before_cursor: Optional[PaginationCursor] = None
+
         self._anchor_table = model_cls.__table__
 
     def __iter__(self) -> Iterator[ModelType]:
@@ -85,7 +89,12 @@ class PaginatedQuery(ModelQuery):
         first result from the query will have the *lowest* created_time, so should be
         the last item displayed. Because of this, the results need to be reversed.
         """
-        return bool(self.before_id)
+        return bool(self.before_id or self.before_cursor)
+
+    @property
+    def is_after(self) -> bool:
+        """Return whether the query is restricted to results after an anchor item."""
+        return bool(self.after_id or self.after_cursor)
 
     def anchor_type(self, anchor_type: str) -> PaginatedQuery:
         """Set the type of the "anchor" (before/after item) (generative)."""
@@ -94,9 +103,33 @@ class PaginatedQuery(ModelQuery):
 
         return self
 
+    def after_anchor(self, anchor: str) -> PaginatedQuery:
+        """Restrict the query to results after a cursor or id36 (generative)."""
+        if not CURSOR_SIGNER.is_cursor(anchor):
+            return self.after_id36(anchor)
+
+        if self.is_reversed:
+            raise ValueError("Can't set both before and after restrictions")
+
+        self.after_cursor = self._decode_cursor(anchor)
+
+        return self
+
+    def before_anchor(self, anchor: str) -> PaginatedQuery:
+        """Restrict the query to results before a cursor or id36 (generative)."""
+        if not CURSOR_SIGNER.is_cursor(anchor):
+            return self.before_id36(anchor)
+
+        if self.is_after:
+            raise ValueError("Can't set both before and after restrictions")
+
+        self.before_cursor = self._decode_cursor(anchor)
+
+        return self
+
     def after_id36(self, id36: str) -> PaginatedQuery:
         """Restrict the query to results after an id36 (generative)."""
-        if self.before_id:
+        if self.is_reversed:
             raise ValueError("Can't set both before and after restrictions")
 
         self.after_id = id36_to_id(id36)
@@ -105,47 +138,83 @@ class PaginatedQuery(ModelQuery):
 
     def before_id36(self, id36: str) -> PaginatedQuery:
         """Restrict the query to results before an id36 (generative)."""
-        if self.after_id:
+        if self.is_after:
             raise ValueError("Can't set both before and after restrictions")
 
         self.before_id = id36_to_id(id36)
 
         return self
 
+    def _decode_cursor(self, encoded_cursor: str) -> PaginationCursor:
+        """Decode a cursor, and set the anchor type to the type of its anchor item."""
+        cursor = CURSOR_SIGNER.decode(encoded_cursor)
+
+        anchor_table = self.model_cls.metadata.tables.get(cursor.anchor_table)
+        if anchor_table is None:
+            raise ValueError("Invalid cursor anchor type")
+
+        self._anchor_table = anchor_table
+
+        return cursor
+
     def _apply_before_or_after(self) -> PaginatedQuery:
         """Apply the "before" or "after" restrictions if necessary."""
         # pylint: disable=assignment-from-no-return
-        if not (self.after_id or self.before_id):
+        if not (self.is_after or self.is_reversed):
             return self
 
         query = self
 
-        # determine the ID of the "anchor item" that we're using as an upper or lower
-        # bound, and which type of bound it is
-        if self.after_id:
+        # determine the "anchor item" that we're using as an upper or lower bound, and
+        # which type of bound it is
+        if self.is_after:
             anchor_id = self.after_id
+            cursor = self.after_cursor
 
             # since we're looking for other items "after" the anchor item, it will act
             # as an upper bound when the sort order is descending, otherwise it's a
             # lower bound
             is_anchor_upper_bound = self.sort_desc
-        elif self.before_id:
+        else:
             anchor_id = self.before_id
+            cursor = self.before_cursor
 
             # opposite of "after" behavior - when looking "before" the anchor item, it's
             # an upper bound if the sort order is *ascending*
             is_anchor_upper_bound = not self.sort_desc
 
-        subquery = self._anchor_subquery(anchor_id)
+        # a cursor already has the anchor item's values to compare against, as long as
+        # it's for the same sort (it won't be if the listing's order has changed, such
+        # as a url being shared with someone using a different default order)
+        if cursor and cursor.sort_column == self._sort_column.name:
+            anchor_values = self._cursor_values(cursor)
+        else:
+            if cursor:
+                anchor_id = cursor.anchor_id
+
+            anchor_values = self._anchor_subquery(anchor_id)
 
         # restrict the results to items on the right "side" of the anchor item
         if is_anchor_upper_bound:
-            query = query.filter(func.row(*self.sorting_columns) < subquery)
+            query = query.filter(func.row(*self.sorting_columns) < anchor_values)
         else:
-            query = query.filter(func.row(*self.sorting_columns) > subquery)
+            query = query.filter(func.row(*self.sorting_columns) > anchor_values)
 
         return query
 
+    def _cursor_values(self, cursor: PaginationCursor) -> Any:
+        """Return a row of comparison values for the cursor's anchor item."""
+        values = [cursor.sort_value]
+        if self.is_anchor_same_type:
+            values.append(cursor.anchor_id)
+
+        return func.row(
+            *[
+                literal(value, column.type)
+                for column, value in zip(self.sorting_columns, values)
+            ]
+        )
+
     def _anchor_subquery(self, anchor_id: int) -> Any:
         """Return a subquery to get comparison values for the anchor item."""
         if len(self._anchor_table.primary_key) > 1:
@@ -205,8 +274,8 @@ class PaginatedResults:
 
         # if the query had `before` or `after` restrictions, there must be a page in
         # that direction (it's where we came from)
-        self.has_next_page = bool(query.before_id)
-        self.has_prev_page = bool(query.after_id)
+        self.has_next_page = query.is_reversed
+        self.has_prev_page = query.is_after
 
         # fetch the results - try to get one more than we're actually going to display,
         # so that we know if there's another page
@@ -242,22 +311,48 @@ class PaginatedResults:
         return len(self.results)
 
     @property
-    def next_page_after_id36(self) -> str:
-        """Return "after" ID36 that should be used to fetch the next page."""
+    def next_page_after(self) -> str:
+        """Return "after" anchor that should be used to fetch the next page."""
         if not self.has_next_page:
             raise AttributeError
 
-        next_id = inspect(self.results[-1]).identity[0]
-        return id_to_id36(next_id)
+        return self._anchor_for_result(self.results[-1])
 
     @property
-    def prev_page_before_id36(self) -> str:
-        """Return "before" ID36 that should be used to fetch the prev page."""
+    def prev_page_before(self) -> str:
+        """Return "before" anchor that should be used to fetch the prev page."""
         if not self.has_prev_page:
             raise AttributeError
 
-        prev_id = inspect(self.results[0]).identity[0]
-        return id_to_id36(prev_id)
+        return self._anchor_for_result(self.results[0])
+
+    @property
+    def _sort_column_name(self) -> str:
+        """Return the name of the column that the results are sorted by."""
+        # pylint: disable=protected-access
+        return self.query._sort_column.name
+
+    def _anchor_for_result(self, result: Any) -> str:
+        """Return the anchor (a cursor, or ID36 as a fallback) to page from a result.
+
+        Cursors can only be used if the result has its own value for the sort column.
+        """
+        anchor_id = inspect(result).identity[0]
+
+        if not (
+            CURSOR_SIGNER.can_encode
+            and self._sort_column_name in result.__table__.columns
+        ):
+            return id_to_id36(anchor_id)
+
+        cursor = PaginationCursor(
+            anchor_table=result.__table__.name,
+            sort_column=self._sort_column_name,
+            sort_value=getattr(result, self._sort_column_name),
+            anchor_id=anchor_id,
+        )
+
+        return CURSOR_SIGNER.encode(cursor)
 
 
 class MixedPaginatedResults(PaginatedResults):
@@ -266,12 +361,12 @@ class MixedPaginatedResults(PaginatedResults):
     def __init__(self, paginated_results: Sequence[PaginatedResults]):
         # pylint: disable=super-init-not-called,protected-access
         """Merge all the supplied results into a single one."""
-        sort_column_name = paginated_results[0].query._sort_column.name
-        if any(
-            r.query._sort_column.name != sort_column_name for r in paginated_results
-        ):
+        sort_column_name = paginated_results[0]._sort_column_name
+        if any(r._sort_column_name != sort_column_name for r in paginated_results):
             raise ValueError("All results must by sorted by the same column.")
 
+        self.sort_column_name = sort_column_name
+
         reverse_sort = paginated_results[0].query.sort_desc
         if any(r.query.sort_desc != reverse_sort for r in paginated_results):
             raise ValueError("All results must by sorted in the same direction.")
@@ -301,17 +396,19 @@ class MixedPaginatedResults(PaginatedResults):
                 self.has_next_page = True
 
     @property
-    def next_page_after_id36(self) -> str:
-        """Return "after" ID36 that should be used to fetch the next page."""
-        next_id36 = super().next_page_after_id36
-        type_char = self.results[-1].__class__.__name__.lower()[0]
+    def _sort_column_name(self) -> str:
+        """Return the name of the column that the results are sorted by."""
+        return self.sort_column_name
 
-        return f"{type_char}-{next_id36}"
+    def _anchor_for_result(self, result: Any) -> str:
+        """Return the anchor to page from a result, including the type if needed.
 
-    @property
-    def prev_page_before_id36(self) -> str:
-        """Return "before" ID36 that should be used to fetch the prev page."""
-        prev_id36 = super().prev_page_before_id36
-        type_char = self.results[0].__class__.__name__.lower()[0]
+        Cursors include the anchor item's type, but ID36s need to be prefixed with it.
+        """
+        anchor = super()._anchor_for_result(result)
+        if CURSOR_SIGNER.is_cursor(anchor):
+            return anchor
+
+        type_char = result.__class__.__name__.lower()[0]
 
-        return f"{type_char}-{prev_id36}"
+        return f"{type_char}-{anchor}"
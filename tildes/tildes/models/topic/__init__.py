@@ -3,7 +3,8 @@
 from .topic import EDIT_GRACE_PERIOD, Topic, VOTING_PERIOD
 from .topic_bookmark import TopicBookmark
 from .topic_ignore import TopicIgnore
+from .topic_last_visit import REPEAT_VISIT_GRACE_PERIOD, TopicLastVisit
+from .topic_listing_index import TopicListingIndex
 from .topic_query import TopicQuery
 from .topic_schedule import TopicSchedule
-from .topic_visit import TopicVisit
 from .topic_vote import TopicVote
@@ -68,6 +68,9 @@ class Topic(DatabaseModel):
           updates to is_deleted in comments.
         - last_activity_time will be updated by insertions, deletions, and updates to
           is_deleted in comments.
+        - comments_version will be incremented by insertions, deletions, and updates to
+          is_deleted or is_removed in comments, as well as insertions and deletions in
+          comment_labels. Votes don't affect it (see CommentTree._load_snapshot()).
       Outgoing:
         - Inserting rows or updating is_deleted/is_removed to change visibility will
           update topic_schedule.latest_topic_id if the topic has a schedule_id.
@@ -128,6 +131,7 @@ class Topic(DatabaseModel):
     )
     num_comments: int = Column(Integer, nullable=False, server_default="0")
     num_votes: int = Column(Integer, nullable=False, server_default="0")
+    comments_version: int = Column(Integer, nullable=False, server_default="0")
     _is_voting_closed: bool = Column(
         "is_voting_closed", Boolean, nullable=False, server_default="false", index=True
     )
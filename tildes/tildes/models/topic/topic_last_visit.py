@@ -1,9 +1,9 @@
 # Copyright (c) 2018 Tildes contributors <code@tildes.net>
 # SPDX-License-Identifier: AGPL-3.0-or-later
 
-"""Contains the TopicVisit class."""
+"""Contains the TopicLastVisit class."""
 
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from sqlalchemy import BigInteger, Column, ForeignKey, Integer, TIMESTAMP
 from sqlalchemy.orm import relationship
@@ -15,18 +15,28 @@ from tildes.models.user import User
 from .topic import Topic
 
 
-class TopicVisit(DatabaseModel):
-    """Model for a user's visits to a topic.
+# visits to a topic this soon after the previous one aren't recorded, so that reloading
+# the page doesn't reset which comments are marked as new
+REPEAT_VISIT_GRACE_PERIOD = timedelta(seconds=30)
+
+
+class TopicLastVisit(DatabaseModel):
+    """Model for a user's most recent visit to a topic.
+
+    There is only a single row for each user and topic, which is updated ("upserted")
+    on each visit, so that listings can join directly on the primary key.
 
     Trigger behavior:
       Incoming:
-        - num_comments will be incremented for the author's topic visit when they post a
+        - num_comments will be incremented for the author's visit when they post a
           comment in that topic.
         - num_comments will be decremented when a comment is deleted, for all visits to
           the topic that were after it was posted.
+        - num_comments will be incremented when a user marks a notification for a
+          comment in the topic as read, if their visit was before it was posted.
     """
 
-    __tablename__ = "topic_visits"
+    __tablename__ = "topic_last_visits"
 
     user_id: int = Column(
         BigInteger, ForeignKey("users.user_id"), nullable=False, primary_key=True
@@ -37,7 +47,7 @@ class TopicVisit(DatabaseModel):
     visit_time: datetime = Column(
         TIMESTAMP(timezone=True),
         nullable=False,
-        primary_key=True,
+        index=True,
         server_default=text("NOW()"),
     )
     num_comments: int = Column(Integer, nullable=False)
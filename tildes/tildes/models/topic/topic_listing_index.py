@@ -0,0 +1,172 @@
+# Copyright (c) 2021 Tildes contributors <code@tildes.net>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+"""Contains the TopicListingIndex class."""
+
+from collections.abc import Collection, Sequence
+from heapq import nlargest
+from itertools import chain
+from typing import Optional
+
+from redis import Redis
+from sqlalchemy.orm import Session
+
+from tildes.enums import TopicSortOption
+from tildes.models.group import Group
+
+from .topic import Topic
+
+
+class TopicListingIndex:
+    """Sorted sets in Redis of each group's topics, for building listings quickly.
+
+    For each group and indexed sort option, a sorted set holds the IDs of all the
+    group's (non-deleted, non-removed) topics, scored by the sort column's timestamp.
+    The sets are kept up to date by the topic_listing_indexer consumer.
+
+    The index is only used to find "candidate" topics for a listing: the topics are
+    still fetched from the database (by primary key) with all of the listing's usual
+    filters applied, so a topic being in the index incorrectly (such as a deleted one
+    that hasn't been removed yet) can't result in it being displayed.
+    """
+
+    KEY_PREFIX = "topic_listing:"
+
+    # set once the index has been completely built, and removed while it's rebuilt
+    READY_KEY = f"{KEY_PREFIX}ready"
+
+    SORT_COLUMNS = {
+        TopicSortOption.ACTIVITY: Topic.last_interesting_activity_time,
+        TopicSortOption.NEW: Topic.created_time,
+    }
+
+    def __init__(self, redis: Redis):
+        """Create an interface to the index, stored in a Redis server."""
+        self.redis = redis
+
+    @classmethod
+    def is_sort_indexed(cls, sort: TopicSortOption) -> bool:
+        """Return whether there is an index for a sort option."""
+        return sort in cls.SORT_COLUMNS
+
+    def is_ready(self) -> bool:
+        """Return whether the index has been built and can be used."""
+        return bool(self.redis.exists(self.READY_KEY))
+
+    @classmethod
+    def _get_key(cls, group_id: int, sort: TopicSortOption) -> str:
+        """Return the key of the sorted set for a group and sort option."""
+        return f"{cls.KEY_PREFIX}{group_id}:{sort.name.lower()}"
+
+    def get_candidate_ids(
+        self,
+        group_ids: Sequence[int],
+        sort: TopicSortOption,
+        max_score: Optional[float],
+        count: int,
+    ) -> tuple[list[int], bool]:
+        """Return the IDs of the top topics from a set of groups, and if that's all.
+
+        Up to count topic IDs will be returned, in descending order of their sort
+        scores, and only including topics with a score of max_score or lower (if set).
+        The second value returned is whether the groups have no other topics at all
+        (with a score in range), so that the candidates are every possible topic.
+        """
+        max_arg = max_score if max_score is not None else "+inf"
+
+        pipeline = self.redis.pipeline(transaction=False)
+        for group_id in group_ids:
+            pipeline.zrevrangebyscore(
+                self._get_key(group_id, sort),
+                max_arg,
+                "-inf",
+                start=0,
+                num=count,
+                withscores=True,
+            )
+        group_results = pipeline.execute()
+
+        # if any group had at least the requested number of topics, there may be more
+        is_complete = all(len(result) < count for result in group_results)
+
+        all_topics = list(chain.from_iterable(group_results))
+        if len(all_topics) > count:
+            is_complete = False
+
+        top_topics = nlargest(count, all_topics, key=lambda topic: topic[1])
+
+        return [int(topic_id) for topic_id, _ in top_topics], is_complete
+
+    def update_topics(self, db_session: Session, topic_ids: Collection[int]) -> None:
+        """Update the index entries for topics to match their current data.
+
+        The topics are removed from every group's sets (since they may have been moved
+        between groups), and then added back to their current group's sets if they
+        still exist and are visible.
+        """
+        if not topic_ids:
+            return
+
+        group_ids = [group_id for (group_id,) in db_session.query(Group.group_id)]
+
+        topics = (
+            db_session.query(
+                Topic.topic_id,
+                Topic.group_id,
+                Topic.is_deleted,
+                Topic.is_removed,
+                *self.SORT_COLUMNS.values(),
+            )
+            .filter(Topic.topic_id.in_(topic_ids))  # type: ignore
+            .all()
+        )
+
+        # use a transaction so that listings never see a topic missing from all groups
+        pipeline = self.redis.pipeline(transaction=True)
+
+        for sort in self.SORT_COLUMNS:
+            for group_id in group_ids:
+                pipeline.zrem(self._get_key(group_id, sort), *topic_ids)
+
+        for topic in topics:
+            if not (topic.is_deleted or topic.is_removed):
+                self._add_topic(pipeline, topic)
+
+        pipeline.execute()
+
+    def rebuild(self, db_session: Session, batch_size: int = 5000) -> None:
+        """Rebuild the entire index from the database.
+
+        The index is marked as not ready during the rebuild, so listings won't use it
+        until it's finished.
+        """
+        self.redis.delete(self.READY_KEY)
+
+        for key in self.redis.scan_iter(match=f"{self.KEY_PREFIX}*"):
+            self.redis.delete(key)
+
+        topics = (
+            db_session.query(
+                Topic.topic_id, Topic.group_id, *self.SORT_COLUMNS.values()
+            )
+            .filter(Topic.is_deleted == False, Topic.is_removed == False)  # noqa
+            .yield_per(batch_size)
+        )
+
+        pipeline = self.redis.pipeline(transaction=False)
+        for num_added, topic in enumerate(topics, start=1):
+            self._add_topic(pipeline, topic)
+
+            if num_added % batch_size == 0:
+                pipeline.execute()
+
+        pipeline.set(self.READY_KEY, 1)
+        pipeline.execute()
+
+    def _add_topic(self, pipeline: Redis, topic: Topic) -> None:
+        """Add a topic (a result row with the sort columns) to its group's sets."""
+        for sort, column in self.SORT_COLUMNS.items():
+            score = getattr(topic, column.name).timestamp()
+            pipeline.zadd(
+                self._get_key(topic.group_id, sort), {str(topic.topic_id): score}
+            )
@@ -4,12 +4,14 @@
 """Contains the TopicQuery class."""
 
 from __future__ import annotations
-from collections.abc import Sequence
+from collections.abc import Iterator, Sequence
 from typing import Any
 
 from pyramid.request import Request
-from sqlalchemy import func
-from sqlalchemy.sql.expression import and_, desc, label, text
+from sqlalchemy import BigInteger, cast, func
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm.query import Query
+from sqlalchemy.sql.expression import and_, any_, exists, label
 
 from tildes.enums import TopicSortOption
 from tildes.lib.datetime import SimpleHoursPeriod, utc_now
@@ -19,7 +21,7 @@ from tildes.models.pagination import PaginatedQuery
 from .topic import Topic
 from .topic_bookmark import TopicBookmark
 from .topic_ignore import TopicIgnore
-from .topic_visit import TopicVisit
+from .topic_last_visit import TopicLastVisit
 from .topic_vote import TopicVote
 
 
@@ -39,12 +41,45 @@ class TopicQuery(PaginatedQuery):
         self._only_bookmarked = False
         self._only_ignored = False
         self._only_user_voted = False
+        self._batch_user_data = False
 
         self.filter_ignored = False
 
+    def __iter__(self) -> Iterator[Topic]:
+        """Iterate over the topics, fetching the user's data for them if needed."""
+        if not self._is_user_data_batched:
+            return super().__iter__()
+
+        topics = list(super().__iter__())
+
+        if topics:
+            user_data = {
+                row.topic_id: row
+                for row in self._user_data_query([topic.topic_id for topic in topics])
+            }
+            for topic in topics:
+                self._merge_user_data(topic, user_data[topic.topic_id])
+
+        return iter(topics)
+
+    @property
+    def _is_user_data_batched(self) -> bool:
+        """Return whether the user's data will be fetched in a separate query.
+
+        The restrictions to only topics that the user has bookmarked, ignored or voted
+        on need to join the user's data to filter the topics, so this can't be done
+        when any of them are used.
+        """
+        if not (self._batch_user_data and self.request.user):
+            return False
+
+        return not (
+            self._only_bookmarked or self._only_ignored or self._only_user_voted
+        )
+
     def _attach_extra_data(self) -> TopicQuery:
         """Attach the extra user data to the query."""
-        if not self.request.user:
+        if not self.request.user or self._is_user_data_batched:
             return self
 
         # pylint: disable=protected-access
@@ -61,10 +96,62 @@ class TopicQuery(PaginatedQuery):
         self = super()._finalize()
 
         if self.filter_ignored and self.request.user:
-            self = self.filter(TopicIgnore.topic_id == None)  # noqa
+            if self._is_user_data_batched:
+                self = self.filter(
+                    ~exists().where(
+                        and_(
+                            TopicIgnore.topic_id == Topic.topic_id,
+                            TopicIgnore.user == self.request.user,
+                        )
+                    )
+                )
+            else:
+                self = self.filter(TopicIgnore.topic_id == None)  # noqa
 
         return self
 
+    def _user_data_query(self, topic_ids: Sequence[int]) -> Query:
+        """Return a query for the user's data for specific topics.
+
+        This fetches the same data that _attach_extra_data() joins onto the query, but
+        for a known set of topics, so that it can be done with primary key lookups.
+        """
+        user = self.request.user
+
+        return (
+            self.request.db_session.query(
+                Topic.topic_id,
+                label("voted_time", TopicVote.created_time),
+                label("bookmarked_time", TopicBookmark.created_time),
+                label("ignored_time", TopicIgnore.created_time),
+                label("visit_time", TopicLastVisit.visit_time),
+                label("num_comments", TopicLastVisit.num_comments),
+            )
+            .outerjoin(
+                TopicVote,
+                and_(TopicVote.topic_id == Topic.topic_id, TopicVote.user == user),
+            )
+            .outerjoin(
+                TopicBookmark,
+                and_(
+                    TopicBookmark.topic_id == Topic.topic_id,
+                    TopicBookmark.user == user,
+                ),
+            )
+            .outerjoin(
+                TopicIgnore,
+                and_(TopicIgnore.topic_id == Topic.topic_id, TopicIgnore.user == user),
+            )
+            .outerjoin(
+                TopicLastVisit,
+                and_(
+                    TopicLastVisit.topic_id == Topic.topic_id,
+                    TopicLastVisit.user == user,
+                ),
+            )
+            .filter(Topic.topic_id == any_(cast(topic_ids, ARRAY(BigInteger))))
+        )
+
     def _attach_vote_data(self) -> TopicQuery:
         """Join the data related to whether the user has voted on the topic."""
         query = self.join(
@@ -95,26 +182,17 @@ class TopicQuery(PaginatedQuery):
 
     def _attach_visit_data(self) -> TopicQuery:
         """Join the data related to the user's last visit to the topic(s)."""
-        # subquery using LATERAL to select only the newest visit for each topic
-        lateral_subquery = (
-            self.request.db_session.query(
-                TopicVisit.visit_time, TopicVisit.num_comments
-            )
-            .filter(
-                TopicVisit.topic_id == Topic.topic_id,
-                TopicVisit.user == self.request.user,
-            )
-            .order_by(desc(TopicVisit.visit_time))
-            .limit(1)
-            .correlate(Topic)
-            .subquery()
-            .lateral()
+        query = self.outerjoin(
+            TopicLastVisit,
+            and_(
+                TopicLastVisit.topic_id == Topic.topic_id,
+                TopicLastVisit.user == self.request.user,
+            ),
+        )
+        query = query.add_columns(
+            label("visit_time", TopicLastVisit.visit_time),
+            label("num_comments", TopicLastVisit.num_comments),
         )
-
-        # join on "true" since the subquery already restricts to the row we want
-        query = self.outerjoin(lateral_subquery, text("true"))
-
-        query = query.add_columns(lateral_subquery)
 
         return query
 
@@ -145,20 +223,24 @@ class TopicQuery(PaginatedQuery):
             topic.user_ignored = False
         else:
             topic = result.Topic
+            TopicQuery._merge_user_data(topic, result)
 
-            topic.user_voted = bool(result.voted_time)
-            topic.user_bookmarked = bool(result.bookmarked_time)
-            topic.user_ignored = bool(result.ignored_time)
+        return topic
 
-            topic.last_visit_time = result.visit_time
+    @staticmethod
+    def _merge_user_data(topic: Topic, user_data: Any) -> None:
+        """Merge a row of the user's data for a topic onto it."""
+        topic.user_voted = bool(user_data.voted_time)
+        topic.user_bookmarked = bool(user_data.bookmarked_time)
+        topic.user_ignored = bool(user_data.ignored_time)
 
-            topic.comments_since_last_visit = None
-            if result.num_comments is not None:
-                new_comments = topic.num_comments - result.num_comments
-                # prevent showing negative "new comments" due to deletions
-                topic.comments_since_last_visit = max(new_comments, 0)
+        topic.last_visit_time = user_data.visit_time
 
-        return topic
+        topic.comments_since_last_visit = None
+        if user_data.num_comments is not None:
+            new_comments = topic.num_comments - user_data.num_comments
+            # prevent showing negative "new comments" due to deletions
+            topic.comments_since_last_visit = max(new_comments, 0)
 
     def apply_sort_option(
         self, sort: TopicSortOption, is_desc: bool = True
@@ -242,6 +324,17 @@ class TopicQuery(PaginatedQuery):
 
         return self
 
+    def batch_user_data(self) -> TopicQuery:
+        """Fetch the user's data for the topics in a separate query (generative).
+
+        Joining the user's data onto a listing query can prevent Postgres from simply
+        scanning the keyset pagination index, so this fetches only the topics first, and
+        then all of the user's data for them in a single extra query.
+        """
+        self._batch_user_data = True
+
+        return self
+
     def exclude_ignored(self) -> TopicQuery:
         """Specify that ignored topics should be excluded (generative)."""
         self.filter_ignored = True
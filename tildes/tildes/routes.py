@@ -144,6 +144,11 @@ def add_intercooler_routes(config: Configurator) -> None:
     add_ic_route("topic", "/topics/{topic_id36}", factory=topic_by_id36)
     with config.route_prefix_context("/topics/{topic_id36}"):
         add_ic_route("topic_comments", "/comments", factory=topic_by_id36)
+        add_ic_route(
+            "topic_comment_subtree",
+            "/comments/{comment_id36}/subtree",
+            factory=topic_by_id36,
+        )
         add_ic_route("topic_group", "/group", factory=topic_by_id36)
         add_ic_route("topic_link", "/link", factory=topic_by_id36)
         add_ic_route("topic_lock", "/lock", factory=topic_by_id36)
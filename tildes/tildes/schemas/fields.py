@@ -15,6 +15,7 @@ from marshmallow.validate import Length, OneOf, Regexp
 
 from tildes.lib.datetime import SimpleHoursPeriod
 from tildes.lib.id import ID36_REGEX
+from tildes.lib.pagination_cursor import CURSOR_SIGNER
 from tildes.lib.string import simplify_string
 
 
@@ -64,6 +65,30 @@ class ID36(String):
         super().__init__(validate=Regexp(ID36_REGEX), **kwargs)
 
 
+class PaginationAnchor(String):
+    """Field for a pagination anchor - either a signed cursor or a base-36 ID."""
+
+    def _deserialize(
+        self,
+        value: str,
+        attr: Optional[str],
+        data: DataType,
+        **kwargs: Any,
+    ) -> str:
+        """Deserialize the anchor, checking that it's a valid cursor or ID36."""
+        value = super()._deserialize(value, attr, data, **kwargs)
+
+        if CURSOR_SIGNER.is_cursor(value):
+            try:
+                CURSOR_SIGNER.decode(value)
+            except ValueError as exc:
+                raise ValidationError("Invalid cursor") from exc
+        elif not ID36_REGEX.match(value):
+            raise ValidationError("Invalid ID36")
+
+        return value
+
+
 class ShortTimePeriod(Field):
     """Field for short time period strings like "4h" and "2d".
 
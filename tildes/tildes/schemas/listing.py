@@ -10,14 +10,21 @@ from marshmallow.fields import Boolean, Integer
 from marshmallow.validate import Range
 
 from tildes.enums import TopicSortOption
-from tildes.schemas.fields import Enum, ID36, Ltree, PostType, ShortTimePeriod
+from tildes.lib.pagination_cursor import CURSOR_SIGNER
+from tildes.schemas.fields import (
+    Enum,
+    Ltree,
+    PaginationAnchor,
+    PostType,
+    ShortTimePeriod,
+)
 
 
 class PaginatedListingSchema(Schema):
     """Marshmallow schema to validate arguments for a paginated listing page."""
 
-    after = ID36(missing=None)
-    before = ID36(missing=None)
+    after = PaginationAnchor(missing=None)
+    before = PaginationAnchor(missing=None)
     per_page = Integer(validate=Range(min=1, max=100), missing=50)
 
     @validates_schema
@@ -70,7 +77,8 @@ class MixedListingSchema(PaginatedListingSchema):
         """Set the anchor_type if before or after has a special value indicating type.
 
         For example, if after or before looks like "t-123" that means it is referring
-        to the topic with ID36 "123". "c-123" also works, for comments.
+        to the topic with ID36 "123". "c-123" also works, for comments. Cursors are
+        left alone, since they already include the type.
         """
         # pylint: disable=unused-argument
         new_data = data.copy()
@@ -79,7 +87,7 @@ class MixedListingSchema(PaginatedListingSchema):
 
         for key in keys:
             value = new_data.get(key)
-            if not value:
+            if not value or CURSOR_SIGNER.is_cursor(value):
                 continue
 
             type_char, _, id36 = value.partition("-")
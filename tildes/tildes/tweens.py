@@ -4,14 +4,19 @@
 """Contains Pyramid "tweens", used to insert additional logic into request-handling."""
 
 from collections.abc import Callable
+from datetime import timedelta
 from time import time
 
 from prometheus_client import Histogram
 from pyramid.config import Configurator
+from pyramid.interfaces import IRoutesMapper
 from pyramid.registry import Registry
 from pyramid.request import Request
 from pyramid.response import Response
 
+from tildes.lib.page_cache import CachedPage, PageCache
+from tildes.metrics import incr_counter
+
 
 def http_method_tween_factory(handler: Callable, registry: Registry) -> Callable:
     # pylint: disable=unused-argument
@@ -66,6 +71,82 @@ def metrics_tween_factory(handler: Callable, registry: Registry) -> Callable:
     return metrics_tween
 
 
+def page_cache_tween_factory(handler: Callable, registry: Registry) -> Callable:
+    """Return a tween function that caches pages for logged-out visitors.
+
+    The cache is only enabled if the tildes.page_cache_seconds setting is set.
+    """
+    ttl_seconds = int(registry.settings.get("tildes.page_cache_seconds", 0))
+    if not ttl_seconds:
+        return handler
+
+    ttl = timedelta(seconds=ttl_seconds)
+    session_cookie_name = registry.settings.get("redis.sessions.cookie_name", "session")
+
+    def page_cache_tween(request: Request) -> Response:
+        """Serve the page from the cache if possible, or cache it if it's eligible.
+
+        Only GET requests from visitors without a session cookie are eligible, since
+        they can't be logged in. Responses are only cached if they were successful and
+        didn't set any cookies (which would mean the page was specific to the visitor).
+        """
+        if request.method.upper() != "GET" or session_cookie_name in request.cookies:
+            return handler(request)
+
+        # the router hasn't run yet, so the route needs to be matched here
+        route_info = registry.getUtility(IRoutesMapper)(request)
+        route = route_info["route"]
+        if not route or not PageCache.is_route_cached(route.name):
+            return handler(request)
+
+        matchdict = route_info["match"]
+
+        page_cache = PageCache(request.redis, ttl)
+        cache_key = PageCache.get_key(
+            route.name, matchdict, request.GET.items(), request.cookies.get("theme")
+        )
+        page, generation = page_cache.lookup(cache_key, route.name, matchdict)
+
+        if page:
+            # set these the same way the router would, for the metrics tween
+            request.matched_route = route
+            request.matchdict = matchdict
+
+            incr_counter("page_cache", route=route.name, result="hit")
+
+            response = Response(body=page.body)
+            response.headers["Content-Type"] = page.content_type
+            return response
+
+        def store_page(request: Request, response: Response) -> None:
+            """Store the response in the cache if it's eligible."""
+            # pylint: disable=unused-argument
+            if (
+                generation is not None
+                and response.status_code == 200
+                and "Set-Cookie" not in response.headers
+            ):
+                page_cache.set(
+                    cache_key,
+                    generation,
+                    CachedPage(response.headers["Content-Type"], response.body),
+                )
+                incr_counter("page_cache", route=route.name, result="miss")
+            else:
+                incr_counter("page_cache", route=route.name, result="uncacheable")
+
+        response = handler(request)
+
+        # cookies (such as the session one) are set by response callbacks after all the
+        # tweens have finished, so the page has to be stored from a callback as well
+        # (added last, so it runs after all the others)
+        request.add_response_callback(store_page)
+
+        return response
+
+    return page_cache_tween
+
+
 def theme_cookie_tween_factory(handler: Callable, registry: Registry) -> Callable:
     # pylint: disable=unused-argument
     """Return a tween function that sets the theme cookie."""
@@ -110,4 +191,5 @@ def includeme(config: Configurator) -> None:
     """Attach Tildes tweens to the Pyramid config."""
     config.add_tween("tildes.tweens.http_method_tween_factory")
     config.add_tween("tildes.tweens.metrics_tween_factory")
+    config.add_tween("tildes.tweens.page_cache_tween_factory")
     config.add_tween("tildes.tweens.theme_cookie_tween_factory")
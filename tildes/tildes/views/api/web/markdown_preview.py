@@ -5,9 +5,9 @@
 
 from pyramid.request import Request
 
-from tildes.lib.markdown import convert_markdown_to_safe_html
+from tildes.lib.markdown import render_markdown_preview
 from tildes.schemas.group_wiki_page import GroupWikiPageSchema
-from tildes.views.decorators import ic_view_config, use_kwargs
+from tildes.views.decorators import ic_view_config, rate_limit_view, use_kwargs
 
 
 @ic_view_config(
@@ -17,9 +17,10 @@ from tildes.views.decorators import ic_view_config, use_kwargs
 )
 # uses GroupWikiPageSchema because it should always have the highest max_length
 @use_kwargs(GroupWikiPageSchema(only=("markdown",)), location="form")
+@rate_limit_view("markdown_preview")
 def markdown_preview(request: Request, markdown: str) -> dict:
     """Render the provided text as Markdown."""
     # pylint: disable=unused-argument
 
-    rendered_html = convert_markdown_to_safe_html(markdown)
+    rendered_html = render_markdown_preview(markdown)
     return {"rendered_html": rendered_html}
@@ -3,21 +3,32 @@
 
 """Web API endpoints related to topics."""
 
+from typing import Optional
+
 from marshmallow import ValidationError
-from marshmallow.fields import String
+from marshmallow.fields import Integer, String
 from pyramid.httpexceptions import HTTPNotFound
 from pyramid.request import Request
 from pyramid.response import Response
 from sqlalchemy.exc import IntegrityError
 
-from tildes.enums import LogEventType
+from tildes.enums import CommentTreeSortOption, LogEventType
+from tildes.lib.datetime import utc_from_timestamp
+from tildes.lib.id import id36_to_id
 from tildes.models.group import Group
 from tildes.models.log import LogTopic
 from tildes.models.topic import Topic, TopicBookmark, TopicIgnore, TopicVote
+from tildes.schemas.fields import Enum
 from tildes.schemas.group import GroupSchema
 from tildes.schemas.topic import TopicSchema
 from tildes.views import IC_NOOP
 from tildes.views.decorators import ic_view_config, use_kwargs
+from tildes.views.topic import (
+    get_lazy_comment_tree_page,
+    get_topic_comment_tree,
+    LAZY_COMMENT_TREE_MAX_DEPTH,
+    load_rendered_html,
+)
 
 
 @ic_view_config(
@@ -73,6 +84,103 @@ def delete_topic(request: Request) -> Response:
     return response
 
 
+@ic_view_config(
+    route_name="topic_comments",
+    request_method="GET",
+    renderer="comment_tree_branches.jinja2",
+    permission="view",
+)
+@use_kwargs(
+    {
+        "comment_order": Enum(CommentTreeSortOption, required=True),
+        "after": String(required=True),
+        "last_visit": Integer(missing=None),
+    }
+)
+def get_topic_comments(
+    request: Request,
+    comment_order: CommentTreeSortOption,
+    after: str,
+    last_visit: Optional[int],
+) -> dict:
+    """Get the next page of top-level comment branches with Intercooler.
+
+    The last_visit timestamp is the user's last visit time when the topic page was
+    originally loaded, so that the same comments will be treated as new.
+    """
+    topic = request.context
+    last_visit_time = utc_from_timestamp(last_visit) if last_visit else None
+
+    tree = get_topic_comment_tree(
+        request, topic, comment_order, last_visit_time, defer_rendered_html=True
+    )
+
+    try:
+        branches = get_lazy_comment_tree_page(request, tree, after)
+    except ValueError as exc:
+        raise HTTPNotFound("Comment not found (or it was deleted)") from exc
+
+    if branches and branches[-1] is not tree.tree[-1]:
+        more_comments_after = branches[-1].comment_id36
+    else:
+        more_comments_after = None
+
+    return {
+        "topic": topic,
+        "comments": branches,
+        "comment_order": comment_order,
+        "mark_newer_than": last_visit_time,
+        "max_depth": LAZY_COMMENT_TREE_MAX_DEPTH,
+        "more_comments_after": more_comments_after,
+    }
+
+
+@ic_view_config(
+    route_name="topic_comment_subtree",
+    request_method="GET",
+    renderer="comment_tree_branches.jinja2",
+    permission="view",
+)
+@use_kwargs(
+    {
+        "comment_order": Enum(CommentTreeSortOption, required=True),
+        "last_visit": Integer(missing=None),
+    }
+)
+def get_topic_comment_subtree(
+    request: Request, comment_order: CommentTreeSortOption, last_visit: Optional[int]
+) -> dict:
+    """Get the replies to a comment in a lazily-loaded comment tree with Intercooler."""
+    topic = request.context
+    last_visit_time = utc_from_timestamp(last_visit) if last_visit else None
+
+    try:
+        comment_id = id36_to_id(request.matchdict["comment_id36"])
+    except ValueError as exc:
+        raise HTTPNotFound from exc
+
+    tree = get_topic_comment_tree(
+        request, topic, comment_order, last_visit_time, defer_rendered_html=True
+    )
+
+    try:
+        parent_comment = tree.comments_by_id[comment_id]
+    except KeyError as exc:
+        raise HTTPNotFound("Comment not found (or it was deleted)") from exc
+
+    max_depth = parent_comment.depth + LAZY_COMMENT_TREE_MAX_DEPTH
+    load_rendered_html(request, tree.iter_to_depth(parent_comment.replies, max_depth))
+
+    return {
+        "topic": topic,
+        "comments": parent_comment.replies,
+        "comment_order": comment_order,
+        "mark_newer_than": last_visit_time,
+        "max_depth": max_depth,
+        "more_comments_after": None,
+    }
+
+
 @ic_view_config(
     route_name="topic_vote",
     request_method="PUT",
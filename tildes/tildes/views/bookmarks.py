@@ -43,10 +43,10 @@ def get_bookmarks(
     )
 
     if before:
-        query = query.before_id36(before)
+        query = query.before_anchor(before)
 
     if after:
-        query = query.after_id36(after)
+        query = query.after_anchor(after)
 
     query = query.join_all_relationships()
 
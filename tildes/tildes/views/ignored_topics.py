@@ -26,10 +26,10 @@ def get_ignored_topics(
     query = request.query(Topic).only_ignored().order_by(desc(TopicIgnore.created_time))
 
     if before:
-        query = query.before_id36(before)
+        query = query.before_anchor(before)
 
     if after:
-        query = query.after_id36(after)
+        query = query.after_anchor(after)
 
     query = query.join_all_relationships()
 
@@ -55,10 +55,10 @@ def get_user_notifications(
     )
 
     if before:
-        query = query.before_id36(before)
+        query = query.before_anchor(before)
 
     if after:
-        query = query.after_id36(after)
+        query = query.after_anchor(after)
 
     notifications = query.get_page(per_page)
 
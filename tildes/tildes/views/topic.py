@@ -3,8 +3,10 @@
 
 """Views related to posting/viewing topics and comments on them."""
 
+import json
 from collections import namedtuple
-from datetime import timedelta
+from collections.abc import Iterable, Sequence
+from datetime import datetime, timedelta
 from difflib import SequenceMatcher
 from typing import Any, Optional, Union
 
@@ -15,10 +17,12 @@ from pyramid.renderers import render_to_response
 from pyramid.request import Request
 from pyramid.response import Response
 from pyramid.view import view_config
-from sqlalchemy import cast
-from sqlalchemy.orm import joinedload
+from sqlalchemy import cast, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import defer, joinedload, undefer
 from sqlalchemy.sql.expression import any_, desc
 from sqlalchemy_utils import Ltree
+from zope.sqlalchemy import mark_changed
 
 from tildes.enums import (
     CommentLabelOption,
@@ -29,10 +33,20 @@ from tildes.enums import (
 )
 from tildes.lib.database import TagList
 from tildes.lib.datetime import SimpleHoursPeriod, utc_now
+from tildes.lib.id import id36_to_id
+from tildes.metrics import incr_counter
 from tildes.models.comment import Comment, CommentNotification, CommentTree
 from tildes.models.group import Group, GroupWikiPage
 from tildes.models.log import LogComment, LogTopic
-from tildes.models.topic import Topic, TopicSchedule, TopicVisit
+from tildes.models.pagination import PaginatedResults
+from tildes.models.topic import (
+    REPEAT_VISIT_GRACE_PERIOD,
+    Topic,
+    TopicLastVisit,
+    TopicListingIndex,
+    TopicQuery,
+    TopicSchedule,
+)
 from tildes.models.user import UserGroupSettings
 from tildes.schemas.comment import CommentSchema
 from tildes.schemas.fields import Enum, ShortTimePeriod
@@ -44,6 +58,24 @@ from tildes.views.financials import get_financial_data
 
 DefaultSettings = namedtuple("DefaultSettings", ["order", "period"])
 
+# how many more candidate topics than the page size to fetch from the listing index, so
+# that a page can still be filled when some candidates are filtered out (such as by
+# ignored topics or filtered tags)
+LISTING_INDEX_EXTRA_CANDIDATES = 50
+
+# how long to keep cached comment tree snapshots (they're also invalidated by any change
+# to the topic's comments, so this mostly just lets inactive topics drop out of redis)
+COMMENT_TREE_CACHE_TTL = timedelta(days=1)
+
+# topics with more comments than this only render part of their comment tree in the
+# initial response, and the rest of it is loaded on demand with Intercooler
+LAZY_COMMENT_TREE_MIN_COMMENTS = 500
+
+# how many top-level comments to render at once in a lazily-loaded comment tree, and how
+# many levels of replies to render underneath each of them
+LAZY_COMMENT_TREE_PAGE_SIZE = 50
+LAZY_COMMENT_TREE_MAX_DEPTH = 5
+
 
 @view_config(route_name="group_topics", request_method="POST", permission="topic.post")
 @use_kwargs(TopicSchema(only=("title", "markdown", "link")), location="form")
@@ -157,7 +189,7 @@ def get_group_topics(  # noqa
     rank_start: Optional[int],
     tag: Optional[Ltree],
     unfiltered: bool,
-    **kwargs: Any
+    **kwargs: Any,
 ) -> dict:
     """Get a listing of topics in the group."""
     # period needs special treatment so we can distinguish between missing and None
@@ -209,6 +241,7 @@ def get_group_topics(  # noqa
         .join_all_relationships()
         .inside_groups(groups, include_subgroups=not is_home_page)
         .exclude_ignored()
+        .batch_user_data()
         .apply_sort_option(order)
     )
 
@@ -222,10 +255,10 @@ def get_group_topics(  # noqa
 
     # apply before/after pagination restrictions if relevant
     if before:
-        query = query.before_id36(before)
+        query = query.before_anchor(before)
 
     if after:
-        query = query.after_id36(after)
+        query = query.after_anchor(after)
 
     # apply topic tag filters unless they're disabled
     if request.user and request.user.filtered_topic_tags and not unfiltered:
@@ -246,7 +279,16 @@ def get_group_topics(  # noqa
             )
         )
 
-    topics = query.get_page(per_page)
+    topics = None
+
+    # the home page's default listings can usually be built from the listing index
+    if is_home_page and not (period or tag or before):
+        topics = _get_topics_from_listing_index(
+            request, query, groups, order, after, per_page
+        )
+
+    if topics is None:
+        topics = query.get_page(per_page)
 
     period_options = [SimpleHoursPeriod(hours) for hours in (1, 12, 24, 72, 168)]
 
@@ -325,6 +367,73 @@ def get_group_topics(  # noqa
     }
 
 
+def _get_topics_from_listing_index(
+    request: Request,
+    query: TopicQuery,
+    groups: Sequence[Group],
+    order: TopicSortOption,
+    after: Optional[str],
+    per_page: int,
+) -> Optional[PaginatedResults]:
+    """Return a page of topics using the listing index, or None if it can't be used.
+
+    The index provides the IDs of the top candidate topics from all of the groups, and
+    the page is then fetched from only those candidates with the normal query (so all
+    of its other filters still apply). That page is only used if it's guaranteed to
+    match what the full query would return: either it had enough topics to fill the
+    page, or there were no topics in the groups other than the candidates.
+    """
+    if not TopicListingIndex.is_sort_indexed(order):
+        return None
+
+    index = TopicListingIndex(request.redis)
+    if not index.is_ready():
+        incr_counter("topic_listing_index", result="unavailable")
+        return None
+
+    max_score = None
+    if after:
+        sort_column = TopicListingIndex.SORT_COLUMNS[order]
+
+        # a cursor for this sort already has the anchor topic's value
+        cursor = query.after_cursor
+        if cursor and cursor.sort_column == sort_column.name:
+            anchor_value = cursor.sort_value
+        else:
+            anchor_id = cursor.anchor_id if cursor else id36_to_id(after)
+            anchor_value = (
+                request.db_session.query(sort_column)
+                .filter(Topic.topic_id == anchor_id)
+                .scalar()
+            )
+
+        if not anchor_value:
+            return None
+
+        max_score = anchor_value.timestamp()
+
+    candidate_ids, is_complete = index.get_candidate_ids(
+        [group.group_id for group in groups],
+        order,
+        max_score,
+        per_page + 1 + LISTING_INDEX_EXTRA_CANDIDATES,
+    )
+
+    if not candidate_ids:
+        return None
+
+    topics = query.filter(Topic.topic_id.in_(candidate_ids)).get_page(  # type: ignore
+        per_page
+    )
+
+    if topics.has_next_page or is_complete:
+        incr_counter("topic_listing_index", result="hit")
+        return topics
+
+    incr_counter("topic_listing_index", result="fallback")
+    return None
+
+
 @view_config(route_name="search", renderer="search.jinja2")
 @view_config(route_name="group_search", renderer="search.jinja2")
 @use_kwargs(TopicListingSchema(only=("after", "before", "order", "per_page", "period")))
@@ -336,7 +445,7 @@ def get_search(
     before: Optional[str],
     per_page: int,
     search: str,
-    **kwargs: Any
+    **kwargs: Any,
 ) -> dict:
     """Get a list of search results."""
     # period needs special treatment so we can distinguish between missing and None
@@ -356,6 +465,7 @@ def get_search(
         request.query(Topic)
         .join_all_relationships()
         .search(search)
+        .batch_user_data()
         .apply_sort_option(order)
     )
 
@@ -369,10 +479,10 @@ def get_search(
 
     # apply before/after pagination restrictions if relevant
     if before:
-        query = query.before_id36(before)
+        query = query.before_anchor(before)
 
     if after:
-        query = query.after_id36(after)
+        query = query.after_anchor(after)
 
     topics = query.get_page(per_page)
 
@@ -417,17 +527,22 @@ def get_topic(request: Request, comment_order: CommentTreeSortOption) -> dict:
         else:
             comment_order = CommentTreeSortOption.RELEVANCE
 
-    # deleted and removed comments need to be included since they're necessary for
-    # building the tree if they have replies
-    comments = (
-        request.query(Comment)
-        .include_deleted()
-        .include_removed()
-        .filter(Comment.topic == topic)
-        .order_by(Comment.created_time)
-        .all()
+    is_lazy_tree = topic.num_comments > LAZY_COMMENT_TREE_MIN_COMMENTS
+
+    tree = get_topic_comment_tree(
+        request,
+        topic,
+        comment_order,
+        topic.last_visit_time,
+        defer_rendered_html=is_lazy_tree,
     )
-    tree = CommentTree(comments, comment_order, request.user)
+
+    if is_lazy_tree:
+        comment_branches = get_lazy_comment_tree_page(request, tree)
+        comment_tree_max_depth: Optional[int] = LAZY_COMMENT_TREE_MAX_DEPTH
+    else:
+        comment_branches = tree.tree
+        comment_tree_max_depth = None
 
     # check for link information (content metadata) to display
     if topic.is_link_type:
@@ -463,28 +578,174 @@ def get_topic(request: Request, comment_order: CommentTreeSortOption) -> dict:
         .all()
     )
 
-    tree.collapse_from_labels()
-
     if request.user:
-        request.db_session.add(TopicVisit(request.user, topic))
+        _record_topic_visit(request, topic)
 
-        # collapse old comments if the user has a previous visit to the topic
-        # (and doesn't have that behavior disabled)
-        if topic.last_visit_time and request.user.collapse_old_comments:
-            tree.uncollapse_new_comments(topic.last_visit_time)
-            tree.finalize_collapsing_maximized()
+    # if there are more top-level comments than the ones being rendered, the next page
+    # will be loaded starting after the last one
+    if len(comment_branches) < len(tree.tree):
+        more_comments_after = comment_branches[-1].comment_id36
+    else:
+        more_comments_after = None
 
     return {
         "topic": topic,
         "content_metadata": content_metadata,
         "log": log,
         "comments": tree,
+        "comment_branches": comment_branches,
+        "comment_tree_max_depth": comment_tree_max_depth,
+        "more_comments_after": more_comments_after,
         "comment_order": comment_order,
         "comment_order_options": CommentTreeSortOption,
         "comment_label_options": CommentLabelOption,
     }
 
 
+def _record_topic_visit(request: Request, topic: Topic) -> None:
+    """Record the user's visit to a topic, replacing their previous one.
+
+    The previous visit is kept if it was within REPEAT_VISIT_GRACE_PERIOD.
+    """
+    table = TopicLastVisit.__table__
+    statement = (
+        insert(table)
+        .values(
+            user_id=request.user.user_id,
+            topic_id=topic.topic_id,
+            num_comments=topic.num_comments,
+        )
+        .on_conflict_do_update(
+            constraint=table.primary_key,
+            set_={"visit_time": func.now(), "num_comments": topic.num_comments},
+            where=(table.c.visit_time < func.now() - REPEAT_VISIT_GRACE_PERIOD),
+        )
+    )
+    request.db_session.execute(statement)
+    mark_changed(request.db_session)
+
+
+def get_topic_comment_tree(
+    request: Request,
+    topic: Topic,
+    comment_order: CommentTreeSortOption,
+    last_visit_time: Optional[datetime],
+    defer_rendered_html: bool = False,
+) -> CommentTree:
+    """Return the full CommentTree for a topic, with collapsing applied.
+
+    If defer_rendered_html is True, the comments' rendered_html won't be loaded by the
+    initial query, so it should be loaded with load_rendered_html() for any comments
+    that are going to be displayed.
+    """
+    # deleted and removed comments need to be included since they're necessary for
+    # building the tree if they have replies
+    query = (
+        request.query(Comment)
+        .include_deleted()
+        .include_removed()
+        .filter(Comment.topic == topic)
+        .order_by(Comment.created_time)
+    )
+
+    if defer_rendered_html:
+        query = query.options(defer(Comment.rendered_html))
+
+    tree = _get_comment_tree(request, topic, query.all(), comment_order)
+
+    tree.collapse_from_labels()
+
+    # collapse old comments if the user has a previous visit to the topic
+    # (and doesn't have that behavior disabled)
+    if request.user and last_visit_time and request.user.collapse_old_comments:
+        tree.uncollapse_new_comments(last_visit_time)
+        tree.finalize_collapsing_maximized()
+
+    return tree
+
+
+def get_lazy_comment_tree_page(
+    request: Request, tree: CommentTree, after_comment_id36: Optional[str] = None
+) -> list[Comment]:
+    """Return the next page of top-level comments to display in a lazy comment tree.
+
+    The rendered_html will also be loaded for all the comments that will be displayed
+    from the page, down to the maximum depth.
+    """
+    after_comment_id = id36_to_id(after_comment_id36) if after_comment_id36 else None
+
+    branches = tree.get_top_level_page(LAZY_COMMENT_TREE_PAGE_SIZE, after_comment_id)
+    load_rendered_html(
+        request, CommentTree.iter_to_depth(branches, LAZY_COMMENT_TREE_MAX_DEPTH)
+    )
+
+    return branches
+
+
+def load_rendered_html(request: Request, comments: Iterable[Comment]) -> None:
+    """Load the rendered_html for comments that were queried with it deferred.
+
+    This is done in a single query, instead of letting each comment load its own
+    rendered_html individually when it's accessed while rendering the template.
+    """
+    comment_ids = [comment.comment_id for comment in comments]
+    if not comment_ids:
+        return
+
+    # the rows don't need to be used, loading them will populate the deferred column on
+    # the Comment objects that are already in the session
+    (
+        request.db_session.query(Comment)
+        .filter(Comment.comment_id.in_(comment_ids))
+        .options(undefer(Comment.rendered_html))
+        .all()
+    )
+
+
+def _get_comment_tree(
+    request: Request,
+    topic: Topic,
+    comments: list[Comment],
+    comment_order: CommentTreeSortOption,
+) -> CommentTree:
+    """Return the CommentTree for a topic, using a cached snapshot if possible.
+
+    The cache key includes the topic's comments_version, which is incremented by
+    triggers whenever its comments change in a way that affects the tree's structure,
+    so any cached snapshots for older versions will just be ignored (and expire
+    eventually). Votes don't change the version, so snapshots for sorts that use votes
+    are re-sorted with the current vote counts when they're loaded.
+    """
+    cache_key = (
+        f"comment_tree:{topic.topic_id}:{topic.comments_version}:{comment_order.name}"
+    )
+
+    cached_snapshot = request.redis.get(cache_key)
+    if cached_snapshot:
+        try:
+            tree = CommentTree(
+                comments,
+                comment_order,
+                request.user,
+                snapshot=json.loads(cached_snapshot),
+            )
+            incr_counter("comment_tree_cache", result="hit")
+            return tree
+        except ValueError:
+            pass
+
+    incr_counter("comment_tree_cache", result="miss")
+
+    tree = CommentTree(comments, comment_order, request.user)
+
+    if tree.comments:
+        request.redis.setex(
+            cache_key, COMMENT_TREE_CACHE_TTL, json.dumps(tree.get_snapshot())
+        )
+
+    return tree
+
+
 @view_config(route_name="topic", request_method="POST", permission="comment")
 @use_kwargs(CommentSchema(only=("markdown",)), location="form")
 @rate_limit_view("comment_post")
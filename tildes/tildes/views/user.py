@@ -187,10 +187,10 @@ def _get_user_posts(
             query = query.anchor_type(anchor_type)
 
         if before:
-            query = query.before_id36(before)
+            query = query.before_anchor(before)
 
         if after:
-            query = query.after_id36(after)
+            query = query.after_anchor(after)
 
         if order:
             query = query.apply_sort_option(order)